@@ -5,9 +5,13 @@ from .api_makerspace import (AllLocationResource, AllZonesResource, ZoneResource
 	PersonTrainedEquipmentResource, MembershipTypeMapResource, PersonResource, PersonRbacResource,
 	EquipmentPhotoResource, PersonContractResource, PersonAvatarPicResource, PersonPhotoResource,
 	EquipmentHistoryRecordResource, EquipmentResource, FormResource, PersonFormResource,
-	BillingEventTypeResource, PersonBillingLogResource, PersonBilling)
+	BillingEventTypeResource, PersonBillingLogResource, PersonBillingResource, PersonImportResource,
+	EquipmentPhotoDownloadResource, PersonContractDownloadResource, PersonAvatarPicDownloadResource,
+	PersonPhotoDownloadResource, DonorDocumentDownloadResource)
 from .api_chore import (ChoreHistoryResource, ChoreOwnershipResource, ChoreResource)
-from .api_cardaccess import (DoorAccessLogResource, KeyCardResource, KeyCodeResource)
+from .api_batch import BatchResource
+from .api_cardaccess import (DoorAccessLogResource, DoorAccessLogHistoryResource, DoorAccessLogBatchResource, DoorAccessLogStreamResource, VolunteerHoursReportResource,
+	DoorTrafficReportResource, CardAuthorizationResource, AuthorizedPersonsResource, ControllerSyncResource, OccupancyResource, KeyCardResource, KeyCodeResource)
 
 api = Api()
 
@@ -21,25 +25,41 @@ api.add_resource(PersonMembershipResource, f'{prefix}/person_membership', f'{pre
 api.add_resource(ContractTypeMapResource, f'{prefix}/contract_type_map', f'{prefix}/contract_type_map/<int:type_id>')
 api.add_resource(PersonTrainedEquipmentResource, f'{prefix}/person_allowed_equipment', f'{prefix}/person_allowed_equipment/<int:person_id>/<int:equipment_id>')
 api.add_resource(MembershipTypeMapResource, f'{prefix}/membership_type_map', f'{prefix}/membership_type_map/<int:type_id>')
-api.add_resource(PersonResource, f'{prefix}/person', f'{prefix}/person/<int:person_id>')
+api.add_resource(PersonResource, f'{prefix}/person', f'{prefix}/person/<int:object_id>')
+api.add_resource(PersonImportResource, f'{prefix}/person/import')
 api.add_resource(PersonRbacResource, f'{prefix}/person_rbac', f'{prefix}/person_rbac/<int:person_id>')
 api.add_resource(ChoreResource, f'{prefix}/chore', f'{prefix}/chore/<int:chore_id>')
 api.add_resource(ChoreOwnershipResource, f'{prefix}/chore_ownership', f'{prefix}/chore_ownership/<int:chore_id>')
 api.add_resource(ChoreHistoryResource, f'{prefix}/chore_history', f'{prefix}/chore_history/<int:history_id>')
 api.add_resource(DoorAccessLogResource, f'{prefix}/access/door_access_log', f'{prefix}/access/door_access_log/<int:log_id>')
+api.add_resource(DoorAccessLogHistoryResource, f'{prefix}/access/door_access_log/history')
+api.add_resource(DoorAccessLogBatchResource, f'{prefix}/access/door_access_log/batch')
+api.add_resource(DoorAccessLogStreamResource, f'{prefix}/access/door_access_log/stream')
+api.add_resource(VolunteerHoursReportResource, f'{prefix}/access/volunteer_hours')
+api.add_resource(DoorTrafficReportResource, f'{prefix}/access/traffic')
+api.add_resource(CardAuthorizationResource, f'{prefix}/access/authorize')
+api.add_resource(AuthorizedPersonsResource, f'{prefix}/access/authorized_persons')
+api.add_resource(ControllerSyncResource, f'{prefix}/access/controller/<int:controller_id>/sync')
+api.add_resource(OccupancyResource, f'{prefix}/access/occupancy', f'{prefix}/access/occupancy/<int:location_id>')
 api.add_resource(KeyCardResource, f'{prefix}/access/cardid', f'{prefix}/access/cardid/<int:card_id>')
 api.add_resource(KeyCodeResource, f'{prefix}/access/keycode', f'{prefix}/access/keycode/<int:code_id>')
 api.add_resource(EquipmentPhotoResource, f'{prefix}/equipment_photo', f'{prefix}/equipment_photo/<int:photo_id>')
 api.add_resource(PersonContractResource, f'{prefix}/person_contract', f'{prefix}/person_contract/<int:contract_id>')
 api.add_resource(PersonAvatarPicResource, f'{prefix}/person_avatar', f'{prefix}/person_avatar/<int:avatar_id>')
 api.add_resource(PersonPhotoResource, f'{prefix}/person_photo', f'{prefix}/person_photo/<int:photo_id>')
+api.add_resource(EquipmentPhotoDownloadResource, f'{prefix}/equipment_photo/<int:file_id>/download')
+api.add_resource(PersonContractDownloadResource, f'{prefix}/person_contract/<int:file_id>/download')
+api.add_resource(PersonAvatarPicDownloadResource, f'{prefix}/person_avatar/<int:file_id>/download')
+api.add_resource(PersonPhotoDownloadResource, f'{prefix}/person_photo/<int:file_id>/download')
+api.add_resource(DonorDocumentDownloadResource, f'{prefix}/donor_document/<int:file_id>/download')
 api.add_resource(EquipmentHistoryRecordResource, f'{prefix}/equipment_history', f'{prefix}/equipment_history/<int:record_id>')
 api.add_resource(EquipmentResource, f'{prefix}/equipment', f'{prefix}/equipment/<int:equipment_id>')
 api.add_resource(FormResource, f'{prefix}/form', f'{prefix}/form/<int:form_id>')
 api.add_resource(PersonFormResource, f'{prefix}/person_form', f'{prefix}/person_form/<int:person_form_id>')
 api.add_resource(BillingEventTypeResource, f'{prefix}/billing_event_type', f'{prefix}/billing_event_type/<int:event_type_id>')
 api.add_resource(PersonBillingLogResource, f'{prefix}/person_billing_log', f'{prefix}/person_billing_log/<int:billing_log_id>')
-api.add_resource(PersonBilling, f'{prefix}/person_billing', f'{prefix}/person_billing/<int:person_billing_id>')
+api.add_resource(PersonBillingResource, f'{prefix}/person_billing', f'{prefix}/person_billing/<int:person_billing_id>')
+api.add_resource(BatchResource, f'{prefix}/batch')
 
 # Examples
 # api.add_resource(AllPersonsResource, '/persons/all')
@@ -0,0 +1,120 @@
+from flask_restful import Resource
+from flask import current_app, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from urllib.parse import urlsplit
+from models.crm import RootModel, rollback_hooks
+
+BATCH_MAX_OPERATIONS = 100
+BATCH_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+BATCH_PATH_PREFIX = '/v1/api/'
+
+def resolve_refs(value, refs):
+    """
+    replace '$name' strings, anywhere in an operation body, with the id the earlier operation tagged ref=name
+    created, any other string, '$' prefixed or not, is a plain value and left as it is
+    """
+    if isinstance(value, str) and value.startswith('$') and value[1:] in refs:
+        return refs[value[1:]]
+    if isinstance(value, dict):
+        return {key: resolve_refs(item, refs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_refs(item, refs) for item in value]
+    return value
+
+def resolve_path_refs(path, refs):
+    """
+    replace '$name' path segments the same way, raises KeyError for a name no earlier operation defined
+    """
+    parts = urlsplit(path)
+    segments = [str(refs[segment[1:]]) if segment.startswith('$') else segment for segment in parts.path.split('/')]
+    return '/'.join(segments) + (f'?{parts.query}' if parts.query else '')
+
+def created_id(body):
+    """
+    the id an operation's response reports, 'id' or its only '*_id' key
+    """
+    if not isinstance(body, dict):
+        return None
+    if 'id' in body:
+        return body['id']
+    ids = [value for key, value in body.items() if key.endswith('_id')]
+    return ids[0] if len(ids) == 1 else None
+
+class BatchResource(Resource):
+    """
+    runs an ordered list of write operations against the other API resources in one transaction
+
+    body: {"operations": [{"method": "POST", "path": "/v1/api/person", "body": {...}, "ref": "member"},
+                          {"method": "POST", "path": "/v1/api/person_rbac", "body": {"person_id": "$member", ...}}]}
+    an operation tagged with ref can be referred to by later operations as "$ref" in their body or as a path
+    segment, it stands for the id the operation created. body strings not naming an earlier ref are left alone. the first operation answering with an error status
+    rolls the whole batch back
+    """
+    def post(self):
+        data = request.get_json(silent=True)
+        operations = data.get('operations') if isinstance(data, dict) else data
+        if not isinstance(operations, list) or not operations:
+            return {'error': 'Expected a non-empty list of operations'}, 400
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return {'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}, 400
+
+        results = []
+        refs = {}
+        failed = None
+        try:
+            with RootModel._meta.database.atomic() as transaction:
+                for index, operation in enumerate(operations):
+                    status, body = self.run_operation(operation, refs)
+                    results.append({'index': index, 'status': status, 'body': body})
+                    if status >= 400:
+                        failed = index
+                        transaction.rollback()
+                        break
+                    if isinstance(operation, dict) and operation.get('ref'):
+                        refs[operation['ref']] = created_id(body)
+        except Exception:
+            self.rolled_back()
+            raise
+
+        if failed is not None:
+            self.rolled_back()
+            return {'committed': False, 'failed_index': failed, 'results': results}, results[failed]['status']
+        return {'committed': True, 'results': results}, 200
+
+    @staticmethod
+    def rolled_back():
+        for hook in rollback_hooks:
+            hook()
+
+    def run_operation(self, operation, refs):
+        """
+        dispatch one operation to the resource its path routes to, returns (status, response body)
+        """
+        if not isinstance(operation, dict):
+            return 400, {'error': 'Expected an operation object'}
+        method = str(operation.get('method', '')).upper()
+        if method not in BATCH_METHODS:
+            return 400, {'error': f'method must be one of {list(BATCH_METHODS)}'}
+        try:
+            path = resolve_path_refs(str(operation.get('path', '')), refs)
+            body = resolve_refs(operation.get('body'), refs)
+        except KeyError as e:
+            return 400, {'error': f'Unknown reference ${e.args[0]}'}
+        if not path.startswith(BATCH_PATH_PREFIX) or urlsplit(path).path == request.path:
+            return 400, {'error': f'path must be an API path under {BATCH_PATH_PREFIX}'}
+
+        try:
+            endpoint, view_args = current_app.url_map.bind('').match(urlsplit(path).path, method=method)
+        except HTTPException as e:
+            return e.code, {'error': e.description}
+        environ = EnvironBuilder(path=path, method=method, json=body).get_environ()
+        with current_app.request_context(environ):
+            try:
+                response = current_app.make_response(current_app.view_functions[endpoint](**view_args))
+            except HTTPException as e:
+                # flask-restful puts its JSON error (e.g. reqparse's {'message': {field: reason}}) on e.data,
+                # the bare HTTPException response only has werkzeug's html page
+                body = getattr(e, 'data', None)
+                return e.code, body if body is not None else {'error': e.description}
+        return response.status_code, response.get_json(silent=True)
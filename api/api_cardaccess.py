@@ -1,14 +1,78 @@
 from flask_restful import Resource, reqparse
-from models.crm.makerspace import (Person)
-from models.crm.cardaccess import (KEY_CARD_TYPES, DoorProfiles, PersonDoorCredentialProfile, DoorAccessLog, KeyCard, KeyCode)
+from models.crm.makerspace import (Person, Location)
+from models.crm.cardaccess import (KEY_CARD_TYPES, SYNC_KINDS, Controller, DoorProfiles, PersonDoorCredentialProfile, DoorAccessLog,
+    KeyCard, KeyCode, ingest_door_access_logs, calculate_all_volunteer_hours)
+from models.crm.cardauth import card_authorization_index
+from models.crm.controllersync import compute_delta, acknowledge_delta
+from models.crm.occupancy import occupancy_tracker
+from models.crm.trafficrollup import door_traffic
+from models.crm.archivereader import select_access_logs
+from helpers.apihelper import (parse_with_parser, collection_response, instance_validators, conditional_response, parse_fields,
+    select_columns, encode_cursor, decode_cursor, cursor_value, LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT)
+from helpers.serializehelper import serializer_for
+from helpers.queryhelper import expected_repeats
+from helpers.datehelper import validate_date_time_format
 
-from peewee import DoesNotExist
-from flask import jsonify
+from peewee import DoesNotExist, DatabaseError, chunked
+from flask import jsonify, request
 from peewee import IntegrityError
+from werkzeug.exceptions import ClientDisconnected
 import datetime
+import io
+import json
 
+def door_access_row(args):
+    """
+    map parsed DoorAccessLogResource arguments onto DoorAccessLog columns
+    """
+    return {
+        'log_sha1': args['log_sha1'],
+        'event_dt': args['event_dt'],
+        'card_number': args['card_number'],
+        'event_type': args['event_type'],
+        'event_type_id': args['event_type_id'],
+        'event_reason': args['event_reason'],
+        'door': args['door'],
+        'controller': args['controller'],
+        'access_granted': args['access_granted'],
+        'person': args['person_id'],
+    }
+
+def build_door_access_rows(events):
+    """
+    validate a list of events with the DoorAccessLogResource parser rules and check every person in one query
+
+    returns (rows, errors), both keyed by the position of the event in the list
+    """
+    parsed, errors = {}, {}
+    for index, event in enumerate(events):
+        args, error = parse_with_parser(DoorAccessLogResource.parser, event)
+        if error:
+            errors[index] = error
+        elif not validate_date_time_format(args['event_dt']):
+            errors[index] = "event_dt must be formatted as 'YYYY-MM-DD HH:MM:SS'"
+        else:
+            parsed[index] = args
+
+    person_ids = {args['person_id'] for args in parsed.values()}
+    known_person_ids = set()
+    if person_ids:
+        known_person_ids = {person_id for (person_id,) in Person.select(Person.id).where(Person.id.in_(person_ids)).tuples()}
+
+    rows = {}
+    for index, args in parsed.items():
+        if args['person_id'] in known_person_ids:
+            rows[index] = door_access_row(args)
+        else:
+            errors[index] = 'Person not found'
+    return rows, errors
+
+
+# DoorAccessLog as the controller poller reports it, without the bookkeeping columns
+DOOR_ACCESS_LOG_EXCLUDE = ('created_dt', 'updated_dt', 'is_deleted', 'is_hidden')
 
 class DoorAccessLogResource(Resource):
+    includes = {'person': DoorAccessLog.person}
     parser = reqparse.RequestParser()
     parser.add_argument('log_sha1', type=str, required=True)
     parser.add_argument('event_dt', type=str, required=True)  # Format as 'YYYY-MM-DD HH:MM:SS'
@@ -22,45 +86,39 @@ class DoorAccessLogResource(Resource):
     parser.add_argument('person_id', type=int, required=True)
     
 
-    def get(self, log_id):
+    def get(self, log_id=None):
+        if log_id is None:
+            # e.g. ?sort=-event_dt&event_dt__gte=2024-01-01&controller=1&cursor=...
+            return collection_response(DoorAccessLog, request.args, self.includes, DOOR_ACCESS_LOG_EXCLUDE)
+        only, error = parse_fields(DoorAccessLog, request.args)
+        if error:
+            return {'error': error}, 400
+        serializer = serializer_for(DoorAccessLog, DOOR_ACCESS_LOG_EXCLUDE, only)
         try:
-            log = DoorAccessLog.get(DoorAccessLog.id == log_id)
-            return {
-                'id': log.id,
-                'log_sha1': log.log_sha1,
-                'event_dt': log.event_dt,
-                'card_number': log.card_number,
-                'event_type': log.event_type,
-                'event_type_id': log.event_type_id,
-                'event_reason': log.event_reason,
-                'door': log.door,
-                'controller': log.controller,
-                'access_granted': log.access_granted,
-                'person_id': log.person.id if log.person else None
-            }
+            log = DoorAccessLog.select(*select_columns(serializer)).where(DoorAccessLog.id == log_id).get()
+            etag, last_modified = instance_validators(log)
+            return conditional_response(etag, last_modified, lambda: (serializer.instance(log), 200))
         except DoesNotExist:
             return {'error': 'Log not found'}, 404
 
     def post(self):
         args = self.parser.parse_args()
         try:
-            person = Person.get_by_id(args['person_id'])
-            log = DoorAccessLog.create(
-                log_sha1=args['log_sha1'],
-                card_number=args['card_number'],
-                event_type=args['event_type'],
-                event_type_id=args['event_type_id'],
-                event_reason=args['event_reason'],
-                door=args['door'],
-                controller=args['controller'],
-                access_granted=args['access_granted'],
-                person=person
-            )
-            return {'message': 'Log created successfully', 'log_id': log.id}, 201
-
+            Person.get_by_id(args['person_id'])
         except DoesNotExist:
             return {'error': 'Person not found'}, 404
 
+        if not validate_date_time_format(args['event_dt']):
+            return {'error': "event_dt must be formatted as 'YYYY-MM-DD HH:MM:SS'"}, 400
+
+        created = ingest_door_access_logs([door_access_row(args)])
+        if created:
+            log = DoorAccessLog.get(DoorAccessLog.log_sha1 == args['log_sha1'])
+            return {'message': 'Log created successfully', 'log_id': log.id}, 201
+        # the earlier copy may have been moved to the archive since
+        recorded = select_access_logs(DoorAccessLog, args['event_dt'], args['event_dt'], 'log_sha1 = ?', (args['log_sha1'],))
+        return {'message': 'Log already recorded', 'log_id': recorded[0]['id'] if recorded else None}, 200
+
     def put(self, log_id):
         args = self.parser.parse_args()
         try:
@@ -81,6 +139,333 @@ class DoorAccessLogResource(Resource):
         except DoesNotExist:
             return {'error': 'Log not found'}, 404
 
+class DoorAccessLogHistoryResource(Resource):
+    """
+    door access logs between two datetimes read from crm.sqlite and the archive years the range overlaps, in
+    event_dt order with keyset paging, the collection GET only lists rows still in crm.sqlite
+
+    curl "http://localhost:5000/v1/api/access/door_access_log/history?start_dt=2022-01-01&end_dt=2022-12-31&controller=1"
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument('start_dt', type=str, required=True, location='args')
+    parser.add_argument('end_dt', type=str, location='args') # defaults to now
+    parser.add_argument('controller', type=int, location='args')
+    parser.add_argument('door', type=int, location='args')
+    parser.add_argument('person_id', type=int, location='args')
+    parser.add_argument('limit', type=int, default=LIST_DEFAULT_LIMIT, location='args')
+    parser.add_argument('cursor', type=str, location='args')
+
+    def get(self):
+        args = self.parser.parse_args()
+        try:
+            start_dt = report_datetime(args['start_dt'])
+            end_dt = report_datetime(args['end_dt'], end_of_day=True) if args['end_dt'] else str(datetime.datetime.now())
+        except ValueError:
+            return {'error': "start_dt and end_dt must be formatted as 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'"}, 400
+        if not 0 < args['limit'] <= LIST_MAX_LIMIT:
+            return {'error': f'limit must be between 1 and {LIST_MAX_LIMIT}'}, 400
+
+        conditions, params = [], []
+        for name in ('controller', 'door', 'person_id'):
+            if args[name] is not None:
+                conditions.append(f'{name} = ?')
+                params.append(args[name])
+        if args['cursor']:
+            decoded = decode_cursor(args['cursor'])
+            if decoded is None or decoded[0] != 'event_dt':
+                return {'error': 'Invalid cursor'}, 400
+            _, value, last_id = decoded
+            conditions.append('(event_dt > ? OR (event_dt = ? AND id > ?))')
+            params.extend((value, value, last_id))
+
+        rows = select_access_logs(DoorAccessLog, start_dt, end_dt, ' AND '.join(conditions), params, limit=args['limit'] + 1)
+        next_cursor = None
+        if len(rows) > args['limit']:
+            rows = rows[:args['limit']]
+            next_cursor = encode_cursor('event_dt', cursor_value(rows[-1]['event_dt']), rows[-1]['id'])
+        items = [{name: str(value) if isinstance(value, datetime.datetime) else value
+                  for name, value in row.items() if name not in DOOR_ACCESS_LOG_EXCLUDE} for row in rows]
+        return {'items': items, 'next_cursor': next_cursor}, 200
+
+class DoorAccessLogBatchResource(Resource):
+    """
+    bulk ingest for the controller poller, events already stored (same log_sha1) are skipped
+
+    curl -X POST -H "Content-Type: application/json" -d '{"events": [{"log_sha1": "...", ...}, ...]}' http://localhost:5000/v1/api/access/door_access_log/batch
+    """
+    max_events = 500
+
+    def post(self):
+        data = request.get_json(silent=True)
+        events = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(events, list):
+            return {'error': 'Expected a list of events'}, 400
+        if len(events) > self.max_events:
+            return {'error': f'A batch may contain at most {self.max_events} events'}, 413
+
+        rows, errors = build_door_access_rows(events)
+        with expected_repeats():
+            accepted = ingest_door_access_logs(rows.values())
+
+        results = []
+        counts = {'accepted': 0, 'duplicate': 0, 'rejected': 0}
+        for index in range(len(events)):
+            if index in errors:
+                result = {'index': index, 'status': 'rejected', 'error': errors[index]}
+            else:
+                log_sha1 = rows[index]['log_sha1']
+                # the first copy of a log_sha1 in the batch claims the insert, any repeat is a duplicate
+                status = 'accepted' if log_sha1 in accepted else 'duplicate'
+                accepted.discard(log_sha1)
+                result = {'index': index, 'log_sha1': log_sha1, 'status': status}
+            counts[result['status']] += 1
+            results.append(result)
+        return dict(counts, results=results), 200
+
+class DoorAccessLogStreamResource(Resource):
+    """
+    streaming ingest for large controller log scrapes, one JSON event per line (NDJSON)
+
+    events are validated like DoorAccessLogResource and committed every chunk_size lines, so memory stays flat
+    regardless of upload size. on failure the response carries committed_offset (bytes) and committed_lines,
+    the poller resumes by re-sending the body from that offset, anything re-sent is skipped on log_sha1
+
+    curl -X POST -H "Content-Type: application/x-ndjson" --data-binary @events.ndjson http://localhost:5000/v1/api/access/door_access_log/stream
+    """
+    chunk_size = 500
+    max_line_bytes = 64 * 1024
+    max_errors = 100 # only the first errors are echoed back, the counts cover every line
+
+    def post(self):
+        stream = io.BufferedReader(request.stream, buffer_size=self.max_line_bytes)
+        status = {'accepted': 0, 'duplicate': 0, 'rejected': 0, 'lines': 0,
+                  'committed_offset': 0, 'committed_lines': 0, 'errors': []}
+        events, line_numbers = [], []
+        offset = 0
+
+        try:
+            while True:
+                line = stream.readline(self.max_line_bytes)
+                if not line:
+                    break
+                offset += len(line)
+                if not line.endswith(b'\n') and len(line) == self.max_line_bytes:
+                    # skip the remainder of an oversized line rather than buffering it
+                    while line and not line.endswith(b'\n'):
+                        line = stream.readline(self.max_line_bytes)
+                        offset += len(line)
+                    status['lines'] += 1
+                    self._reject(status, status['lines'], f'Line exceeds {self.max_line_bytes} bytes')
+                    continue
+                status['lines'] += 1
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                    line_numbers.append(status['lines'])
+                except ValueError as e:
+                    self._reject(status, status['lines'], f'Invalid JSON: {e}')
+                    continue
+                if len(events) >= self.chunk_size:
+                    self._commit_chunk(status, events, line_numbers, offset)
+                    events, line_numbers = [], []
+            self._commit_chunk(status, events, line_numbers, offset)
+        except (DatabaseError, ClientDisconnected) as e:
+            status['error'] = f'Ingest stopped after line {status["committed_lines"]}: {e}'
+            return status, 500 if isinstance(e, DatabaseError) else 400
+        return status, 200
+
+    def _commit_chunk(self, status, events, line_numbers, offset):
+        # every chunk runs the same person check, dedup SELECT and insert
+        with expected_repeats():
+            rows, errors = build_door_access_rows(events)
+            accepted = ingest_door_access_logs(rows.values())
+        status['accepted'] += len(accepted)
+        status['duplicate'] += len(rows) - len(accepted)
+        for index, error in sorted(errors.items()):
+            self._reject(status, line_numbers[index], error)
+        status['committed_offset'] = offset
+        status['committed_lines'] = status['lines']
+
+    def _reject(self, status, line_number, error):
+        status['rejected'] += 1
+        if len(status['errors']) < self.max_errors:
+            status['errors'].append({'line': line_number, 'error': error})
+
+def report_datetime(value, end_of_day=False):
+    """
+    accept 'YYYY-MM-DD HH:MM:SS' or a bare 'YYYY-MM-DD' date for report ranges
+    """
+    if validate_date_time_format(value):
+        return value
+    datetime.datetime.strptime(value, '%Y-%m-%d')
+    return f"{value} {'23:59:59' if end_of_day else '00:00:00'}"
+
+class VolunteerHoursReportResource(Resource):
+    """
+    volunteer hours for every volunteer over a date range
+
+    curl "http://localhost:5000/v1/api/access/volunteer_hours?start_date=2024-01-01&end_date=2024-01-31"
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument('start_date', type=str, required=True, location='args')
+    parser.add_argument('end_date', type=str, required=True, location='args')
+    parser.add_argument('checkin_controller', type=int, default=1, location='args')
+    parser.add_argument('checkin_door', type=int, default=1, location='args')
+    parser.add_argument('checkout_controller', type=int, default=2, location='args')
+    parser.add_argument('checkout_door', type=int, default=2, location='args')
+
+    def get(self):
+        args = self.parser.parse_args()
+        try:
+            start_date = report_datetime(args['start_date'])
+            end_date = report_datetime(args['end_date'], end_of_day=True)
+        except ValueError:
+            return {'error': "start_date and end_date must be formatted as 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'"}, 400
+
+        totals = calculate_all_volunteer_hours(start_date, end_date, args['checkin_controller'], args['checkin_door'],
+                                               args['checkout_controller'], args['checkout_door'])
+        names = {}
+        for person_ids in chunked(list(totals), 500):
+            names.update((person_id, (first, last)) for person_id, first, last in
+                         Person.select(Person.id, Person.first, Person.last).where(Person.id.in_(person_ids)).tuples())
+
+        volunteers = []
+        for person_id, duration in sorted(totals.items()):
+            first, last = names.get(person_id, (None, None))
+            seconds = int(duration.total_seconds())
+            volunteers.append({'person_id': person_id, 'first': first, 'last': last,
+                               'seconds': seconds, 'hours': round(seconds / 3600, 2)})
+        return {'start_date': start_date, 'end_date': end_date, 'volunteers': volunteers}
+
+class DoorTrafficReportResource(Resource):
+    """
+    granted and denied door events per hour or day, read from the DoorTrafficHourly/DoorTrafficDaily rollups
+
+    curl "http://localhost:5000/v1/api/access/traffic?granularity=day&start_date=2024-01-01&end_date=2024-12-31&controller=1"
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument('granularity', type=str, default='day', choices=('hour', 'day'), location='args')
+    parser.add_argument('start_date', type=str, required=True, location='args')
+    parser.add_argument('end_date', type=str, required=True, location='args')
+    parser.add_argument('controller', type=int, location='args')
+    parser.add_argument('door', type=int, location='args')
+
+    def get(self):
+        args = self.parser.parse_args()
+        try:
+            start_date = report_datetime(args['start_date'])
+            end_date = report_datetime(args['end_date'], end_of_day=True)
+        except ValueError:
+            return {'error': "start_date and end_date must be formatted as 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'"}, 400
+
+        rows = door_traffic(args['granularity'], start_date, end_date, args['controller'], args['door'])
+        return {
+            'granularity': args['granularity'],
+            'start_date': start_date,
+            'end_date': end_date,
+            'buckets': [{'bucket': bucket, 'controller': controller, 'door': door, 'granted': granted, 'denied': denied}
+                        for bucket, controller, door, granted, denied in rows]
+        }
+
+class CardAuthorizationResource(Resource):
+    """
+    answers "may this card or passcode open this door now" from the in-memory authorization index,
+    controller is the Controller id and door the door number (1-4) on it
+
+    curl "http://localhost:5000/v1/api/access/authorize?card_number=1234567&controller=1&door=2&at=2024-01-22%2015:30:00"
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument('card_number', type=int, location='args')
+    parser.add_argument('passcode', type=int, location='args')
+    parser.add_argument('controller', type=int, required=True, location='args')
+    parser.add_argument('door', type=int, required=True, location='args')
+    parser.add_argument('at', type=str, location='args') # Format as 'YYYY-MM-DD HH:MM:SS', defaults to now
+
+    def get(self):
+        args = self.parser.parse_args()
+        if (args['card_number'] is None) == (args['passcode'] is None):
+            return {'error': 'Provide either card_number or passcode'}, 400
+        if args['at'] and not validate_date_time_format(args['at']):
+            return {'error': "at must be formatted as 'YYYY-MM-DD HH:MM:SS'"}, 400
+        at = datetime.datetime.strptime(args['at'], '%Y-%m-%d %H:%M:%S') if args['at'] else None
+
+        granted, person_id = card_authorization_index.is_authorized(
+            args['controller'], args['door'], at=at, card_number=args['card_number'], passcode=args['passcode'])
+        return {'granted': granted, 'person_id': person_id}
+
+class AuthorizedPersonsResource(Resource):
+    """
+    everyone whose credential opens a door at a point in time, e.g. who can enter the woodshop Saturday 9pm
+
+    curl "http://localhost:5000/v1/api/access/authorized_persons?controller=2&door=1&at=2024-01-27%2021:00:00"
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument('controller', type=int, required=True, location='args')
+    parser.add_argument('door', type=int, required=True, location='args')
+    parser.add_argument('at', type=str, location='args') # Format as 'YYYY-MM-DD HH:MM:SS', defaults to now
+
+    def get(self):
+        args = self.parser.parse_args()
+        if args['at'] and not validate_date_time_format(args['at']):
+            return {'error': "at must be formatted as 'YYYY-MM-DD HH:MM:SS'"}, 400
+        at = datetime.datetime.strptime(args['at'], '%Y-%m-%d %H:%M:%S') if args['at'] else None
+
+        person_ids = card_authorization_index.persons_with_access(args['controller'], args['door'], at=at)
+        return {'controller': args['controller'], 'door': args['door'], 'person_ids': sorted(person_ids)}
+
+class ControllerSyncResource(Resource):
+    """
+    delta export of door profiles and credentials for one controller
+
+    GET returns the changes since the last acknowledged push, POST acknowledges the ones the controller applied
+    curl "http://localhost:5000/v1/api/access/controller/1/sync?limit=100"
+    curl -X POST -H "Content-Type: application/json" -d '{"applied": [{"kind": "credential", "id": 4, "hash": "..."}]}' http://localhost:5000/v1/api/access/controller/1/sync
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument('limit', type=int, location='args')
+
+    def get(self, controller_id):
+        if not Controller.select().where(Controller.id == controller_id).exists():
+            return {'error': 'Controller not found'}, 404
+        args = self.parser.parse_args()
+        changes = compute_delta(controller_id, limit=args['limit'])
+        return {'controller_id': controller_id, 'changes': changes}
+
+    def post(self, controller_id):
+        if not Controller.select().where(Controller.id == controller_id).exists():
+            return {'error': 'Controller not found'}, 404
+        data = request.get_json(silent=True) or {}
+        applied = data.get('applied')
+        if not isinstance(applied, list):
+            return {'error': 'Expected a list of applied changes'}, 400
+        for change in applied:
+            if not isinstance(change, dict) or change.get('kind') not in SYNC_KINDS or not isinstance(change.get('id'), int):
+                return {'error': f'Invalid change {change}'}, 400
+        acknowledge_delta(controller_id, applied)
+        return {'message': f'{len(applied)} changes acknowledged for controller {controller_id}'}
+
+class OccupancyResource(Resource):
+    """
+    who is in the building now, from exterior in/out door swipes (DoorDirectionMap) on controllers assigned a location
+
+    curl http://localhost:5000/v1/api/access/occupancy
+    curl http://localhost:5000/v1/api/access/occupancy/1
+    """
+    def get(self, location_id=None):
+        if location_id is None:
+            return {'locations': [{'location_id': location, 'headcount': count}
+                                  for location, count in sorted(occupancy_tracker.headcounts().items())]}
+        if not Location.select().where(Location.id == location_id).exists():
+            return {'error': 'Location not found'}, 404
+        occupants = occupancy_tracker.occupants(location_id)
+        return {
+            'location_id': location_id,
+            'headcount': len(occupants),
+            'occupants': [{'person_id': person_id, 'entered_dt': str(entered), 'last_seen_dt': str(last_seen)}
+                          for person_id, entered, last_seen in occupants]
+        }
+
 class KeyCardResource(Resource):
     parser = reqparse.RequestParser()
     parser.add_argument('card_number', type=int, required=True)
@@ -1,9 +1,16 @@
-from flask_restful import Resource, reqparse
+from flask_restful import Resource
 from models.crm.makerspace import (Person)
 from models.crm.chore import (ChoreHistory, ChoreOwnership, Chore)
 
-from flask import jsonify
-from peewee import IntegrityError
+from helpers.schemahelper import schema_for
+from flask import jsonify, request
+from peewee import IntegrityError, DoesNotExist
+import datetime
+
+# request bodies are validated against the model fields, keys that aren't fields are ignored as reqparse did
+CHORE_SCHEMA = schema_for(Chore)
+CHORE_OWNERSHIP_SCHEMA = schema_for(ChoreOwnership)
+CHORE_HISTORY_SCHEMA = schema_for(ChoreHistory)
 
 class ChoreResource(Resource):
     def get(self, chore_id):
@@ -14,24 +21,20 @@ class ChoreResource(Resource):
                 'name': chore.name,
                 'description': chore.description,
                 'classification': chore.classification,
-                'creator': chore.creator.id if chore.creator else None,
-                'last_completed': chore.last_completed,
+                'creator': chore.creator_id,
+                'last_completed': str(chore.last_completed),
                 'frequency': chore.frequency
             }
         except DoesNotExist:
             return {'error': 'Chore not found'}, 404
 
     def post(self):
-        parser = reqparse.RequestParser()
-        parser.add_argument('name', type=str, required=True)
-        parser.add_argument('description', type=str, required=True)
-        parser.add_argument('classification', type=str, required=True)
-        parser.add_argument('creator_id', type=int)
-        parser.add_argument('frequency', type=str, required=True)
-        args = parser.parse_args()
+        args, error = CHORE_SCHEMA.validate(request.get_json(silent=True), ignore_unknown=True)
+        if error:
+            return {'error': error}, 400
 
         try:
-            creator = Person.get_by_id(args['creator_id']) if args['creator_id'] else None
+            creator = Person.get_by_id(args['creator']) if args.get('creator') else None
             chore = Chore.create(
                 name=args['name'],
                 description=args['description'],
@@ -45,14 +48,9 @@ class ChoreResource(Resource):
             return {'error': 'Creator not found'}, 404
 
     def put(self, chore_id):
-        parser = reqparse.RequestParser()
-        parser.add_argument('name', type=str)
-        parser.add_argument('description', type=str)
-        parser.add_argument('classification', type=str)
-        parser.add_argument('creator_id', type=int)
-        parser.add_argument('frequency', type=str)
-        parser.add_argument('last_completed', type=str)  # Use a suitable date/time format
-        args = parser.parse_args()
+        args, error = CHORE_SCHEMA.validate(request.get_json(silent=True), partial=True, ignore_unknown=True)
+        if error:
+            return {'error': error}, 400
 
         try:
             chore = Chore.get_by_id(chore_id)
@@ -62,12 +60,12 @@ class ChoreResource(Resource):
                 chore.description = args['description']
             if 'classification' in args:
                 chore.classification = args['classification']
-            if 'creator_id' in args:
-                chore.creator = Person.get_by_id(args['creator_id']) if args['creator_id'] else None
+            if 'creator' in args:
+                chore.creator = Person.get_by_id(args['creator']) if args['creator'] else None
             if 'frequency' in args:
                 chore.frequency = args['frequency']
             if 'last_completed' in args:
-                chore.last_completed = datetime.datetime.strptime(args['last_completed'], "%Y-%m-%d %H:%M:%S")
+                chore.last_completed = args['last_completed']
 
             chore.save()
             return {'message': f'Chore with ID {chore_id} has been updated'}
@@ -88,8 +86,8 @@ class ChoreOwnershipResource(Resource):
             ownership = ChoreOwnership.get(ChoreOwnership.id == ownership_id)
             return {
                 'id': ownership.id,
-                'person_id': ownership.person.id,
-                'chore_id': ownership.chore.id,
+                'person_id': ownership.person_id,
+                'chore_id': ownership.chore_id,
                 'completion_percentage': ownership.completion_percentage,
                 'notes': ownership.notes
             }
@@ -97,20 +95,17 @@ class ChoreOwnershipResource(Resource):
             return {'error': 'Chore ownership record not found'}, 404
 
     def post(self):
-        parser = reqparse.RequestParser()
-        parser.add_argument('person_id', type=int, required=True)
-        parser.add_argument('chore_id', type=int, required=True)
-        parser.add_argument('completion_percentage', type=float, default=0.0)
-        parser.add_argument('notes', type=str)
-        args = parser.parse_args()
+        args, error = CHORE_OWNERSHIP_SCHEMA.validate(request.get_json(silent=True), ignore_unknown=True)
+        if error:
+            return {'error': error}, 400
 
         try:
-            person = Person.get_by_id(args['person_id'])
-            chore = Chore.get_by_id(args['chore_id'])
+            person = Person.get_by_id(args['person'])
+            chore = Chore.get_by_id(args['chore'])
             ownership = ChoreOwnership.create(
                 person=person,
                 chore=chore,
-                completion_percentage=args['completion_percentage'],
+                completion_percentage=args.get('completion_percentage', 0.0),
                 notes=args['notes']
             )
             return {'message': 'Chore ownership created successfully', 'ownership_id': ownership.id}, 201
@@ -118,19 +113,16 @@ class ChoreOwnershipResource(Resource):
             return {'error': 'Person or Chore not found'}, 404
 
     def put(self, ownership_id):
-        parser = reqparse.RequestParser()
-        parser.add_argument('person_id', type=int)
-        parser.add_argument('chore_id', type=int)
-        parser.add_argument('completion_percentage', type=float)
-        parser.add_argument('notes', type=str)
-        args = parser.parse_args()
+        args, error = CHORE_OWNERSHIP_SCHEMA.validate(request.get_json(silent=True), partial=True, ignore_unknown=True)
+        if error:
+            return {'error': error}, 400
 
         try:
             ownership = ChoreOwnership.get_by_id(ownership_id)
-            if 'person_id' in args:
-                ownership.person = Person.get_by_id(args['person_id'])
-            if 'chore_id' in args:
-                ownership.chore = Chore.get_by_id(args['chore_id'])
+            if 'person' in args:
+                ownership.person = Person.get_by_id(args['person'])
+            if 'chore' in args:
+                ownership.chore = Chore.get_by_id(args['chore'])
             if 'completion_percentage' in args:
                 ownership.completion_percentage = args['completion_percentage']
             if 'notes' in args:
@@ -155,8 +147,8 @@ class ChoreHistoryResource(Resource):
             history = ChoreHistory.get(ChoreHistory.id == history_id)
             return {
                 'id': history.id,
-                'chore_id': history.chore.id,
-                'person_id': history.person.id if history.person else None,
+                'chore_id': history.chore_id,
+                'person_id': history.person_id,
                 'notes': history.notes,
                 'class_type': history.class_type,
                 'status': history.status
@@ -165,17 +157,13 @@ class ChoreHistoryResource(Resource):
             return {'error': 'Chore history record not found'}, 404
 
     def post(self):
-        parser = reqparse.RequestParser()
-        parser.add_argument('chore_id', type=int, required=True)
-        parser.add_argument('person_id', type=int)
-        parser.add_argument('notes', type=str)
-        parser.add_argument('class_type', type=str, required=True)
-        parser.add_argument('status', type=str, required=True)
-        args = parser.parse_args()
+        args, error = CHORE_HISTORY_SCHEMA.validate(request.get_json(silent=True), ignore_unknown=True)
+        if error:
+            return {'error': error}, 400
 
         try:
-            chore = Chore.get_by_id(args['chore_id'])
-            person = Person.get_by_id(args['person_id']) if args['person_id'] else None
+            chore = Chore.get_by_id(args['chore'])
+            person = Person.get_by_id(args['person']) if args.get('person') else None
             history = ChoreHistory.create(
                 chore=chore,
                 person=person,
@@ -188,20 +176,16 @@ class ChoreHistoryResource(Resource):
             return {'error': 'Chore or Person not found'}, 404
 
     def put(self, history_id):
-        parser = reqparse.RequestParser()
-        parser.add_argument('chore_id', type=int)
-        parser.add_argument('person_id', type=int)
-        parser.add_argument('notes', type=str)
-        parser.add_argument('class_type', type=str)
-        parser.add_argument('status', type=str)
-        args = parser.parse_args()
+        args, error = CHORE_HISTORY_SCHEMA.validate(request.get_json(silent=True), partial=True, ignore_unknown=True)
+        if error:
+            return {'error': error}, 400
 
         try:
             history = ChoreHistory.get_by_id(history_id)
-            if 'chore_id' in args:
-                history.chore = Chore.get_by_id(args['chore_id'])
-            if 'person_id' in args:
-                history.person = Person.get_by_id(args['person_id']) if args['person_id'] else None
+            if 'chore' in args:
+                history.chore = Chore.get_by_id(args['chore'])
+            if 'person' in args:
+                history.person = Person.get_by_id(args['person']) if args['person'] else None
             if 'notes' in args:
                 history.notes = args['notes']
             if 'class_type' in args:
@@ -2,13 +2,25 @@ from flask_restful import Resource, reqparse
 from models.crm.makerspace import (BillingCadenceTypeMap, MembershipTypeMap, ContractTypeMap, Zone, Location, Equipment,
     Person, PersonEmergencyContact, PersonContact, PersonTrainedEquipment, PersonContract, PersonMembership, PersonRbac,
     PersonPhoto, PersonAvatarPic, PersonContract, EquipmentPhoto, EquipmentHistoryRecord, Equipment, Form, PersonForm,
-    BillingEventType, PersonBillingLog, PersonBilling)
-from helpers.apihelper import BaseResource
-from helpers.dbhelper import find_invalid_columns_in_table, remove_keys_starting_with_underscore
+    BillingEventType, PersonBillingLog, PersonBilling, DonorDocument)
+from helpers.apihelper import (BaseResource, collection_response, instance_validators, conditional_response, parse_fields,
+    select_columns)
+from helpers.serializehelper import DEFAULT_EXCLUDE, serialize, serializer_for
+from helpers.streamhelper import parse_stream_format, streaming_response
+from helpers.schemahelper import schema_for
+from helpers.dbhelper import remove_keys_starting_with_underscore
+from helpers.queryhelper import expected_repeats
 from models.crm.cardaccess import (DoorProfiles, PersonDoorCredentialProfile, DoorAccessLog, KeyCard, KeyCode)
+from models.crm.personimport import PersonImport
+from models.crm.blobstore import blob_store, guess_mime_type, legacy_file_bytes
 import base64
-from flask import jsonify, request
-from peewee import IntegrityError
+import csv
+import hashlib
+import io
+import os
+import werkzeug.datastructures
+from flask import jsonify, request, send_file
+from peewee import IntegrityError, DatabaseError, DoesNotExist
 
 class PersonResource(BaseResource):
     """
@@ -28,24 +40,44 @@ class PersonResource(BaseResource):
         patch(object_id): Performs partial updates or actions on a Person entity, such as restoring, hard deleting, hiding, or unhiding.
     """
     model = Person
+    includes = {
+        'billing': PersonBilling.person,
+        'memberships': PersonMembership.person,
+        'contacts': PersonContact.person,
+        'emergency_contacts': PersonEmergencyContact.person,
+    }
+
+class PersonImportResource(Resource):
+    """
+    bulk member import from a csv with first, last and email columns, plus optional contact_phone, contact_street,
+    contact_city, contact_state, contact_zip_code and emergency_first, emergency_last, emergency_email, emergency_phone
+
+    curl -X POST -F "file=@members.csv" http://localhost:5000/v1/api/person/import
+    curl -X POST -H "Content-Type: text/csv" --data-binary @members.csv http://localhost:5000/v1/api/person/import
+    """
+    def post(self):
+        upload = request.files.get('file')
+        stream = upload.stream if upload else io.BufferedReader(request.stream)
+        importer = PersonImport()
+        try:
+            with expected_repeats():
+                importer.run(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        except (UnicodeDecodeError, csv.Error) as e:
+            importer.status['error'] = f'Import stopped after row {importer.status["rows"]}: {e}'
+            return importer.status, 400
+        except DatabaseError as e:
+            importer.status['error'] = f'Import stopped after row {importer.status["rows"]}: {e}'
+            return importer.status, 500
+        return importer.status, 200
 
 # Flask-RESTful resource class
 class PersonBillingResource(Resource):
-    def __init__(self):
-        self.reqparse = reqparse.RequestParser()
-        self.initialize_reqparse()
-
-    def initialize_reqparse(self):
-        # Add arguments for each field
-        self.reqparse.add_argument('billing_entity_id', type=int, required=True, help='No billing_entity_id provided', location='json')
-        # Add other fields as necessary...
+    schema = schema_for(PersonBilling)
 
     def post(self):
-        args = self.reqparse.parse_args()
-        # Assuming all model fields except id are covered in args for simplicity
-        invalid_columns = find_invalid_columns_in_table(PersonBilling, args)
-        if invalid_columns:
-            return {'error': f'Invalid columns: {invalid_columns}'}, 400
+        args, error = self.schema.validate(request.get_json(silent=True))
+        if error:
+            return {'error': error}, 400
 
         try:
             new_person_billing = PersonBilling.create(**args)
@@ -56,15 +88,16 @@ class PersonBillingResource(Resource):
     def get(self, person_billing_id):
         try:
             person_billing = PersonBilling.get_by_id(person_billing_id)
-            return person_billing.to_dict(), 200  # Assuming to_dict() method exists
+            return serialize(person_billing), 200
         except DoesNotExist:
             return {'error': 'Person billing not found'}, 404
 
     def put(self, person_billing_id):
-        args = self.reqparse.parse_args()
-        invalid_columns = find_invalid_columns_in_table(PersonBilling, args)
-        if invalid_columns:
-            return {'error': f'Invalid columns: {invalid_columns}'}, 400
+        args, error = self.schema.validate(request.get_json(silent=True), partial=True)
+        if error:
+            return {'error': error}, 400
+        if not args:
+            return {'error': 'No fields to update'}, 400
 
         try:
             updated_count = PersonBilling.update(**args).where(PersonBilling.id == person_billing_id).execute()
@@ -383,6 +416,11 @@ class EquipmentHistoryRecordResource(Resource):
             return {'error': 'Record not found'}, 404
 
 class EquipmentResource(Resource):
+    includes = {
+        'assigned_zone': Equipment.assigned_zone,
+        'required_form': Equipment.required_form,
+    }
+
     def post(self):
         try:
             data = request.get_json()
@@ -412,13 +450,17 @@ class EquipmentResource(Resource):
         except KeyError as e:
             return {'error': f'Missing key {e}'}, 400
 
-    def get(self, equipment_id):
+    def get(self, equipment_id=None):
+        if equipment_id is None:
+            return collection_response(Equipment, request.args, self.includes)
+        only, error = parse_fields(Equipment, request.args)
+        if error:
+            return {'error': error}, 400
+        serializer = serializer_for(Equipment, DEFAULT_EXCLUDE, only)
         try:
-            equipment = Equipment.get(Equipment.id == equipment_id)
-            return {
-                # Assuming serialization of fields is done properly here.
-                # Implement serialization logic as needed to convert model instances to JSON-friendly format.
-            }
+            equipment = Equipment.select(*select_columns(serializer)).where(Equipment.id == equipment_id).get()
+            etag, last_modified = instance_validators(equipment)
+            return conditional_response(etag, last_modified, lambda: (serializer.instance(equipment), 200))
         except DoesNotExist:
             return {'error': 'Equipment not found'}, 404
 
@@ -573,6 +615,97 @@ class PersonRbacResource(Resource):
 #         return {'message': 'Person created successfully', 'person_id': new_person.id}, 201
 
 
+FILE_METADATA_FIELDS = ('filename', 'sha256', 'size', 'mime_type')
+
+def file_record(model, object_id, default_fields, not_found):
+    """
+    GET body of a FileModel row, data is the file base64 encoded, read from the blob store.
+    ?fields=filename,size answers from the row alone without touching the file
+    """
+    only, error = parse_fields(model, request.args)
+    if error:
+        return {'error': error}, 400
+    serializer = serializer_for(model, DEFAULT_EXCLUDE, only or default_fields + FILE_METADATA_FIELDS + ('data',))
+    wants_data = any(field.name == 'data' for field in serializer.fields)
+    columns = list(serializer.fields) + ([model.sha256] if wants_data else [])
+    try:
+        obj = model.select(*columns).where(model.id == object_id).get()
+    except model.DoesNotExist:
+        return {'error': not_found}, 404
+    body = serializer.instance(obj)
+    if body.get('sha256'):
+        body['download_url'] = f'{request.path}/download?v={body["sha256"]}'
+    if wants_data:
+        if obj.data is not None:
+            # not yet moved to the blob store, legacy uploads are stored as base64 text already
+            body['data'] = bytes(obj.data).decode('ascii')
+        elif obj.sha256:
+            body['data'] = base64.b64encode(blob_store.read(obj.sha256)).decode('ascii')
+    return body
+
+FILE_DOWNLOAD_MAX_AGE = 365 * 24 * 3600 # a download_url names the content's sha256, so what it returns never changes
+
+class FileDownloadResource(Resource):
+    """
+    raw bytes of a FileModel row, subclasses set model
+
+    blob store files go out through send_file, which streams them from disk and answers Range requests and
+    If-None-Match against the sha256 ETag. with ?v=<sha256>, the download_url file_record hands out, the response
+    is cacheable for a year as immutable; without it clients revalidate, since a PUT can point the row at a new
+    file. rows not yet moved by `flask migrate-file-blobs` are decoded from the data column
+    """
+    model = None
+
+    def get(self, file_id):
+        model = self.model
+        try:
+            row = (model
+                   .select(model.id, model.filename, model.sha256, model.size, model.mime_type)
+                   .where((model.id == file_id) & (model.is_deleted == False))
+                   .get())
+        except model.DoesNotExist:
+            return {'error': f'{model.__name__} not found'}, 404
+        mime_type = row.mime_type or guess_mime_type(row.filename)
+
+        immutable = False
+        if row.sha256 is None:
+            data = model.select(model.data).where(model.id == file_id).scalar()
+            if data is None:
+                return {'error': f'{model.__name__} has no file'}, 404
+            content = legacy_file_bytes(data)
+            response = send_file(io.BytesIO(content), mimetype=mime_type, download_name=row.filename,
+                                 etag=hashlib.sha256(content).hexdigest(), max_age=0)
+        elif not blob_store.exists(row.sha256):
+            return {'error': f'File for {model.__name__} {file_id} is missing from the blob store'}, 404
+        else:
+            immutable = request.args.get('v') == row.sha256
+            # absolute, flask resolves relative paths against the app root while the blob store follows the working directory
+            response = send_file(os.path.abspath(blob_store.path(row.sha256)), mimetype=mime_type,
+                                 download_name=row.filename, etag=row.sha256,
+                                 max_age=FILE_DOWNLOAD_MAX_AGE if immutable else 0)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        if immutable:
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+class EquipmentPhotoDownloadResource(FileDownloadResource):
+    model = EquipmentPhoto
+
+class PersonContractDownloadResource(FileDownloadResource):
+    model = PersonContract
+
+class PersonAvatarPicDownloadResource(FileDownloadResource):
+    model = PersonAvatarPic
+
+class PersonPhotoDownloadResource(FileDownloadResource):
+    model = PersonPhoto
+
+class DonorDocumentDownloadResource(FileDownloadResource):
+    model = DonorDocument
+
 class EquipmentPhotoResource(Resource):
     """
      curl -d @path/to/data.json -X POST
@@ -580,25 +713,13 @@ class EquipmentPhotoResource(Resource):
     def post(self, equipment_id):
         if 'photo' in request.files:
             photo = request.files['photo']
-            filename = photo.filename
-            photo_data = photo.read()
-            encoded_data = base64.b64encode(photo_data).decode('utf-8')
-
-            new_photo = EquipmentPhoto.create(equipment=equipment_id, filename=filename, data=encoded_data)
+            new_photo = EquipmentPhoto(equipment=equipment_id).attach(photo.stream, photo.filename, photo.mimetype)
+            new_photo.save()
             return {'message': 'Photo uploaded successfully'}, 201
         return {'error': 'No photo uploaded'}, 400
 
     def get(self, photo_id):
-        try:
-            photo = EquipmentPhoto.get(EquipmentPhoto.id == photo_id)
-            return {
-                'id': photo.id,
-                'equipment_id': photo.equipment.id,
-                'filename': photo.filename,
-                'data': photo.data
-            }
-        except EquipmentPhoto.DoesNotExist:
-            return {'error': 'Photo not found'}, 404
+        return file_record(EquipmentPhoto, photo_id, ('id', 'equipment'), 'Photo not found')
 
     def delete(self, photo_id):
         try:
@@ -616,10 +737,7 @@ class EquipmentPhotoResource(Resource):
         try:
             photo = EquipmentPhoto.get(EquipmentPhoto.id == photo_id)
             if args['photo'] is not None:
-                file_data = args['photo'].read()
-                encoded_data = base64.b64encode(file_data).decode('utf-8')
-                photo.data = encoded_data
-                photo.filename = args['photo'].filename
+                photo.attach(args['photo'].stream, args['photo'].filename, args['photo'].mimetype)
                 photo.save()
                 return {'message': f'Photo with ID {photo_id} has been updated'}, 200
             return {'error': 'No new photo provided'}, 400
@@ -737,7 +855,10 @@ class PersonMembershipResource(Resource):
     def get(self, person_id):
         try:
             person = Person.get(Person.id == person_id)
-            memberships = person.personmembership_set.select().join(MembershipTypeMap)
+            memberships = (PersonMembership
+                           .select(PersonMembership, MembershipTypeMap)
+                           .join(MembershipTypeMap)
+                           .where(PersonMembership.person == person))
             membership_list = [{'id': membership.membership_type.id, 'name': membership.membership_type.name, 'description': membership.membership_type.description} for membership in memberships]
             return {'person_id': person.id, 'memberships': membership_list}
         except Person.DoesNotExist:
@@ -797,8 +918,11 @@ class PersonBillingCadenceResource(Resource):
     def get(self, person_id):
         try:
             person = Person.get(Person.id == person_id)
-            billing_cadences = person.personbillingcadence_set.select().join(BillingCadenceTypeMap)
-            billing_cadence_list = [{'id': billing_cadence.membership_type.id, 'name': billing_cadence.membership_type.name, 'description': billing_cadence.membership_type.description} for billing_cadence in billing_cadences]
+            billing_cadences = (PersonBilling
+                                .select(PersonBilling, BillingCadenceTypeMap)
+                                .join(BillingCadenceTypeMap)
+                                .where(PersonBilling.person == person))
+            billing_cadence_list = [{'id': billing.billing_cadence.id, 'name': billing.billing_cadence.name, 'description': billing.billing_cadence.description} for billing in billing_cadences]
             return {'person_id': person.id, 'billing_cadences': billing_cadence_list}
         except Person.DoesNotExist:
             return {'error': 'Person not found'}, 404
@@ -863,41 +987,25 @@ class PersonContractResource(Resource):
     """
     def post(self):
         parser = reqparse.RequestParser()
-        parser.add_argument('contract_type_id', type=int, required=True)
-        parser.add_argument('person_id', type=int, required=True)
-        parser.add_argument('revision', type=str)
+        parser.add_argument('contract_type_id', type=int, required=True, location='form')
+        parser.add_argument('person_id', type=int, required=True, location='form')
+        parser.add_argument('revision', type=str, location='form')
         parser.add_argument('contract', type=werkzeug.datastructures.FileStorage, location='files')
         args = parser.parse_args()
 
         if 'contract' in request.files:
             contract_file = request.files['contract']
-            filename = contract_file.filename
-            file_data = contract_file.read()
-            encoded_data = base64.b64encode(file_data).decode('utf-8')
-
-            new_contract = PersonContract.create(
+            new_contract = PersonContract(
                 contract_type=args['contract_type_id'],
                 person=args['person_id'],
                 revision=args.get('revision'),
-                filename=filename,
-                data=encoded_data
-            )
+            ).attach(contract_file.stream, contract_file.filename, contract_file.mimetype)
+            new_contract.save()
             return {'message': 'Contract uploaded successfully'}, 201
         return {'error': 'No contract file uploaded'}, 400
 
     def get(self, contract_id):
-        try:
-            contract = PersonContract.get(PersonContract.id == contract_id)
-            return {
-                'id': contract.id,
-                'contract_type_id': contract.contract_type.id,
-                'person_id': contract.person.id,
-                'revision': contract.revision,
-                'filename': contract.filename,
-                'data': contract.data
-            }
-        except PersonContract.DoesNotExist:
-            return {'error': 'Contract not found'}, 404
+        return file_record(PersonContract, contract_id, ('id', 'contract_type', 'person', 'revision'), 'Contract not found')
 
     def delete(self, contract_id):
         try:
@@ -910,15 +1018,14 @@ class PersonContractResource(Resource):
     def put(self, contract_id):
         parser = reqparse.RequestParser()
         parser.add_argument('contract', type=werkzeug.datastructures.FileStorage, location='files')
-        parser.add_argument('revision', type=str)
+        parser.add_argument('revision', type=str, location='form')
         args = parser.parse_args()
 
         try:
             contract = PersonContract.get(PersonContract.id == contract_id)
             if 'contract' in request.files:
                 contract_file = request.files['contract']
-                contract.filename = contract_file.filename
-                contract.data = base64.b64encode(contract_file.read()).decode('utf-8')
+                contract.attach(contract_file.stream, contract_file.filename, contract_file.mimetype)
             if args.get('revision'):
                 contract.revision = args['revision']
             contract.save()
@@ -933,25 +1040,13 @@ class PersonAvatarPicResource(Resource):
     def post(self, person_id):
         if 'avatar' in request.files:
             avatar = request.files['avatar']
-            filename = avatar.filename
-            file_data = avatar.read()
-            encoded_data = base64.b64encode(file_data).decode('utf-8')
-
-            new_avatar = PersonAvatarPic.create(person=person_id, filename=filename, data=encoded_data)
+            new_avatar = PersonAvatarPic(person=person_id).attach(avatar.stream, avatar.filename, avatar.mimetype)
+            new_avatar.save()
             return {'message': 'Avatar uploaded successfully'}, 201
         return {'error': 'No avatar file uploaded'}, 400
 
     def get(self, avatar_id):
-        try:
-            avatar = PersonAvatarPic.get(PersonAvatarPic.id == avatar_id)
-            return {
-                'id': avatar.id,
-                'person_id': avatar.person.id,
-                'filename': avatar.filename,
-                'data': avatar.data
-            }
-        except PersonAvatarPic.DoesNotExist:
-            return {'error': 'Avatar not found'}, 404
+        return file_record(PersonAvatarPic, avatar_id, ('id', 'person'), 'Avatar not found')
 
     def delete(self, avatar_id):
         try:
@@ -965,10 +1060,8 @@ class PersonAvatarPicResource(Resource):
         if 'avatar' in request.files:
             try:
                 avatar = PersonAvatarPic.get(PersonAvatarPic.id == avatar_id)
-                file_data = request.files['avatar'].read()
-                encoded_data = base64.b64encode(file_data).decode('utf-8')
-                avatar.data = encoded_data
-                avatar.filename = request.files['avatar'].filename
+                upload = request.files['avatar']
+                avatar.attach(upload.stream, upload.filename, upload.mimetype)
                 avatar.save()
                 return {'message': f'Avatar with ID {avatar_id} has been updated'}, 200
             except PersonAvatarPic.DoesNotExist:
@@ -982,25 +1075,13 @@ class PersonPhotoResource(Resource):
     def post(self, person_id):
         if 'photo' in request.files:
             photo = request.files['photo']
-            filename = photo.filename
-            file_data = photo.read()
-            encoded_data = base64.b64encode(file_data).decode('utf-8')
-
-            new_photo = PersonPhoto.create(person=person_id, filename=filename, data=encoded_data)
+            new_photo = PersonPhoto(person=person_id).attach(photo.stream, photo.filename, photo.mimetype)
+            new_photo.save()
             return {'message': 'Photo uploaded successfully'}, 201
         return {'error': 'No photo file uploaded'}, 400
 
     def get(self, photo_id):
-        try:
-            photo = PersonPhoto.get(PersonPhoto.id == photo_id)
-            return {
-                'id': photo.id,
-                'person_id': photo.person.id,
-                'filename': photo.filename,
-                'data': photo.data
-            }
-        except PersonPhoto.DoesNotExist:
-            return {'error': 'Photo not found'}, 404
+        return file_record(PersonPhoto, photo_id, ('id', 'person'), 'Photo not found')
 
     def delete(self, photo_id):
         try:
@@ -1014,10 +1095,8 @@ class PersonPhotoResource(Resource):
         if 'photo' in request.files:
             try:
                 photo = PersonPhoto.get(PersonPhoto.id == photo_id)
-                file_data = request.files['photo'].read()
-                encoded_data = base64.b64encode(file_data).decode('utf-8')
-                photo.data = encoded_data
-                photo.filename = request.files['photo'].filename
+                upload = request.files['photo']
+                photo.attach(upload.stream, upload.filename, upload.mimetype)
                 photo.save()
                 return {'message': f'Photo with ID {photo_id} has been updated'}, 200
             except PersonPhoto.DoesNotExist:
@@ -1030,15 +1109,29 @@ class PersonPhotoResource(Resource):
 
 class AllLocationResource(Resource):
     def get(self):
-        locations = Location.select()
-        location_list = {'locations': [{'id': location.id, 'name': location.name} for location in locations]}
-        return location_list
+        stream_format, error = parse_stream_format(request.args)
+        if error:
+            return {'error': error}, 400
+        locations = Location.select(Location.id, Location.name).tuples()
+        rows = ({'id': location_id, 'name': name} for location_id, name in locations.iterator())
+        if stream_format:
+            return streaming_response(rows, stream_format)
+        return {'locations': list(rows)}
 
 class AllZonesResource(Resource):
+    """
+    ?stream=json or ?stream=ndjson sends the zones as a bare array or one per line while reading them
+    """
     def get(self):
-        zones = Zone.select()
-        zone_list = {'zones': [{'id': zone.id, 'name': zone.name, 'location': {'id': zone.location.id, 'name': zone.location.name}} for zone in zones]}
-        return zone_list
+        stream_format, error = parse_stream_format(request.args)
+        if error:
+            return {'error': error}, 400
+        zones = Zone.select(Zone.id, Zone.name, Location.id, Location.name).join(Location).tuples()
+        rows = ({'id': zone_id, 'name': name, 'location': {'id': location_id, 'name': location_name}}
+                for zone_id, name, location_id, location_name in zones.iterator())
+        if stream_format:
+            return streaming_response(rows, stream_format)
+        return {'zones': list(rows)}
 
 class ZoneResource(Resource):
     def get(self, zone_id):
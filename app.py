@@ -6,6 +6,12 @@ import os
 from models.crm.makerspace import create_tables as create_tables_makerspace  # Import the create_tables function
 from models.crm.cardaccess import create_tables as create_tables_cardaccess  # Import the create_tables function
 from models.crm.chore import create_tables as create_tables_chore  # Import the create_tables function
+from models.crm.archive import run_archive_job, compact
+from models.crm.blobstore import move_file_data, prune_blobs
+from models.crm.makerspace import FILE_MODELS
+from models.crm.personimport import PersonImport
+from helpers.queryhelper import init_query_instrumentation
+import click
 
 app = Flask(__name__)
 
@@ -13,12 +19,36 @@ app.config['DATABASE_FILE'] = 'crm.sqlite'
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a_default_secret_key')
 # Initialize the API views
 api.init_app(app)
+init_query_instrumentation(app)
 app.register_blueprint(webapp_crm, url_prefix='/')
 
 @app.route('/assets/<path:filename>')
 def redirect_to_static(filename):
     return redirect(url_for('static', filename='assets/' + filename))
 
+@app.cli.command('archive-access-logs')
+def archive_access_logs_command():
+    """Move old access logs into the per-year archive databases, apply retention and compact."""
+    print(run_archive_job())
+
+@app.cli.command('import-people')
+@click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+def import_people_command(csv_file):
+    """Bulk import members, with their contact and emergency contact, from a csv file."""
+    with open(csv_file, encoding='utf-8-sig', newline='') as lines:
+        print(PersonImport().run(lines))
+
+@app.cli.command('migrate-file-blobs')
+def migrate_file_blobs_command():
+    """Move uploads still stored base64 encoded in crm.sqlite into the blob store, then vacuum the database."""
+    print(move_file_data(FILE_MODELS))
+    compact(vacuum_hot=True)
+
+@app.cli.command('prune-blobs')
+def prune_blobs_command():
+    """Delete stored files that no photo, avatar, contract or document refers to any more."""
+    print(prune_blobs(FILE_MODELS))
+
 
 if __name__ == '__main__':
     with app.app_context():
@@ -1,38 +1,44 @@
 from flask import Blueprint, request, g
 from functools import wraps
 from flask import make_response
+from models.crm.rbac import person_role_cache, ADMIN_ROLE
+from helpers.sessionhelper import SESSION_COOKIE, read_session_token
 webapp_crm = Blueprint('webapp_crm', __name__)
 
+def current_user_roles():
+    """
+    (person_id, roles) of the logged in user, (None, frozenset()) when nobody is.
+    resolved once per request and kept on g: the signed session cookie names the person and its session version,
+    the current version and the roles come from person_role_cache, so a warm request makes no queries
+    """
+    if 'user_roles' not in g:
+        person_id, roles = None, frozenset()
+        token_person_id, version = read_session_token(request.cookies.get(SESSION_COOKIE))
+        if token_person_id is not None and version is not None \
+                and version == person_role_cache.session_version(token_person_id):
+            person_id = token_person_id
+            roles = person_role_cache.roles(person_id)
+        g.user_roles = (person_id, roles)
+    return g.user_roles
+
 @webapp_crm.context_processor
 def inject_user_roles():
     """
     In Flask, to automatically include certain variables (like is_admin and roles) in all renderings of templates,
     you can use the context_processor decorator.
     """
-    user_id = request.cookies.get('user_id')
-    if user_id:
-        user = PersonCredentials.get_or_none(PersonCredentials.user_id == user_id)
-        if user:
-            roles = [role.role for role in PersonRbac.select().where((PersonRbac.person == user.person) & (PersonRbac.permission == True))]
-            is_admin = PersonRbac.get_or_none((PersonRbac.person == user.person) & (PersonRbac.role == 'admin') & (PersonRbac.permission == True))
-            return {'is_admin': bool(is_admin), 'roles': roles}
+    person_id, roles = current_user_roles()
+    if person_id is not None:
+        return {'is_admin': ADMIN_ROLE in roles, 'roles': sorted(roles)}
     return {}
 
 
 def requires_admin(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user_id = request.cookies.get('user_id')
-        if user_id:
-            user = PersonCredentials.get_or_none(PersonCredentials.user_id == user_id)
-            if user:
-                is_admin = PersonRbac.get_or_none(
-                    (PersonRbac.person == user.person) & 
-                    (PersonRbac.role == 'admin') & 
-                    (PersonRbac.permission == True)
-                )
-                if is_admin:
-                    return f(*args, **kwargs)
+        person_id, roles = current_user_roles()
+        if ADMIN_ROLE in roles:
+            return f(*args, **kwargs)
         
         return make_response("Forbidden", 403)
     return decorated_function
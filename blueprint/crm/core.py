@@ -1,10 +1,12 @@
 from flask import Blueprint, render_template, request, redirect, url_for, make_response, flash
 from flask import Flask, session, request, redirect, url_for, render_template
-from werkzeug.security import generate_password_hash, check_password_hash
+from helpers.passwordhelper import password_service, PasswordServiceBusy
 from models.crm.makerspace import *
 from helpers.constants import MUNICIP, US_STATES_LIST, get_michigan_in_first_three
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired # password reset token
-from . import webapp_crm, inject_user_roles, requires_admin
+from models.crm.rbac import person_role_cache, revoke_sessions
+from helpers.sessionhelper import SESSION_COOKIE, set_session_cookie
+from . import webapp_crm, inject_user_roles, requires_admin, current_user_roles
 
 from flask import request, jsonify
 import requests
@@ -103,12 +105,16 @@ def register_model():
             flash('Username already exists')
             return redirect(url_for('webapp_crm.register'))
 
-        # Create new user
+        # Hash the password before writing anything, a busy hash pool must not leave a Person without credentials
+        try:
+            hashed_password = password_service.hash(password)
+        except PasswordServiceBusy:
+            flash('Too many sign-ins right now, please try again in a moment')
+            return render_template('crm/core/register.html', states=get_michigan_in_first_three(US_STATES_LIST), municipalities=MUNICIP)
+
+        # Create new user and save credentials
         new_person = Person.create(first=first_name, last=last_name, email=email)
         new_person.save()
-
-        # Hash password and save credentials
-        hashed_password = generate_password_hash(password)
         new_credentials = PersonCredentials.create(
             uid=None,
             user_id=username,
@@ -193,6 +199,9 @@ def reset_password(token):
         new_password = request.form.get('password')
         # Validate and update the password
         PersonCredentials.update_password(user_id=user_id, new_password=new_password)
+        # sessions opened with the old password stop working
+        for credentials in PersonCredentials.select(PersonCredentials.person).where(PersonCredentials.user_id == user_id):
+            revoke_sessions(credentials.person_id)
 
         # Additional logic (e.g., invalidating the token)
 
@@ -208,10 +217,17 @@ def login():
         password = request.form.get('password')
 
         user = PersonCredentials.get_or_none(PersonCredentials.user_id == username)
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid, upgraded_hash = password_service.verify(user.password_hash, password) if user else (False, None)
+        except PasswordServiceBusy:
+            flash('Too many sign-ins right now, please try again in a moment')
+            return redirect(url_for('webapp_crm.login'))
+        if valid:
+            if upgraded_hash:
+                # stored with outdated hash parameters, replace it now that the plain password is at hand
+                PersonCredentials.update(password_hash=upgraded_hash).where(PersonCredentials.id == user.id).execute()
             resp = make_response(redirect(url_for('webapp_crm.index')))
-            resp.set_cookie('user_id', username)
-            return resp
+            return set_session_cookie(resp, user.person_id, person_role_cache.session_version(user.person_id))
 
         flash('Invalid username or password')
         return redirect(url_for('webapp_crm.login'))
@@ -221,24 +237,21 @@ def login():
 @webapp_crm.route('/logout')
 def logout():
     resp = make_response(redirect(url_for('webapp_crm.index')))
-    resp.delete_cookie('user_id')  # Delete the user_id cookie
+    resp.delete_cookie(SESSION_COOKIE)  # Delete the session token cookie
     flash('You have been logged out.')
     return resp
 
 @webapp_crm.route('/')
 def index():
-    user_id = request.cookies.get('user_id')
-    if not user_id:
+    # roles and is_admin reach the template through inject_user_roles
+    person_id = current_user_roles()[0]
+    if person_id is None:
         return redirect(url_for('webapp_crm.login'))
 
-    user = PersonCredentials.get_or_none(PersonCredentials.user_id == user_id)
-    if not user:
+    person = Person.get_or_none(Person.id == person_id)
+    if not person:
         return redirect(url_for('webapp_crm.login'))
 
-    # Check if the user is an admin
-    roles = [role.role for role in PersonRbac.select().where((PersonRbac.person == user.person) & (PersonRbac.permission == True))]
-    is_admin = PersonRbac.get_or_none((PersonRbac.person == user.person) & (PersonRbac.role == 'admin') & (PersonRbac.permission == True))
-    
-    return render_template('crm/core/index.html', user=user.person)
+    return render_template('crm/core/index.html', user=person)
 
 
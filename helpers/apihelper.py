@@ -1,66 +1,464 @@
 from flask_restful import Resource, reqparse
-from flask import jsonify, request
+from flask import jsonify, request, Response
+from werkzeug.http import http_date, quote_etag
+from peewee import (Model, DoesNotExist, ForeignKeyField, BooleanField, IntegerField, AutoField, FloatField,
+    DecimalField, DateTimeField, Value, fn, SQL)
+from helpers.schemahelper import schema_for
+from helpers.serializehelper import (DEFAULT_EXCLUDE, serializer_for, field_key, include_plan, select_includes,
+    fetch_includes, serialize_with_includes)
+from helpers.streamhelper import parse_stream_format, streaming_response
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 500
+LIST_RESERVED_ARGS = ('limit', 'cursor', 'sort', 'include', 'fields', 'stream')
+ROW_STATE_FIELDS = ('created_dt', 'updated_dt', 'is_deleted', 'is_hidden')
+FILTER_OPERATORS = {'gt': '__gt__', 'gte': '__ge__', 'lt': '__lt__', 'lte': '__le__'}
+
+def parse_with_parser(parser, data):
+    """
+    Validates a plain dictionary with the arguments of a reqparse.RequestParser.
+
+    Batch endpoints receive many items in one body, so they can't call parser.parse_args() per item.
+    This applies the same required/type/choices rules the single item endpoint uses.
+
+    :param parser: The RequestParser whose arguments describe a valid item.
+    :param data: The item to validate.
+    :return: A tuple of (parsed arguments, None) on success or (None, error message) on failure.
+    """
+    if not isinstance(data, dict):
+        return None, 'Expected a JSON object'
+
+    parsed = {}
+    for arg in parser.args:
+        value = data.get(arg.name)
+        if value is None:
+            if arg.required:
+                return None, f'Missing required parameter {arg.name}'
+            parsed[arg.name] = arg.default
+            continue
+        try:
+            parsed[arg.name] = arg.type(value)
+        except (TypeError, ValueError) as e:
+            return None, f'Invalid value for {arg.name}: {e}'
+        if arg.choices and parsed[arg.name] not in arg.choices:
+            return None, f'{arg.name} must be one of {list(arg.choices)}'
+    return parsed, None
+
+def indexed_fields(model):
+    """
+    Fields a collection GET may filter or sort on without scanning the table.
+
+    That is the primary key, foreign keys, fields declared with index=True or unique=True and the
+    leading column of every composite index in Meta.indexes.
+
+    :param model: The Peewee model being listed.
+    :return: A dictionary of {name: field}, foreign keys are also reachable by their column name (zone_id).
+    """
+    fields = {}
+    # ModelIndex entries (expression indexes added with Model.add_index) don't cover a plain column lookup
+    leading = {index[0][0] for index in model._meta.indexes
+               if isinstance(index, (tuple, list)) and isinstance(index[0], (tuple, list))}
+    for field in model._meta.sorted_fields:
+        if field.primary_key or field.index or field.unique or isinstance(field, ForeignKeyField) or field.name in leading:
+            fields[field.name] = field
+            fields[field.column_name] = field
+    return fields
+
+def coerce_query_value(field, value):
+    """
+    Converts a query string value to what the field stores, raises ValueError when it doesn't fit.
+    """
+    if isinstance(field, ForeignKeyField):
+        field = field.rel_field
+    if isinstance(field, BooleanField):
+        if value.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError(f'{field.name} expects true or false')
+        return value.lower() in ('true', '1')
+    if isinstance(field, (IntegerField, AutoField)):
+        return int(value)
+    if isinstance(field, DecimalField):
+        try:
+            return decimal.Decimal(value)
+        except decimal.InvalidOperation:
+            raise ValueError(f'{field.name} expects a number')
+    if isinstance(field, FloatField):
+        return float(value)
+    return value
+
+def cursor_value(value):
+    """
+    A sort column value as it can be carried in a cursor and compared against the stored column.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, Model):
+        return value.get_id()
+    return value
+
+def encode_cursor(sort, value, last_id):
+    return base64.urlsafe_b64encode(json.dumps([sort, value, last_id]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        sort, value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    return sort, value, last_id
+
+def filter_query(model, args, query=None):
+    """
+    Applies the filter arguments of a collection GET (<column>=value, <column>__gt, __gte, __lt and __lte on
+    indexed columns) to a query, rows flagged is_deleted or is_hidden are always left out.
+
+    :return: A tuple of (query, None) on success or (None, error message) on failure.
+    """
+    query = model.select() if query is None else query
+    fields = indexed_fields(model)
+    for name in ('is_deleted', 'is_hidden'):
+        if name in model._meta.fields:
+            query = query.where(model._meta.fields[name] == False)
+
+    for key in args:
+        if key in LIST_RESERVED_ARGS:
+            continue
+        name, _, operator = key.partition('__')
+        field = fields.get(name)
+        if field is None or (operator and operator not in FILTER_OPERATORS):
+            return None, f'Cannot filter on {key}, filterable columns are {sorted(set(field.name for field in fields.values()))}'
+        try:
+            value = coerce_query_value(field, args[key])
+        except ValueError as e:
+            return None, f'Invalid value for {key}: {e}'
+        query = query.where(getattr(field, FILTER_OPERATORS[operator])(value) if operator else field == value)
+    return query, None
+
+def parse_sort(model, args):
+    """
+    The sort argument of a collection GET, an indexed non-null column with - for descending.
+
+    :return: A tuple of ((sort argument, field, descending, ORDER BY terms), None) on success or (None, error message).
+    """
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    sort_field = indexed_fields(model).get(sort.lstrip('-'))
+    if sort_field is None or sort_field.null:
+        return None, f'Cannot sort on {sort}, sortable columns are the non-null filterable columns'
+    primary_key = model._meta.primary_key
+    order = [sort_field.desc() if descending else sort_field.asc()]
+    if sort_field is not primary_key:
+        order.append(primary_key.desc() if descending else primary_key.asc())
+    return (sort, sort_field, descending, order), None
+
+def keyset_page(model, args, query=None, serializer=None, fetch=list):
+    """
+    Applies collection GET arguments to a query and fetches one page with keyset pagination.
+
+    Rather than OFFSET, the cursor carries the sort value and id of the last row returned and the next
+    page starts with WHERE (sort, id) > (value, last id), so every page costs one index range scan no
+    matter how deep the client pages. Rows flagged is_deleted or is_hidden are never listed.
+
+    Supported arguments:
+    - limit: page size, default 50 and at most 500.
+    - cursor: the next_cursor of the previous page, it is only valid with the same sort.
+    - sort: an indexed column, prefix with - for descending (sort=-event_dt). Defaults to id.
+    - <column>=value, <column>__gt, __gte, __lt and __lte: filters on indexed columns.
+
+    :param model: The Peewee model being listed.
+    :param args: The request arguments, usually request.args.
+    :param query: An optional base query, defaults to model.select().
+    :param serializer: A ModelSerializer, when given rows are encoded dicts read straight from the cursor
+                       instead of model instances.
+    :param fetch: Runs the final query when there is no serializer, e.g. to prefetch relations.
+    :return: A tuple of ((rows, next cursor or None), None) on success or (None, error message) on failure.
+    """
+    try:
+        limit = int(args.get('limit', LIST_DEFAULT_LIMIT))
+    except ValueError:
+        return None, 'limit must be an integer'
+    if not 0 < limit <= LIST_MAX_LIMIT:
+        return None, f'limit must be between 1 and {LIST_MAX_LIMIT}'
+
+    query, error = filter_query(model, args, query)
+    if error:
+        return None, error
+    sort_spec, error = parse_sort(model, args)
+    if error:
+        return None, error
+    sort, sort_field, descending, order = sort_spec
+    primary_key = model._meta.primary_key
+
+    cursor = args.get('cursor')
+    if cursor:
+        decoded = decode_cursor(cursor)
+        if decoded is None or decoded[0] != sort:
+            return None, 'Invalid cursor for this sort'
+        _, value, last_id = decoded
+        if sort_field is primary_key:
+            query = query.where(primary_key < last_id if descending else primary_key > last_id)
+        elif descending:
+            query = query.where((sort_field < value) | ((sort_field == value) & (primary_key < last_id)))
+        else:
+            query = query.where((sort_field > value) | ((sort_field == value) & (primary_key > last_id)))
+
+    query = query.order_by(*order).limit(limit + 1)
+    rows = serializer.rows(query) if serializer else list(fetch(query))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if serializer:
+            value, last_id = last[field_key(sort_field)], last[field_key(primary_key)]
+        else:
+            value, last_id = getattr(last, sort_field.name), last.get_id()
+        next_cursor = encode_cursor(sort, cursor_value(value), last_id)
+    return (rows, next_cursor), None
+
+def parse_includes(args):
+    """
+    The relation names of an include=a,b query argument.
+    """
+    return [name for name in args.get('include', '').split(',') if name]
+
+def parse_fields(model, args, required=()):
+    """
+    The field names a sparse fieldset request (?fields=first,last) selects.
+
+    Only these columns are put in the SELECT, so unrequested columns, blobs in particular, are never read
+    from SQLite nor serialized. The primary key is always selected.
+
+    :param model: The Peewee model being read.
+    :param args: The request arguments, usually request.args.
+    :param required: Field names the caller needs whatever was requested, e.g. the sort column.
+    :return: A tuple of (field names in model order or None when every field is wanted, None) on success
+             or (None, error message) on failure.
+    """
+    requested = [name for name in args.get('fields', '').split(',') if name]
+    if not requested:
+        return None, None
+    by_key = {}
+    for field in model._meta.sorted_fields:
+        by_key[field.name] = by_key[field.column_name] = field
+    unknown = [name for name in requested if name not in by_key]
+    if unknown:
+        return None, f'Unknown fields {unknown}, available fields are {[field.name for field in model._meta.sorted_fields]}'
+    names = {by_key[name].name for name in requested} | {model._meta.primary_key.name} | set(required)
+    return tuple(field.name for field in model._meta.sorted_fields if field.name in names), None
+
+def select_columns(serializer):
+    """
+    The serialized columns plus the bookkeeping ones (ROW_STATE_FIELDS) a single GET checks and derives its ETag from.
+    """
+    selected = {field.name for field in serializer.fields}
+    extra = [serializer.model._meta.fields[name] for name in ROW_STATE_FIELDS
+             if name in serializer.model._meta.fields and name not in selected]
+    return serializer.fields + extra
+
+def _local_to_utc(value):
+    return value.astimezone(datetime.timezone.utc) if value else None
+
+def row_last_modified(obj):
+    """
+    When a row last changed, as an aware UTC datetime or None.
+
+    updated_dt is stamped in local time on every save() and update(), rows never written since it was
+    maintained fall back to created_dt, which SQLite's CURRENT_TIMESTAMP stores in UTC.
+    """
+    fields = obj._meta.fields
+    if 'updated_dt' in fields and obj.updated_dt:
+        return _local_to_utc(fields['updated_dt'].python_value(obj.updated_dt))
+    if 'created_dt' in fields and obj.created_dt:
+        return fields['created_dt'].python_value(obj.created_dt).replace(tzinfo=datetime.timezone.utc)
+    return None
+
+def table_version(*models):
+    """
+    A cheap version of whole tables, used to validate collection GETs without running the page query.
+
+    Per model it reads the row count, the highest id and the newest updated_dt, answered from the primary key
+    and the updated_dt index, all models in one UNION ALL query. Inserts move the count and highest id, deletes
+    the count, and any write through save() or update() moves updated_dt.
+
+    :param models: The Peewee models whose rows can appear in the response.
+    :return: A tuple of (version, newest updated_dt as an aware UTC datetime or None).
+    """
+    query = None
+    for model in models:
+        updated = model._meta.fields.get('updated_dt')
+        select = model.select(Value(model._meta.table_name), fn.COUNT(SQL('*')), fn.MAX(model._meta.primary_key),
+                              fn.MAX(updated) if updated is not None else SQL('NULL'))
+        query = select if query is None else query + select
+    version = [list(row) for row in query.tuples()]
+    changed = [_local_to_utc(DateTimeField().python_value(row[3])) for row in version if row[3]]
+    return version, max(changed) if changed else None
+
+def make_etag(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+def instance_validators(obj, related=()):
+    """
+    The ETag and Last-Modified of one row, from its id and when it last changed.
+
+    :param obj: The model instance being returned.
+    :param related: Models of included relations, their table versions are folded in so the
+                    validators change when a nested row does.
+    :return: A tuple of (etag, last modified or None).
+    """
+    last_modified = row_last_modified(obj)
+    parts = [type(obj).__name__, obj.get_id(), last_modified]
+    if related:
+        version, related_modified = table_version(*related)
+        parts.append(version)
+        if related_modified and (last_modified is None or related_modified > last_modified):
+            last_modified = related_modified
+    return make_etag(*parts), last_modified
+
+def is_not_modified(etag, last_modified):
+    """
+    Whether the request's If-None-Match, or If-Modified-Since when there is none, shows the client has this version.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def conditional_response(etag, last_modified, build):
+    """
+    Answers a GET with 304 Not Modified when the client's copy is current, otherwise builds the body.
+
+    :param etag: The unquoted ETag of the current version, sent as a weak validator.
+    :param last_modified: When the resource last changed, an aware datetime or None.
+    :param build: Called only when the body is needed, returns a tuple of (response body, HTTP status code)
+                  or a Response, e.g. a streaming one.
+    :return: A 304 Response, the built Response or a tuple of (response body, HTTP status code, headers).
+    """
+    headers = {'ETag': quote_etag(etag, weak=True), 'Cache-Control': 'no-cache'}
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    if is_not_modified(etag, last_modified):
+        return Response(status=304, headers=headers)
+    built = build()
+    if isinstance(built, Response):
+        built.headers.extend(headers)
+        return built
+    body, status = built
+    if status != 200:
+        return body, status
+    return body, status, headers
+
+def collection_response(model, args, relations=None, exclude=DEFAULT_EXCLUDE):
+    """
+    Builds a collection GET response: one keyset page, with any requested includes nested in each item.
+
+    Without includes the rows are encoded straight from the cursor. With includes, to-one relations are
+    JOINed into the page query and to-many relations are prefetched, so a page always costs 1 + the number
+    of to-many includes queries whatever its size. A fields= argument narrows the columns selected and
+    serialized, see parse_fields. With stream=json or stream=ndjson every matching row is sent instead of a
+    page, encoded from the cursor as it is read, see helpers.streamhelper. The ETag and Last-Modified come from table_version of the
+    model and its included relations, so a conditional GET of an unchanged collection is answered with 304
+    before any page query runs.
+
+    :param model: The Peewee model being listed.
+    :param args: The request arguments, usually request.args.
+    :param relations: The resource's declarative {include name: ForeignKeyField}, see include_plan.
+    :param exclude: Field names left out of every item.
+    :return: A tuple of (response body, HTTP status code[, headers]) or a 304 Response.
+    """
+    try:
+        joins, prefetches = include_plan(model, relations or {}, parse_includes(args))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    sort_field = indexed_fields(model).get(args.get('sort', 'id').lstrip('-'))
+    only, error = parse_fields(model, args, required=[sort_field.name] if sort_field else [])
+    if error:
+        return {'error': error}, 400
+    stream_format, error = parse_stream_format(args)
+    if error:
+        return {'error': error}, 400
+    if stream_format and (joins or prefetches):
+        return {'error': 'include is not available on streamed collections'}, 400
+    related = [field.rel_model for name, field in joins] + [field.model for name, field in prefetches]
+    version, last_modified = table_version(model, *related)
+    etag = make_etag(model.__name__, sorted(args.items()), exclude, version)
+    if stream_format:
+        return conditional_response(etag, last_modified, lambda: _collection_stream(model, args, exclude, only, stream_format))
+    return conditional_response(etag, last_modified, lambda: _collection_page(model, args, joins, prefetches, exclude, only))
+
+def _collection_stream(model, args, exclude, only, stream_format):
+    query, error = filter_query(model, args)
+    if error:
+        return {'error': error}, 400
+    sort_spec, error = parse_sort(model, args)
+    if error:
+        return {'error': error}, 400
+    serializer = serializer_for(model, exclude, only)
+    return streaming_response(serializer.iterate(query.order_by(*sort_spec[3])), stream_format)
+
+def _collection_page(model, args, joins, prefetches, exclude, only):
+    serializer = serializer_for(model, exclude, only)
+    if joins or prefetches:
+        page, error = keyset_page(model, args, query=select_includes(serializer.select(), model, joins),
+                                  fetch=lambda query: fetch_includes(query, prefetches))
+    else:
+        page, error = keyset_page(model, args, serializer=serializer)
+    if error:
+        return {'error': error}, 400
+    rows, next_cursor = page
+    if joins or prefetches:
+        rows = [serialize_with_includes(obj, joins, prefetches, exclude, only) for obj in rows]
+    return {'items': rows, 'next_cursor': next_cursor}, 200
 
 class BaseResource(Resource):
+    # {include name: ForeignKeyField} relations a GET may nest with ?include=, see helpers.serializehelper.include_plan
+    includes = {}
+
     @staticmethod
     def model_to_dict(instance, exclude_fields=None):
         """
         Converts a model instance into a dictionary, excluding specified fields.
-        
+
+        Encoding is done by the model's cached serializer (helpers.serializehelper), foreign keys are
+        emitted as their raw *_id column without loading the related row.
+
         :param instance: The model instance to serialize.
         :param exclude_fields: A list of field names to exclude from the resulting dictionary.
         :return: A dictionary representation of the model instance.
         """
         if exclude_fields is None:
             exclude_fields = ['is_deleted']
+        return serializer_for(type(instance), exclude_fields).instance(instance)
 
-        data = {}
-        for field_name in instance._meta.fields.keys():
-            if field_name not in exclude_fields:
-                value = getattr(instance, field_name)
-                # Convert complex types to their string representation or use custom formatting
-                if isinstance(value, Model):
-                    # This handles foreign keys by inserting the ID, but you might customize it
-                    data[field_name] = value.id
-                else:
-                    data[field_name] = value
-        return data
-
-    def parse_data(self, model=None):
+    def parse_data(self, model=None, partial=False):
         """
         Parses and validates JSON request data against a specified Peewee model's schema.
 
-        This method is intended to ensure that the incoming request data contains only valid fields
-        that exist in the specified model's schema. It filters out any invalid fields (i.e., fields
-        not present in the model) and returns the validated data. If no model is specified, the method
-        attempts to use a default model associated with the resource class.
+        Validation uses the model's cached ModelSchema (helpers.schemahelper), built once per model, which
+        rejects fields the model doesn't have, checks required fields, lengths and choices and coerces dates,
+        decimals and booleans in a single pass. id, created_dt and updated_dt are read-only and ignored.
 
         Parameters:
         - model (Model, optional): The Peewee model class to validate the incoming data against.
           If None, the default model associated with the resource class is used.
+        - partial (bool, optional): Skip the required field check, for updates.
 
         Returns:
         - tuple: A tuple containing three elements:
             1. dict or None: The validated data as a dictionary if validation succeeds, or None if it fails.
             2. dict or None: An error message as a dictionary if validation fails, or None if it succeeds.
             3. int or None: An HTTP status code (400 for Bad Request) if validation fails, or None if it succeeds.
-
-        The method performs the following steps:
-        1. Extracts data from the incoming HTTP request's body, assuming JSON format.
-        2. Validates each key in the request data against the model's fields, filtering out any
-           fields not defined in the model.
-        3. Returns the filtered data along with any error information and HTTP status code as appropriate.
-
-        This approach helps in maintaining data integrity and ensures that only relevant and
-        valid data is processed by the resource methods.
         """
-        data = request.get_json()
         if model is None:
             model = self.model
-        invalid_columns = find_invalid_columns_in_table(model, data)
-        if invalid_columns:
-            return None, {'error': f'Invalid columns: {invalid_columns}'}, 400
-        return {k: v for k, v in data.items() if k not in invalid_columns}, None, None
+        data, error = schema_for(model).validate(request.get_json(silent=True), partial=partial)
+        if error:
+            return None, {'error': error}, 400
+        return data, None, None
 
     @staticmethod
     def handle_does_not_exist(e):
@@ -69,16 +467,35 @@ class BaseResource(Resource):
         """
         return {'error': 'Resource not found'}, 404
 
-    def get(self, object_id):
+    def get(self, object_id=None):
+        if object_id is None:
+            return self.list()
         try:
-            obj = self.model.get(self.model.id == object_id)
-            if obj.is_deleted:
-                return {'error': f'{self.model.__name__} has been deleted'}, 404
-            if obj.is_hidden:
-                return {'error': f'{self.model.__name__} is hidden'}, 403  # Using 403 Forbidden for hidden objects
-            return obj.to_dict(), 200
-        except self.model.DoesNotExist as e:
-            return self.handle_does_not_exist(e)
+            joins, prefetches = include_plan(self.model, self.includes, parse_includes(request.args))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        only, error = parse_fields(self.model, request.args)
+        if error:
+            return {'error': error}, 400
+        serializer = serializer_for(self.model, DEFAULT_EXCLUDE, only)
+        query = select_includes(self.model.select(*select_columns(serializer)), self.model, joins).where(self.model.id == object_id)
+        found = fetch_includes(query, prefetches)
+        if not found:
+            return self.handle_does_not_exist(self.model.DoesNotExist())
+        obj = found[0]
+        if obj.is_deleted:
+            return {'error': f'{self.model.__name__} has been deleted'}, 404
+        if obj.is_hidden:
+            return {'error': f'{self.model.__name__} is hidden'}, 403  # Using 403 Forbidden for hidden objects
+        related = [field.rel_model for name, field in joins] + [field.model for name, field in prefetches]
+        etag, last_modified = instance_validators(obj, related)
+        return conditional_response(etag, last_modified, lambda: (serialize_with_includes(obj, joins, prefetches, only=only), 200))
+
+    def list(self):
+        """
+        Collection GET, one keyset page of the model's rows filtered by the query string, see keyset_page.
+        """
+        return collection_response(self.model, request.args, self.includes)
 
     def post(self):
         valid_data, error, status_code = self.parse_data()
@@ -98,7 +515,7 @@ class BaseResource(Resource):
             return {'error': f'{self.model.__name__} not found'}, 404
 
     def put(self, object_id):
-        valid_data, error, status_code = self.parse_data()
+        valid_data, error, status_code = self.parse_data(partial=True)
         if error:
             return error, status_code
 
@@ -1,3 +1,14 @@
+from playhouse.migrate import SqliteMigrator, migrate
+
+SQLITE_MAX_VARIABLES = 999 # sqlite's default host parameter limit before 3.32, chunked statements stay under it
+
+def rows_per_statement(model):
+    """
+    Rows a multi-row INSERT into the model can carry without passing SQLITE_MAX_VARIABLES, counting every column
+    since insert_many also binds the defaults of columns the rows leave out.
+    """
+    return max(1, SQLITE_MAX_VARIABLES // len(model._meta.sorted_fields))
+
 # Define utility functions
 def remove_keys_starting_with_underscore(data):
     """
@@ -5,6 +16,74 @@ def remove_keys_starting_with_underscore(data):
     """
     return {k: v for k, v in data.items() if not k.startswith('_')}
 
+def add_missing_columns(model):
+    """
+    Adds columns declared on the model but missing from an existing table, create_tables(safe=True)
+    only creates tables that don't exist yet. New fields must be nullable or have a default. Run it before
+    create_tables: sqlite reads an index on a missing "column" as an index on a string constant, so the indexes
+    create_tables adds need their columns in place. Tables that don't exist yet are left to create_tables.
+    """
+    db = model._meta.database
+    if not db.table_exists(model._meta.table_name):
+        return
+    existing = {column.name for column in db.get_columns(model._meta.table_name)}
+    migrator = SqliteMigrator(db)
+    migrate(*[migrator.add_column(model._meta.table_name, field.column_name, field)
+              for field in model._meta.sorted_fields if field.column_name not in existing])
+
+def relax_not_null_columns(model):
+    """
+    Drops NOT NULL from columns the model now declares nullable, sqlite can only do it by copying the table so
+    foreign key enforcement is paused while it runs.
+    """
+    db = model._meta.database
+    columns = {column.name: column for column in db.get_columns(model._meta.table_name)}
+    relaxed = [field.column_name for field in model._meta.sorted_fields
+               if field.null and field.column_name in columns and not columns[field.column_name].null]
+    if not relaxed:
+        return
+    migrator = SqliteMigrator(db)
+    db.pragma('foreign_keys', 0)
+    try:
+        migrate(*[migrator.drop_not_null(model._meta.table_name, column) for column in relaxed])
+    finally:
+        db.pragma('foreign_keys', 1)
+
+def use_autoincrement(model, minimum_id=0):
+    """
+    Rebuilds a table created with a plain INTEGER PRIMARY KEY so its ids come from AUTOINCREMENT, sqlite hands
+    out max(id) + 1 otherwise and reuses the ids of deleted rows. Rows keep their ids, the sequence continues
+    from the highest one or minimum_id, whichever is larger, e.g. a watermark kept on ids the table has since
+    deleted. Foreign key enforcement is paused while the table is copied.
+    """
+    db = model._meta.database
+    table = model._meta.table_name
+    table_sql = db.execute_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if table_sql is None:
+        return
+    if 'AUTOINCREMENT' not in table_sql[0].upper():
+        columns = ', '.join(f'"{column.name}"' for column in db.get_columns(table))
+        db.pragma('foreign_keys', 0)
+        try:
+            with db.atomic():
+                for index in db.get_indexes(table):
+                    if index.name.startswith('sqlite_autoindex_'):
+                        continue
+                    db.execute_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+                db.execute_sql(f'ALTER TABLE "{table}" RENAME TO "{table}__old"')
+                model.create_table(safe=False)
+                db.execute_sql(f'INSERT INTO "{table}" ({columns}) SELECT {columns} FROM "{table}__old"')
+                db.execute_sql(f'DROP TABLE "{table}__old"')
+        finally:
+            db.pragma('foreign_keys', 1)
+    if minimum_id:
+        with db.atomic():
+            sequence = db.execute_sql('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+            if sequence is None:
+                db.execute_sql('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, minimum_id))
+            elif sequence[0] < minimum_id:
+                db.execute_sql('UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (minimum_id, table))
+
 def find_invalid_columns_in_table(table, data):
     """
     Verifies if the input data keys match the table's columns.
@@ -0,0 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+import multiprocessing
+import os
+import threading
+
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1' # werkzeug method string, stored hashes with other parameters are upgraded on login
+PASSWORD_HASH_WORKERS = max(1, min(2, (os.cpu_count() or 1) // 2)) # processes doing hash work, the other cores keep serving requests
+PASSWORD_HASH_QUEUE = 8 # hash jobs allowed to wait for a worker, later callers block up to PASSWORD_HASH_TIMEOUT
+PASSWORD_HASH_TIMEOUT = 10 # seconds a caller waits for a free slot before PasswordServiceBusy
+
+class PasswordServiceBusy(Exception):
+    """
+    every hashing slot stayed taken for PASSWORD_HASH_TIMEOUT seconds
+    """
+
+def hash_method(password_hash):
+    """
+    the method and parameters a stored hash was made with, 'scrypt:32768:8:1' for 'scrypt:32768:8:1$salt$hash'
+    """
+    return (password_hash or '').split('$', 1)[0]
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+def _verify(password_hash, password, method):
+    if not password_hash or not check_password_hash(password_hash, password):
+        return False, None
+    if hash_method(password_hash) != method:
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+class PasswordService:
+    """
+    runs password hashing in a small process pool, off the request threads
+
+    scrypt and pbkdf2 are deliberately slow. done inline, a burst of sign-ins keeps a worker's cpu busy and every
+    other route waits behind it. here at most workers hashes run at once in their own processes, with queue more
+    waiting for a slot, callers beyond that block on a semaphore and give up with PasswordServiceBusy after timeout
+    seconds instead of piling up. verify() also returns a fresh hash when the stored one was made with outdated
+    parameters, computed in the same job, so callers can upgrade the row after a successful login
+    """
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS, queue=PASSWORD_HASH_QUEUE,
+                 timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def hash(self, password):
+        """
+        a new hash of password with the current method
+        """
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """
+        returns (matches, upgraded hash or None), the upgraded hash is only set for a match on an outdated hash
+        """
+        return self._run(_verify, password_hash, password, self.method)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, forking a threaded web server can copy held locks into the children
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordServiceBusy()
+        try:
+            try:
+                return self._pool().submit(function, *args).result()
+            except BrokenProcessPool:
+                # a worker died (oom killer, signal), start a new pool and try once more
+                with self._lock:
+                    self._executor = None
+                return self._pool().submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+password_service = PasswordService()
+
+def benchmark(logins=64, concurrency=16, pings=2000):
+    """
+    sign-in rush: concurrency threads verify logins passwords while one thread times a cheap request-like task,
+    once hashing inline on the threads and once through PasswordService
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import statistics
+    import time
+
+    stored = generate_password_hash('correct horse battery staple', method=PASSWORD_HASH_METHOD)
+
+    def inline_verify(password_hash, password):
+        return _verify(password_hash, password, PASSWORD_HASH_METHOD)
+
+    def ping_latencies(stop):
+        latencies = []
+        while not stop.is_set() and len(latencies) < pings:
+            start = time.perf_counter()
+            sum(range(2000))
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.001)
+        return latencies
+
+    def run(label, verify):
+        stop = threading.Event()
+        with ThreadPoolExecutor(concurrency + 1) as threads:
+            pinger = threads.submit(ping_latencies, stop)
+            start = time.perf_counter()
+            results = list(threads.map(lambda i: verify(stored, 'correct horse battery staple'), range(logins)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            latencies = sorted(pinger.result())
+        assert all(ok for ok, upgraded in results)
+        p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+        print(f'{label:>8}: {logins / elapsed:7.1f} logins/s, other work p50 {statistics.median(latencies) * 1000:.3f} ms'
+              f' p95 {p95 * 1000:.3f} ms')
+
+    service = PasswordService()
+    service.verify(stored, 'warm up the pool')
+    print(f'{logins} logins from {concurrency} threads, {os.cpu_count()} cpus, {service.workers} hash workers')
+    run('inline', inline_verify)
+    run('service', service.verify)
+    service.shutdown()
+
+if __name__ == '__main__':
+    benchmark()
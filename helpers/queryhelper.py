@@ -0,0 +1,87 @@
+from flask import current_app, g, has_request_context, request
+from models.crm import query_listeners
+import contextlib
+import re
+
+QUERY_SHAPE_REPEAT_LIMIT = 10 # a statement shape run more often than this in one request is logged as a likely N+1
+QUERY_STATS_HEADERS = 'QUERY_STATS_HEADERS' # app.config key, send X-Query-Count/X-DB-Time, defaults to app.debug
+
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_VALUES_ROWS = re.compile(r'\(\?(?:, \.\.\.)?\)(?:\s*,\s*\(\?(?:, \.\.\.)?\))+')
+
+def statement_shape(sql):
+    """
+    The statement with IN (?, ?, ...) lists and multi-row VALUES (?, ...), (?, ...) collapsed, so the same
+    query with a different number of ids or rows counts once
+    """
+    return _VALUES_ROWS.sub('(?, ...), ...', _PLACEHOLDER_LIST.sub('?, ...', sql))
+
+class QueryStats:
+    """
+    statements run while handling one request, kept on flask.g
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}
+        self.expected_repeats = 0 # depth of expected_repeats() blocks, their statements aren't tallied by shape
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if self.expected_repeats:
+            return
+        shape = statement_shape(sql)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, limit=QUERY_SHAPE_REPEAT_LIMIT):
+        return [(shape, count) for shape, count in self.shapes.items() if count > limit]
+
+@contextlib.contextmanager
+def expected_repeats():
+    """
+    statements run inside the block still count towards X-Query-Count and X-DB-Time but are never reported as a
+    likely N+1, for bulk work that runs the same chunked SELECT ... IN or INSERT per chunk by design
+    """
+    stats = g.get('query_stats') if has_request_context() else None
+    if stats is None:
+        yield
+        return
+    stats.expected_repeats += 1
+    try:
+        yield
+    finally:
+        stats.expected_repeats -= 1
+
+def _record_query(sql, seconds):
+    if has_request_context():
+        stats = g.get('query_stats')
+        if stats is not None:
+            stats.record(sql, seconds)
+
+def _start_request():
+    g.query_stats = QueryStats()
+
+def _finish_request(response):
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return response
+    for shape, count in stats.repeated():
+        current_app.logger.warning('%s %s ran the same statement %d times, likely an N+1: %s',
+                                   request.method, request.path, count, shape)
+    if current_app.config.get(QUERY_STATS_HEADERS, current_app.debug):
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-DB-Time'] = f'{stats.seconds * 1000:.3f}ms'
+    return response
+
+def init_query_instrumentation(app):
+    """
+    count and time the SQL each request runs, warn about repeated statements and optionally send
+    X-Query-Count and X-DB-Time response headers
+
+    statements a streamed body runs after the response started are not included
+    """
+    if _record_query not in query_listeners:
+        query_listeners.append(_record_query)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,66 @@
+from functools import reduce
+
+# from helpers.schedulehelper import segments_to_bitmap, minute_of_week, allows
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+BITMAP_BYTES = MINUTES_PER_WEEK // 8 # 1260 bytes, one bit per minute of the week starting Monday 00:00
+
+def minute_of_day(value):
+    """
+    'HH:MM' to minutes past midnight, None if it isn't a time
+    """
+    try:
+        hours, minutes = value.strip().split(':')
+        minute = int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return None
+    return minute if 0 <= minute <= MINUTES_PER_DAY else None
+
+def minute_of_week(dt):
+    """
+    bit position of a datetime in a schedule bitmap
+    """
+    return dt.weekday() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+def parse_time_segments(pairs):
+    """
+    ('HH:MM', 'HH:MM') pairs to (start, end) minute ranges, end exclusive
+
+    a pair with equal start and end is unused, one that ends before it starts runs past midnight
+    """
+    segments = []
+    for start, end in pairs:
+        start, end = minute_of_day(start), minute_of_day(end)
+        if start is None or end is None or start == end:
+            continue
+        if start < end:
+            segments.append((start, end))
+        else:
+            segments.extend(((start, MINUTES_PER_DAY), (0, end)))
+    return segments
+
+def segments_to_bitmap(segments, days=range(7)):
+    """
+    daily (start, end) minute ranges repeated on the given weekdays (0 is Monday) as a minute-of-week bitmap
+    """
+    day_mask = 0
+    for start, end in segments:
+        day_mask |= (1 << end) - (1 << start)
+    return reduce(lambda bitmap, day: bitmap | day_mask << (day * MINUTES_PER_DAY), days, 0)
+
+def allows(bitmap, minute):
+    return bitmap >> minute & 1 == 1
+
+def union(bitmaps):
+    return reduce(lambda a, b: a | b, bitmaps, 0)
+
+def intersection(bitmaps):
+    bitmaps = list(bitmaps)
+    return reduce(lambda a, b: a & b, bitmaps) if bitmaps else 0
+
+def bitmap_to_bytes(bitmap):
+    return bitmap.to_bytes(BITMAP_BYTES, 'little')
+
+def bitmap_from_bytes(data):
+    return int.from_bytes(bytes(data), 'little') if data else 0
@@ -0,0 +1,166 @@
+from peewee import (ForeignKeyField, AutoField, IntegerField, FloatField, DecimalField, BooleanField, DateTimeField,
+    DateField, TimeField, CharField)
+import datetime
+import decimal
+
+READ_ONLY_FIELDS = ('id', 'created_dt', 'updated_dt') # set by the database or on save, ignored in request bodies
+
+def _to_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('expects an integer')
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('expects an integer')
+
+def _to_float(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('expects a number')
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError('expects a number')
+
+def _to_decimal(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('expects a number')
+    try:
+        return decimal.Decimal(str(value))
+    except decimal.InvalidOperation:
+        raise ValueError('expects a number')
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in ('true', 'false', '1', '0'):
+        return value.lower() in ('true', '1')
+    raise ValueError('expects true or false')
+
+def _to_datetime(value):
+    if not isinstance(value, str):
+        raise ValueError('expects a YYYY-MM-DD HH:MM:SS string')
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('expects a YYYY-MM-DD HH:MM:SS string')
+
+def _to_date(value):
+    if not isinstance(value, str):
+        raise ValueError('expects a YYYY-MM-DD string')
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError('expects a YYYY-MM-DD string')
+
+def _to_time(value):
+    if not isinstance(value, str):
+        raise ValueError('expects a HH:MM:SS string')
+    try:
+        return datetime.time.fromisoformat(value)
+    except ValueError:
+        raise ValueError('expects a HH:MM:SS string')
+
+def _to_string(value):
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError('expects a string')
+    return str(value)
+
+def field_coercer(field):
+    """
+    The converter from a JSON value to what the field stores, it raises ValueError for a value that doesn't fit.
+    """
+    if isinstance(field, ForeignKeyField):
+        return field_coercer(field.rel_field)
+    if isinstance(field, BooleanField):
+        return _to_bool
+    if isinstance(field, (IntegerField, AutoField)):
+        return _to_int
+    if isinstance(field, DecimalField):
+        return _to_decimal
+    if isinstance(field, FloatField):
+        return _to_float
+    if isinstance(field, DateTimeField):
+        return _to_datetime
+    if isinstance(field, DateField):
+        return _to_date
+    if isinstance(field, TimeField):
+        return _to_time
+    if field.field_type in ('VARCHAR', 'TEXT'):
+        return _to_string
+    return None
+
+class ModelSchema:
+    """
+    Request body validator for one model, built once by schema_for and reused for every request.
+
+    Each writable field gets a prepared (coercer, required, nullable, max length, choices) rule, so validating a
+    body is one pass over its keys. Foreign keys are accepted by field name or raw id column (creator or
+    creator_id), dates, times and datetimes as ISO strings, decimals as numbers or strings and booleans as
+    true/false, 1/0 or their string forms.
+    """
+    def __init__(self, model, read_only=READ_ONLY_FIELDS):
+        self.model = model
+        self.fields = [field for field in model._meta.sorted_fields if field.name not in read_only]
+        self.read_only = set(read_only)
+        self._by_key = {}
+        for field in self.fields:
+            self._by_key[field.name] = self._by_key[field.column_name] = field
+        self._coercers = {field.name: field_coercer(field) for field in self.fields}
+        self.required = [field.name for field in self.fields
+                         if not field.null and field.default is None and not field.primary_key]
+
+    def validate(self, data, partial=False, ignore_unknown=False):
+        """
+        Checks and coerces a JSON object in one pass.
+
+        :param data: The decoded request body.
+        :param partial: Skip the required field check, for updates.
+        :param ignore_unknown: Drop keys that are not fields instead of rejecting the body.
+        :return: A tuple of ({field name: value}, None) on success or (None, error message) on failure.
+        """
+        if not isinstance(data, dict):
+            return None, 'Expected a JSON object'
+        values, unknown = {}, []
+        for key, value in data.items():
+            field = self._by_key.get(key)
+            if field is None:
+                if key not in self.read_only:
+                    unknown.append(key)
+                continue
+            if value is None:
+                if not field.null:
+                    return None, f'{key} cannot be null'
+                values[field.name] = None
+                continue
+            coerce = self._coercers[field.name]
+            try:
+                value = coerce(value) if coerce else value
+            except (TypeError, ValueError) as e:
+                return None, f'Invalid value for {key}: {e}'
+            if isinstance(field, CharField) and len(value) > field.max_length:
+                return None, f'{key} is longer than {field.max_length} characters'
+            if field.choices and value not in [choice[0] if isinstance(choice, (tuple, list)) else choice
+                                               for choice in field.choices]:
+                return None, f'{key} must be one of {list(field.choices)}'
+            values[field.name] = value
+        if unknown and not ignore_unknown:
+            return None, f'Invalid columns: {unknown}'
+        if not partial:
+            missing = [name for name in self.required if name not in values]
+            if missing:
+                return None, f'Missing required parameters {missing}'
+        return values, None
+
+_schemas = {}
+
+def schema_for(model, read_only=READ_ONLY_FIELDS):
+    """
+    The cached ModelSchema of a model, built on first use.
+    """
+    key = (model, tuple(read_only))
+    schema = _schemas.get(key)
+    if schema is None:
+        schema = _schemas[key] = ModelSchema(model, read_only)
+    return schema
@@ -0,0 +1,159 @@
+from peewee import (ForeignKeyField, DateTimeField, DateField, TimeField, DecimalField, BooleanField, BlobField, JOIN,
+    prefetch)
+import base64
+import decimal
+
+DEFAULT_EXCLUDE = ('is_deleted',)
+
+def _as_string(value):
+    return None if value is None else str(value)
+
+def _as_bool(value):
+    return None if value is None else bool(value)
+
+def _as_base64(value):
+    return None if value is None else base64.b64encode(bytes(value)).decode('utf-8')
+
+def _decimal_encoder(field):
+    places = decimal.Decimal(1).scaleb(-field.decimal_places)
+    def encode(value):
+        if value is None:
+            return None
+        # sqlite hands back a float for NUMERIC columns, go through str to keep the stored digits
+        return str(decimal.Decimal(str(value)).quantize(places))
+    return encode
+
+def field_encoder(field):
+    """
+    The converter from a stored or python value to JSON for one field, None when the value passes through as is.
+    """
+    if isinstance(field, ForeignKeyField):
+        return None
+    if isinstance(field, (DateTimeField, DateField, TimeField)):
+        return _as_string
+    if isinstance(field, DecimalField):
+        return _decimal_encoder(field)
+    if isinstance(field, BooleanField):
+        return _as_bool
+    if isinstance(field, BlobField):
+        return _as_base64
+    return None
+
+def field_key(field):
+    """
+    The JSON key of a field, foreign keys are emitted as their raw id column (zone_id).
+    """
+    return field.column_name if isinstance(field, ForeignKeyField) else field.name
+
+class ModelSerializer:
+    """
+    JSON encoder for one model, built once by serializer_for and reused for every row.
+
+    The field list, keys and per-field converters are worked out up front, so encoding a row is a
+    single pass over prepared (key, converter) pairs. Foreign keys come from the raw id column and
+    never load the related row. Dates and times are 'YYYY-MM-DD HH:MM:SS' strings, decimals are
+    strings with the field's decimal places and blobs are base64. only narrows it to a sparse fieldset, the
+    other columns are then never selected by select()/rows().
+    """
+    def __init__(self, model, exclude=DEFAULT_EXCLUDE, only=None):
+        self.model = model
+        self.fields = [field for field in model._meta.sorted_fields
+                       if field.name not in exclude and (only is None or field.name in only)]
+        self.keys = [field_key(field) for field in self.fields]
+        self._plan = [(key, field.name, field_encoder(field)) for key, field in zip(self.keys, self.fields)]
+
+    def instance(self, obj):
+        """
+        Encodes a model instance from its loaded values, without touching relation attributes.
+        """
+        data = obj.__data__
+        return {key: encode(data.get(name)) if encode else data.get(name) for key, name, encode in self._plan}
+
+    def select(self, query=None):
+        """
+        The query narrowed to the serialized columns, in the order rows() expects them.
+        """
+        query = self.model.select() if query is None else query
+        return query.select(*self.fields)
+
+    def rows(self, query=None):
+        """
+        Encodes every row of a query straight from the database cursor, no model instances are built.
+        """
+        return list(self.iterate(query))
+
+    def iterate(self, query=None):
+        """
+        Like rows(), but yields each encoded row as the cursor reads it, for results too big to hold in memory.
+        """
+        cursor = self.model._meta.database.execute(self.select(query))
+        plan = [(key, encode) for key, name, encode in self._plan]
+        for row in cursor:
+            yield {key: encode(value) if encode else value for (key, encode), value in zip(plan, row)}
+
+_serializers = {}
+
+def serializer_for(model, exclude=DEFAULT_EXCLUDE, only=None):
+    """
+    The cached ModelSerializer of a model, built on first use.
+    """
+    key = (model, tuple(exclude), None if only is None else tuple(sorted(only)))
+    serializer = _serializers.get(key)
+    if serializer is None:
+        serializer = _serializers[key] = ModelSerializer(model, exclude, only)
+    return serializer
+
+def serialize(obj, exclude=DEFAULT_EXCLUDE):
+    return serializer_for(type(obj), exclude).instance(obj)
+
+def include_plan(model, relations, names):
+    """
+    Splits requested includes into foreign keys to JOIN and reverse relations to prefetch.
+
+    relations is a resource's declarative {include name: ForeignKeyField}, a foreign key on the model itself is
+    a to-one include loaded with a JOIN, a foreign key on another model that points at this one is a to-many
+    include loaded with one prefetch query. Raises ValueError for a name the resource doesn't declare.
+    """
+    unknown = [name for name in names if name not in relations]
+    if unknown:
+        raise ValueError(f'Unknown include {unknown}, available includes are {sorted(relations)}')
+    joins = [(name, relations[name]) for name in names if relations[name].model is model]
+    prefetches = [(name, relations[name]) for name in names if relations[name].model is not model]
+    return joins, prefetches
+
+def select_includes(query, model, joins):
+    """
+    Adds a LEFT OUTER JOIN per to-one include, the related row lands on the instance without a query of its own.
+    """
+    for name, field in joins:
+        related = field.rel_model.alias()
+        query = (query
+                 .select_extend(*[getattr(related, f.name) for f in field.rel_model._meta.sorted_fields])
+                 .join_from(model, related, JOIN.LEFT_OUTER, on=(field == getattr(related, field.rel_field.name)), attr=field.name))
+    return query
+
+def fetch_includes(query, prefetches):
+    """
+    Runs the query, plus one query per to-many include, soft-deleted related rows are left out.
+    """
+    if not prefetches:
+        return list(query)
+    subqueries = []
+    for name, field in prefetches:
+        subquery = field.model.select()
+        if 'is_deleted' in field.model._meta.fields:
+            subquery = subquery.where(field.model._meta.fields['is_deleted'] == False)
+        subqueries.append(subquery)
+    return prefetch(query, *subqueries)
+
+def serialize_with_includes(obj, joins, prefetches, exclude=DEFAULT_EXCLUDE, only=None):
+    """
+    Encodes an instance fetched by select_includes/fetch_includes with its includes nested under their names.
+    """
+    data = serializer_for(type(obj), exclude, only).instance(obj)
+    for name, field in joins:
+        related = obj.__rel__.get(field.name)
+        data[name] = serialize(related) if related is not None else None
+    for name, field in prefetches:
+        data[name] = [serialize(child) for child in getattr(obj, field.backref)]
+    return data
@@ -0,0 +1,42 @@
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+SESSION_COOKIE = 'crm_session'
+SESSION_SALT = 'crm-session'
+SESSION_MAX_AGE = 14 * 24 * 3600 # seconds a login stays valid, the cookie expires with it
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt=SESSION_SALT)
+
+def issue_session_token(person_id, session_version):
+    """
+    A signed, timestamped token naming the person and the PersonCredentials.session_version it was issued under.
+
+    :param person_id: The logged in person.
+    :param session_version: The login's current session_version, bumping it in the database revokes the token.
+    :return: The token as a URL safe string, for the SESSION_COOKIE cookie.
+    """
+    return _serializer().dumps({'person_id': person_id, 'version': session_version})
+
+def read_session_token(token, max_age=SESSION_MAX_AGE):
+    """
+    Checks a token's signature and age without touching the database.
+
+    :param token: The SESSION_COOKIE value, may be None.
+    :param max_age: Seconds after issue the token is rejected.
+    :return: A tuple of (person_id, session_version), or (None, None) for a missing, forged or expired token.
+    """
+    if not token:
+        return None, None
+    try:
+        payload = _serializer().loads(token, max_age=max_age)
+    except (SignatureExpired, BadSignature):
+        return None, None
+    if not isinstance(payload, dict):
+        return None, None
+    return payload.get('person_id'), payload.get('version')
+
+def set_session_cookie(response, person_id, session_version):
+    response.set_cookie(SESSION_COOKIE, issue_session_token(person_id, session_version), max_age=SESSION_MAX_AGE,
+                        httponly=True, samesite='Lax')
+    return response
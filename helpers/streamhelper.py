@@ -0,0 +1,71 @@
+from flask import Response, request, stream_with_context
+import json
+import zlib
+
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+STREAM_BUFFER_BYTES = 64 * 1024 # encoded rows are sent in pieces of about this size
+STREAM_GZIP_LEVEL = 6
+
+def encode_rows(rows, stream_format):
+    """
+    Encodes an iterable of dicts as one JSON array ('json') or one JSON document per line ('ndjson').
+
+    Rows are encoded one at a time and yielded in pieces of about STREAM_BUFFER_BYTES, so only the current
+    piece is ever held in memory.
+    """
+    buffer, size = ['['] if stream_format == 'json' else [], 0
+    separator = ''
+    for row in rows:
+        if stream_format == 'json':
+            text = separator + json.dumps(row)
+            separator = ','
+        else:
+            text = json.dumps(row) + '\n'
+        buffer.append(text)
+        size += len(text)
+        if size >= STREAM_BUFFER_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if stream_format == 'json':
+        buffer.append(']')
+    yield ''.join(buffer).encode('utf-8')
+
+def gzip_chunks(chunks):
+    """
+    Gzips a stream of byte pieces on the fly, each piece is flushed so the client can decode as it arrives.
+    """
+    compressor = zlib.compressobj(STREAM_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def parse_stream_format(args):
+    """
+    The stream=json|ndjson argument of a GET.
+
+    :return: A tuple of (format or None when not streaming, None) on success or (None, error message) on failure.
+    """
+    stream_format = args.get('stream')
+    if stream_format is None:
+        return None, None
+    if stream_format not in STREAM_FORMATS:
+        return None, f'stream must be one of {list(STREAM_FORMATS)}'
+    return stream_format, None
+
+def streaming_response(rows, stream_format, headers=None):
+    """
+    A response that encodes rows while they are sent, gzipped when the client's Accept-Encoding allows it.
+
+    :param rows: An iterable of dicts, ideally a generator reading a database cursor.
+    :param stream_format: 'json' for a JSON array or 'ndjson' for one JSON document per line.
+    :param headers: Extra response headers.
+    :return: A Flask Response with a streamed body.
+    """
+    chunks = encode_rows(rows, stream_format)
+    headers = dict(headers or {}, Vary='Accept-Encoding')
+    if request.accept_encodings.quality('gzip') > 0:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype=STREAM_FORMATS[stream_format], headers=headers)
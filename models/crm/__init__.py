@@ -1,10 +1,36 @@
-from peewee import Model, DateTimeField, BooleanField, SQL, TextField, BlobField
+from peewee import DateTimeField, BooleanField, SQL, TextField, BlobField, CharField, IntegerField
+from playhouse.signals import Model, pre_save # sends pre/post save and delete signals so derived tables and caches can follow writes
 from playhouse.sqlite_ext import SqliteExtDatabase
+from .blobstore import blob_store, guess_mime_type
+import datetime
+import time
 
 database_file = 'crm.sqlite'
 
+# callables run after a transaction spanning several API operations rolls back, so in-memory caches that
+# followed its writes through signals drop what they saw
+rollback_hooks = []
+
+# callables taking (sql, seconds) for every statement the database runs, see helpers.queryhelper
+query_listeners = []
+
+class InstrumentedSqliteExtDatabase(SqliteExtDatabase):
+    """
+    SqliteExtDatabase that times every statement and reports it to query_listeners
+    """
+    def execute_sql(self, sql, params=None, commit=None):
+        if not query_listeners:
+            return super().execute_sql(sql, params, commit)
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params, commit)
+        finally:
+            elapsed = time.perf_counter() - start
+            for listener in query_listeners:
+                listener(sql, elapsed)
+
 def get_database(filename):
-    db = SqliteExtDatabase(filename, pragmas=(
+    db = InstrumentedSqliteExtDatabase(filename, pragmas=(
         ('cache_size', -1024 * 512),  # 512MB page-cache.
         ('journal_mode', 'wal'),  # Use WAL-mode (you should always use this!) allows reads to happen while writes occur
         ('foreign_keys', 1)))  # Enforce foreign-key constraint in sqlite (disabled by default)
@@ -19,13 +45,41 @@ class BaseModel(RootModel):
     these attributes apply to every table automatically
     """
     created_dt = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')]) # object creation
-    updated_dt = DateTimeField(null=True) # object last updated
+    updated_dt = DateTimeField(null=True, index=True) # object last updated, set on every save and update(), drives ETag/Last-Modified
     is_deleted = BooleanField(default=False) # support soft deletes
     is_hidden = BooleanField(default=False) # support hiding things from view
 
+    @classmethod
+    def update(cls, __data=None, **update):
+        """
+        bulk updates stamp updated_dt too unless the caller sets it
+        """
+        explicit = set(update) | {getattr(key, 'name', key) for key in (__data or {})}
+        if 'updated_dt' not in explicit:
+            update['updated_dt'] = datetime.datetime.now()
+        return super().update(__data, **update)
+
+@pre_save()
+def _stamp_updated_dt(sender, instance, created):
+    if isinstance(instance, BaseModel):
+        instance.updated_dt = datetime.datetime.now()
+
 class FileModel(BaseModel):
     """
-    inheritable file model
+    inheritable file model, the bytes live in the blob store under sha256
     """
     filename = TextField()
-    data = BlobField()
+    sha256 = CharField(max_length=64, null=True, index=True) # blob store key, also the file's strong ETag
+    size = IntegerField(null=True) # bytes
+    mime_type = CharField(max_length=128, null=True)
+    data = BlobField(null=True) # legacy base64 upload, moved out by blobstore.move_file_data
+
+    def attach(self, upload, filename, mime_type=None):
+        """
+        store an uploaded file object or bytes in the blob store and point this row at it, save() the row after
+        """
+        self.sha256, self.size = blob_store.put(upload)
+        self.filename = filename
+        self.mime_type = guess_mime_type(filename, mime_type)
+        self.data = None
+        return self
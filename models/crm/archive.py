@@ -0,0 +1,127 @@
+from .cardaccess import DoorAccessLog, VolunteerAccessLog
+from .trafficrollup import update_door_traffic_rollups
+from .archivereader import ARCHIVE_DIRECTORY, archive_path, archived_years, archived_until, select_access_logs
+import datetime
+import os
+import sqlite3
+
+ARCHIVE_HOT_MONTHS = 6 # whole months of access logs kept in crm.sqlite, older rows move to per-year archive files
+ARCHIVE_RETENTION_YEARS = None # archive years older than this are deleted, None keeps them forever
+ARCHIVED_MODELS = (DoorAccessLog, VolunteerAccessLog)
+
+def hot_cutoff(now=None, hot_months=ARCHIVE_HOT_MONTHS):
+    """
+    first day of the oldest month that stays in the hot database
+    """
+    now = now or datetime.datetime.now()
+    month_index = now.year * 12 + now.month - 1 - hot_months
+    return datetime.datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def _attach(db, year, alias):
+    db.execute_sql(f'ATTACH DATABASE ? AS {alias}', (archive_path(year),))
+
+def _detach(db, alias):
+    db.execute_sql(f'DETACH DATABASE {alias}')
+
+def _ensure_archive_table(db, model, alias):
+    """
+    create or widen the archive copy of a log table so it has every column of the hot table
+    """
+    table = model._meta.table_name
+    columns = db.get_columns(table)
+    archived = {row[1] for row in db.execute_sql(f'PRAGMA {alias}.table_info({table})').fetchall()}
+    if not archived:
+        definitions = ', '.join(f'"{column.name}" {column.data_type}' + (' PRIMARY KEY' if column.primary_key else '')
+                                for column in columns)
+        db.execute_sql(f'CREATE TABLE {alias}."{table}" ({definitions})')
+        db.execute_sql(f'CREATE INDEX {alias}."{table}_event_dt" ON "{table}" (event_dt)')
+    for column in columns:
+        if archived and column.name not in archived:
+            db.execute_sql(f'ALTER TABLE {alias}."{table}" ADD COLUMN "{column.name}" {column.data_type}')
+    # rows are matched on log_sha1 when moving, archives written before that only had the event_dt index
+    db.execute_sql(f'CREATE INDEX IF NOT EXISTS {alias}."{table}_log_sha1" ON "{table}" (log_sha1)')
+    return [column.name for column in columns]
+
+def archive_access_logs(now=None, hot_months=ARCHIVE_HOT_MONTHS):
+    """
+    move access log rows older than the hot window into archive/access_<year>.sqlite
+
+    rows are matched on log_sha1: a row is copied unless its log_sha1 is already archived, keeping its id when the
+    archive doesn't hold that id yet (ids were reused before the log tables used AUTOINCREMENT), and only rows
+    whose log_sha1 is in the archive are deleted. each year is copied and deleted in one transaction, so rerunning
+    after an interruption is safe. returns {table name: rows moved}
+    """
+    os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+    # rows leave crm.sqlite for good, count them first
+    update_door_traffic_rollups()
+    cutoff = hot_cutoff(now, hot_months)
+    moved = {}
+    for model in ARCHIVED_MODELS:
+        db = model._meta.database
+        table = model._meta.table_name
+        moved[table] = 0
+        oldest = model.select(model.event_dt).where(model.event_dt < cutoff).order_by(model.event_dt).limit(1).scalar()
+        if oldest is None:
+            continue
+        oldest = model.event_dt.python_value(oldest)
+        for year in range(oldest.year, cutoff.year + 1):
+            period_start = datetime.datetime(year, 1, 1)
+            period_end = min(datetime.datetime(year + 1, 1, 1), cutoff)
+            if period_start >= period_end:
+                continue
+            _attach(db, year, 'archive')
+            try:
+                names = _ensure_archive_table(db, model, 'archive')
+                column_list = ', '.join(f'"{name}"' for name in names)
+                renumbered_list = ', '.join(f'"{name}"' for name in names if name != 'id')
+                in_period = 'm.event_dt >= ? AND m.event_dt < ?'
+                not_archived = f'NOT EXISTS (SELECT 1 FROM archive."{table}" a WHERE a.log_sha1 = m.log_sha1)'
+                params = (str(period_start), str(period_end))
+                with db.atomic():
+                    db.execute_sql(f'INSERT INTO archive."{table}" ({column_list}) SELECT {column_list} '
+                                   f'FROM main."{table}" m WHERE {in_period} AND {not_archived} '
+                                   f'AND NOT EXISTS (SELECT 1 FROM archive."{table}" a WHERE a.id = m.id)', params)
+                    db.execute_sql(f'INSERT INTO archive."{table}" ({renumbered_list}) SELECT {renumbered_list} '
+                                   f'FROM main."{table}" m WHERE {in_period} AND {not_archived}', params)
+                    cursor = db.execute_sql(f'DELETE FROM main."{table}" WHERE id IN (SELECT m.id FROM main."{table}" m '
+                                            f'WHERE {in_period} AND NOT {not_archived})', params)
+                    moved[table] += cursor.rowcount
+            finally:
+                _detach(db, 'archive')
+    return moved
+
+def apply_retention(now=None, retention_years=ARCHIVE_RETENTION_YEARS):
+    """
+    delete archive files for years older than the retention window, returns the years removed
+    """
+    if retention_years is None:
+        return []
+    now = now or datetime.datetime.now()
+    expired = [year for year in archived_years() if year < now.year - retention_years]
+    for year in expired:
+        os.remove(archive_path(year))
+    return expired
+
+def compact(vacuum_hot=False):
+    """
+    vacuum the archive files and truncate the hot database WAL, vacuum_hot also rewrites crm.sqlite
+    """
+    for year in archived_years():
+        connection = sqlite3.connect(archive_path(year))
+        try:
+            connection.execute('VACUUM')
+        finally:
+            connection.close()
+    db = DoorAccessLog._meta.database
+    db.execute_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    if vacuum_hot:
+        db.execute_sql('VACUUM')
+
+def run_archive_job(now=None):
+    """
+    archive, retention and compaction in one go, meant for a nightly `flask archive-access-logs`
+    """
+    moved = archive_access_logs(now)
+    removed = apply_retention(now)
+    compact()
+    return {'moved': moved, 'removed_years': removed}
@@ -0,0 +1,106 @@
+from peewee import chunked
+import os
+import re
+import sqlite3
+
+ARCHIVE_DIRECTORY = 'archive'
+ARCHIVE_FILE_PATTERN = re.compile(r'^access_(\d{4})\.sqlite$')
+ARCHIVE_LOOKUP_CHUNK_SIZE = 900 # log_sha1 values per IN (...), under sqlite's default 999 host parameter limit
+
+def archive_path(year):
+    return os.path.join(ARCHIVE_DIRECTORY, f'access_{year}.sqlite')
+
+def archived_years():
+    if not os.path.isdir(ARCHIVE_DIRECTORY):
+        return []
+    matches = (ARCHIVE_FILE_PATTERN.match(name) for name in os.listdir(ARCHIVE_DIRECTORY))
+    return sorted(int(match.group(1)) for match in matches if match)
+
+def _archive_columns(connection, table):
+    return {row[1] for row in connection.execute(f'PRAGMA table_info("{table}")').fetchall()}
+
+# (table, archive file, modified time, size) -> newest archived event_dt, so the check costs a stat per call
+_archived_until_cache = {}
+
+def archived_until(model):
+    """
+    event_dt of the newest DoorAccessLog or VolunteerAccessLog row moved to the archive, None before the first move
+    """
+    table = model._meta.table_name
+    for year in reversed(archived_years()):
+        path = archive_path(year)
+        stat = os.stat(path)
+        key = (table, path, stat.st_mtime_ns, stat.st_size)
+        if key not in _archived_until_cache:
+            connection = sqlite3.connect(path)
+            try:
+                newest = None
+                if _archive_columns(connection, table):
+                    newest = connection.execute(f'SELECT MAX(event_dt) FROM "{table}"').fetchone()[0]
+            finally:
+                connection.close()
+            _archived_until_cache[key] = model.event_dt.python_value(newest)
+        if _archived_until_cache[key] is not None:
+            return _archived_until_cache[key]
+    return None
+
+def archived_log_sha1s(model, log_sha1s, years):
+    """
+    the log_sha1 values among log_sha1s already moved to the archive files of the given years
+    """
+    table = model._meta.table_name
+    found = set()
+    for year in sorted(set(years) & set(archived_years())):
+        connection = sqlite3.connect(archive_path(year))
+        try:
+            if not _archive_columns(connection, table):
+                continue
+            for batch in chunked(list(log_sha1s), ARCHIVE_LOOKUP_CHUNK_SIZE):
+                placeholders = ', '.join('?' * len(batch))
+                found.update(sha1 for (sha1,) in connection.execute(
+                    f'SELECT log_sha1 FROM "{table}" WHERE log_sha1 IN ({placeholders})', batch))
+        finally:
+            connection.close()
+    return found
+
+def select_access_logs(model, start_dt, end_dt, where_sql='', params=(), limit=None):
+    """
+    rows of DoorAccessLog or VolunteerAccessLog between two datetimes as column name dicts ordered by event_dt, id
+
+    the hot table and only the archive years the range overlaps are read, a range starting after archived_until
+    is a plain query on the hot table. archives are opened on their own connections rather than attached, so this also works inside a
+    transaction on crm.sqlite. where_sql is an extra condition such as 'person_id = ?' with its params, limit
+    caps the rows read from each database and returned
+    """
+    db = model._meta.database
+    table = model._meta.table_name
+    start_dt, end_dt = str(start_dt), str(end_dt)
+    archive_end = archived_until(model)
+    if archive_end is None or start_dt > str(archive_end):
+        years = []
+    else:
+        years = [year for year in archived_years() if int(start_dt[:4]) <= year <= min(int(end_dt[:4]), archive_end.year)]
+
+    columns = [column.name for column in db.get_columns(table)]
+    condition = 'event_dt >= ? AND event_dt <= ?' + (f' AND ({where_sql})' if where_sql else '')
+    if limit is not None:
+        condition += f' ORDER BY event_dt, id LIMIT {int(limit)}'
+    all_params = (start_dt, end_dt) + tuple(params)
+    select_list = ', '.join(f'"{name}"' for name in columns)
+    rows = db.execute_sql(f'SELECT {select_list} FROM "{table}" WHERE {condition}', all_params).fetchall()
+    for year in years:
+        connection = sqlite3.connect(archive_path(year))
+        try:
+            archived = _archive_columns(connection, table)
+            if not archived:
+                continue
+            select_list = ', '.join(f'"{name}"' if name in archived else f'NULL AS "{name}"' for name in columns)
+            rows.extend(connection.execute(f'SELECT {select_list} FROM "{table}" WHERE {condition}', all_params).fetchall())
+        finally:
+            connection.close()
+
+    fields = model._meta.columns
+    converters = [fields[name].python_value if name in fields else (lambda value: value) for name in columns]
+    records = [{name: convert(value) for name, convert, value in zip(columns, converters, row)} for row in rows]
+    records.sort(key=lambda record: (record['event_dt'], record['id']))
+    return records if limit is None else records[:limit]
@@ -0,0 +1,146 @@
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+
+BLOB_DIRECTORY = 'blobs' # uploaded files, next to crm.sqlite, one file per distinct content named by its sha256
+BLOB_CHUNK_SIZE = 64 * 1024
+BLOB_PRUNE_GRACE_SECONDS = 3600 # unreferenced blobs younger than this may belong to an upload still being saved
+BLOB_MIGRATE_BATCH_SIZE = 100 # FileModel rows moved out of sqlite per transaction
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+def guess_mime_type(filename, declared=None):
+    """
+    the declared content type of an upload when it says anything useful, otherwise a guess from the file name
+    """
+    if declared and declared != DEFAULT_MIME_TYPE:
+        return declared
+    return mimetypes.guess_type(filename or '')[0] or DEFAULT_MIME_TYPE
+
+class BlobStore:
+    """
+    content-addressed file storage on disk
+
+    bytes are written once under directory/ab/cd/<sha256>, identical uploads share one file and nothing is ever
+    modified in place, so a blob can be served, cached and backed up by its hash. writes go to a temp file in
+    the same directory tree, are hashed while streaming and renamed into place, readers never see a partial blob
+    """
+    def __init__(self, directory=BLOB_DIRECTORY):
+        self.directory = directory
+
+    def path(self, sha256):
+        return os.path.join(self.directory, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.isfile(self.path(sha256))
+
+    def put(self, stream):
+        """
+        store a binary file object (read in BLOB_CHUNK_SIZE pieces) or bytes, returns (sha256, size)
+        """
+        if isinstance(stream, (bytes, bytearray, memoryview)):
+            chunks = [bytes(stream)]
+        else:
+            chunks = iter(lambda: stream.read(BLOB_CHUNK_SIZE), b'')
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        handle, temp_path = tempfile.mkstemp(prefix='.upload-', dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    temp.write(chunk)
+                temp.flush()
+                os.fsync(temp.fileno())
+            sha256 = digest.hexdigest()
+            if self.exists(sha256):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(self.path(sha256)), exist_ok=True)
+                os.replace(temp_path, self.path(sha256))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return sha256, size
+
+    def open(self, sha256):
+        return open(self.path(sha256), 'rb')
+
+    def read(self, sha256):
+        with self.open(sha256) as blob:
+            return blob.read()
+
+    def hashes(self):
+        """
+        (sha256, modified time) of every stored blob
+        """
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.startswith('.'):
+                    yield name, os.path.getmtime(os.path.join(root, name))
+
+    def delete(self, sha256):
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+blob_store = BlobStore()
+
+def legacy_file_bytes(data):
+    """
+    the file held in a FileModel.data column, uploads used to be stored there base64 encoded
+    """
+    data = bytes(data)
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return data
+
+def move_file_data(models, store=blob_store, batch_size=BLOB_MIGRATE_BATCH_SIZE):
+    """
+    move files still stored in the data column of FileModel tables into the blob store, returns rows moved per table
+
+    rows are read batch_size at a time and each batch is committed on its own, so an interrupted run resumes
+    where it stopped. run compact(vacuum_hot=True) from models.crm.archive afterwards to give the space back
+    """
+    moved = {}
+    for model in models:
+        moved[model._meta.table_name] = 0
+        while True:
+            rows = list(model
+                        .select(model.id, model.filename, model.data)
+                        .where(model.data.is_null(False))
+                        .limit(batch_size))
+            if not rows:
+                break
+            with model._meta.database.atomic():
+                for row in rows:
+                    sha256, size = store.put(legacy_file_bytes(row.data))
+                    (model
+                     .update(sha256=sha256, size=size, mime_type=guess_mime_type(row.filename), data=None)
+                     .where(model.id == row.id)
+                     .execute())
+            moved[model._meta.table_name] += len(rows)
+    return moved
+
+def prune_blobs(models, store=blob_store, grace_seconds=BLOB_PRUNE_GRACE_SECONDS):
+    """
+    delete blobs no FileModel row refers to any more, returns how many were removed
+    """
+    referenced = set()
+    for model in models:
+        referenced.update(sha256 for (sha256,) in model.select(model.sha256).where(model.sha256.is_null(False)).tuples())
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for sha256, modified in list(store.hashes()):
+        if sha256 not in referenced and modified < cutoff:
+            store.delete(sha256)
+            removed += 1
+    return removed
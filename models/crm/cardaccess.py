@@ -1,7 +1,17 @@
 from peewee import *
 from . import get_database, BaseModel, RootModel, database_file
-from .makerspace import Person
-from playhouse.sqlite_ext import JSONField
+from .makerspace import Person, Location
+from playhouse.sqlite_ext import JSONField, AutoIncrementField
+from playhouse.signals import pre_save, post_save, post_delete
+from helpers.dbhelper import add_missing_columns, use_autoincrement
+from .archivereader import archived_until, archived_log_sha1s, select_access_logs
+from helpers.schedulehelper import (parse_time_segments, segments_to_bitmap, bitmap_to_bytes, bitmap_from_bytes,
+    minute_of_week, allows, union, intersection)
+import datetime
+import heapq
+
+# rows per statement while ingesting, keeps 10 columns per row under sqlite's default 999 host parameter limit
+INGEST_CHUNK_SIZE = 90
 
 class Controller(RootModel):
     """
@@ -9,6 +19,7 @@ class Controller(RootModel):
     """
     controller = IntegerField()
     name = CharField(max_length=32)
+    location = ForeignKeyField(Location, null=True, backref='controllers') # building the doors lead into, for occupancy
 
 class DoorDirectionMap(RootModel):
     """
@@ -19,6 +30,10 @@ class DoorDirectionMap(RootModel):
     direction = CharField(max_length=3, constraints=[Check("direction IN ('in', 'out')")])
     exterior_door = BooleanField()
 
+# DoorProfiles columns schedule_bitmap is compiled from
+SCHEDULE_FIELDS = ('time_segment_1_start', 'time_segment_1_end', 'time_segment_2_start', 'time_segment_2_end',
+                   'time_segment_3_start', 'time_segment_3_end')
+
 class DoorProfiles(BaseModel):
     """
     store which door controller, door and time profile people have access to
@@ -34,11 +49,54 @@ class DoorProfiles(BaseModel):
     time_segment_3_start = CharField(max_length=5)
     time_segment_3_end = CharField(max_length=5)
     person = ForeignKeyField(Person)
+    schedule_bitmap = BlobField(null=True) # minute-of-week bitmap of the time segments, see helpers/schedulehelper.py, null until compiled
+
+    @classmethod
+    def update(cls, __data=None, **update):
+        """
+        the pre_save receiver below only compiles schedule_bitmap on save(), a bulk update that changes a time
+        segment clears it instead, so the schedule property compiles the new segments on read
+        """
+        changed = set(update) | {getattr(key, 'name', key) for key in (__data or {})}
+        if changed & set(SCHEDULE_FIELDS) and 'schedule_bitmap' not in changed:
+            update['schedule_bitmap'] = None
+        return super().update(__data, **update)
+
+    def compile_schedule(self):
+        return segments_to_bitmap(parse_time_segments((
+            (self.time_segment_1_start, self.time_segment_1_end),
+            (self.time_segment_2_start, self.time_segment_2_end),
+            (self.time_segment_3_start, self.time_segment_3_end),
+        )))
+
+    @property
+    def schedule(self):
+        """
+        the compiled bitmap as an int, compiled on the fly for rows written before the column existed
+        """
+        if self.schedule_bitmap is None:
+            return self.compile_schedule()
+        return bitmap_from_bytes(self.schedule_bitmap)
+
+    def in_date_range(self, at):
+        day = at.strftime('%Y-%m-%d')
+        return (not self.start_date or self.start_date <= day) and (not self.end_date or day <= self.end_date)
+
+    def is_open_at(self, at):
+        """
+        point in time check against the profile dates and schedule
+        """
+        return self.in_date_range(at) and allows(self.schedule, minute_of_week(at))
+
+@pre_save(sender=DoorProfiles)
+def _compile_door_profile_schedule(sender, instance, created):
+    instance.schedule_bitmap = bitmap_to_bytes(instance.compile_schedule())
 
 class VolunteerAccessLog(BaseModel):
     """
     volunteer access log
     """
+    id = AutoIncrementField() # ids of archived or deleted rows are never handed out again
     log_sha1 = CharField(max_length=40) # sha1 hash to prevent duplicate entries written between polling
     event_dt = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
     card_number = IntegerField()
@@ -50,46 +108,234 @@ class VolunteerAccessLog(BaseModel):
     access_granted = BooleanField()
     person = ForeignKeyField(Person)
 
-def calculate_volunteer_hours(person_id, start_date, end_date, checkin_controller=1, checkin_door=1, checkout_controller=2, checkout_door=2):
-    # Fetch records for the specified person within the given date range
-    # import datetime
-    # person_id = 123  # Replace with the actual person ID
-    # # Define the start and end dates for the calculation
-    # start_date = datetime.datetime(2023, 1, 1)  # January 1, 2023
-    # end_date = datetime.datetime(2023, 1, 31)   # January 31, 2023
-    # # Calculate the volunteer hours
-    # total_volunteer_hours = calculate_volunteer_hours(person_id, start_date, end_date)
-    # # Convert total duration to a more readable format (e.g., hours)
-    # hours = total_volunteer_hours.total_seconds() / 3600
-    # print(f"Total volunteer hours for person {person_id} from {start_date} to {end_date}: {hours} hours")
-    logs = (VolunteerAccessLog
-            .select()
-            .where(
-                (VolunteerAccessLog.person == person_id) &
-                (VolunteerAccessLog.event_dt >= start_date) &
-                (VolunteerAccessLog.event_dt <= end_date)
-            )
-            .order_by(VolunteerAccessLog.event_dt))
+    class Meta:
+        indexes = (
+            (('person', 'event_dt'), False),
+        )
 
-    total_duration = datetime.timedelta(0)
-    check_in_time = None
-
-    for log in logs:
-        if log.controller == checkin_controller and log.door == checkin_door:
-            check_in_time = log.event_dt
-        elif log.controller == checkout_controller and log.door == checkout_door and check_in_time:
-            duration = log.event_dt - check_in_time
-            total_duration += duration
+# controller and door volunteers swipe to check in and out, VolunteerSession is derived with these
+VOLUNTEER_CHECKIN_CONTROLLER = 1
+VOLUNTEER_CHECKIN_DOOR = 1
+VOLUNTEER_CHECKOUT_CONTROLLER = 2
+VOLUNTEER_CHECKOUT_DOOR = 2
+
+class VolunteerSession(RootModel):
+    """
+    check-in/check-out pairs derived from VolunteerAccessLog, kept up to date as logs are saved
+    """
+    person = ForeignKeyField(Person, backref='volunteer_sessions')
+    checkin_dt = DateTimeField()
+    checkout_dt = DateTimeField(null=True) # null while the volunteer is still checked in
+    duration_seconds = IntegerField(null=True)
+
+    class Meta:
+        indexes = (
+            (('person', 'checkin_dt'), False),
+            (('checkin_dt', 'checkout_dt'), False),
+        )
+
+def pair_volunteer_sessions(events, checkin_controller=VOLUNTEER_CHECKIN_CONTROLLER, checkin_door=VOLUNTEER_CHECKIN_DOOR,
+                            checkout_controller=VOLUNTEER_CHECKOUT_CONTROLLER, checkout_door=VOLUNTEER_CHECKOUT_DOOR):
+    """
+    pair check-ins with check-outs from (person_id, controller, door, event_dt) tuples ordered by person then time
+
+    a second check-in before a check-out restarts the session and a check-out without a check-in is ignored,
+    yields (person_id, checkin_dt, checkout_dt) with checkout_dt None for a session that is still open
+    """
+    current_person = check_in_time = None
+    for person_id, controller, door, event_dt in events:
+        if person_id != current_person:
+            if check_in_time:
+                yield current_person, check_in_time, None
+            current_person, check_in_time = person_id, None
+        if controller == checkin_controller and door == checkin_door:
+            check_in_time = event_dt
+        elif controller == checkout_controller and door == checkout_door and check_in_time:
+            yield person_id, check_in_time, event_dt
             check_in_time = None
+    if check_in_time:
+        yield current_person, check_in_time, None
+
+def _session_row(person_id, checkin_dt, checkout_dt):
+    duration = round((checkout_dt - checkin_dt).total_seconds()) if checkout_dt else None
+    return {'person': person_id, 'checkin_dt': checkin_dt, 'checkout_dt': checkout_dt, 'duration_seconds': duration}
+
+def _volunteer_events(where):
+    return (VolunteerAccessLog
+            .select(VolunteerAccessLog.person, VolunteerAccessLog.controller, VolunteerAccessLog.door, VolunteerAccessLog.event_dt)
+            .where(where)
+            .order_by(VolunteerAccessLog.person, VolunteerAccessLog.event_dt, VolunteerAccessLog.id)
+            .tuples())
+
+def _logged_volunteer_events(start_dt, end_dt, person_id=None):
+    """
+    the same tuples as _volunteer_events between two datetimes, read from crm.sqlite and the archive
+    """
+    where_sql, params = ('person_id = ?', (person_id,)) if person_id is not None else ('', ())
+    rows = select_access_logs(VolunteerAccessLog, start_dt, end_dt, where_sql, params)
+    rows.sort(key=lambda row: (row['person_id'], row['event_dt'], row['id']))
+    return [(row['person_id'], row['controller'], row['door'], row['event_dt']) for row in rows]
+
+def _replay_volunteer_sessions(person_id=None, after_dt=None):
+    """
+    drop sessions that ended after after_dt and rebuild them from the log, for one person or everyone
+
+    after_dt defaults to the newest archived log, sessions that ended by then were paired from logs since moved
+    to the archive and are kept. each person's replay starts after their last kept session, the part of the log
+    before the newest archived event is read through select_access_logs so a check-in already in the archive
+    still pairs with its check-out in crm.sqlite
+    """
+    archive_end = archived_until(VolunteerAccessLog)
+    keep_until = after_dt if after_dt is not None else archive_end
+    sessions = VolunteerSession.person == person_id if person_id is not None else True
+    stale = sessions
+    kept = {}
+    if keep_until is not None:
+        last_kept = (VolunteerSession
+                     .select(VolunteerSession.person, fn.MAX(VolunteerSession.checkout_dt))
+                     .where(sessions & (VolunteerSession.checkout_dt <= keep_until))
+                     .group_by(VolunteerSession.person)
+                     .tuples())
+        kept = {person: VolunteerSession.checkout_dt.python_value(checkout_dt) for person, checkout_dt in last_kept}
+        stale = sessions & (VolunteerSession.checkout_dt.is_null() | (VolunteerSession.checkout_dt > keep_until))
+
+    hot = True if person_id is None else VolunteerAccessLog.person == person_id
+    if person_id in kept:
+        hot &= VolunteerAccessLog.event_dt > kept[person_id]
+    archived = []
+    if archive_end is not None:
+        hot &= VolunteerAccessLog.event_dt > archive_end
+        # with no kept session to start after, the whole history is replayed
+        start_dt = min(kept.values()) if kept else datetime.datetime.min
+        if start_dt <= archive_end:
+            archived = _logged_volunteer_events(start_dt, archive_end, person_id)
+    events = (event for event in heapq.merge(archived, _volunteer_events(hot), key=lambda event: (event[0], event[3]))
+              if event[0] not in kept or event[3] > kept[event[0]])
+
+    VolunteerSession.delete().where(stale).execute()
+    rows = (_session_row(*session) for session in pair_volunteer_sessions(events))
+    for batch in chunked(rows, INGEST_CHUNK_SIZE):
+        VolunteerSession.insert_many(batch).execute()
+
+def update_volunteer_sessions(log):
+    """
+    fold one newly written VolunteerAccessLog row into VolunteerSession
+
+    in-order events only touch the person's open session, an event older than the person's latest one
+    replays their log from the last check-out before it
+    """
+    person_id = log.person_id
+    event_dt = VolunteerAccessLog.event_dt.python_value(log.event_dt)
+    if event_dt is None:
+        # written with the database default timestamp
+        event_dt = VolunteerAccessLog.get_by_id(log.id).event_dt
+
+    with VolunteerSession._meta.database.atomic():
+        out_of_order = (VolunteerAccessLog
+                        .select()
+                        .where((VolunteerAccessLog.person == person_id) &
+                               ((VolunteerAccessLog.event_dt > event_dt) |
+                                ((VolunteerAccessLog.event_dt == event_dt) & (VolunteerAccessLog.id > log.id))))
+                        .exists())
+        if out_of_order:
+            anchor = (VolunteerSession
+                      .select(fn.MAX(VolunteerSession.checkout_dt))
+                      .where((VolunteerSession.person == person_id) & (VolunteerSession.checkout_dt < event_dt))
+                      .scalar())
+            # without an earlier session the whole history is replayed, archived part included
+            _replay_volunteer_sessions(person_id, VolunteerSession.checkout_dt.python_value(anchor) or datetime.datetime.min)
+            return
+
+        open_session = VolunteerSession.get_or_none((VolunteerSession.person == person_id) & VolunteerSession.checkout_dt.is_null())
+        if log.controller == VOLUNTEER_CHECKIN_CONTROLLER and log.door == VOLUNTEER_CHECKIN_DOOR:
+            if open_session:
+                open_session.checkin_dt = event_dt
+                open_session.save()
+            else:
+                VolunteerSession.create(person=person_id, checkin_dt=event_dt)
+        elif log.controller == VOLUNTEER_CHECKOUT_CONTROLLER and log.door == VOLUNTEER_CHECKOUT_DOOR and open_session:
+            open_session.checkout_dt = event_dt
+            open_session.duration_seconds = _session_row(person_id, open_session.checkin_dt, event_dt)['duration_seconds']
+            open_session.save()
+
+def rebuild_volunteer_sessions(person_id=None):
+    """
+    recompute VolunteerSession from the log, for one person or everyone in a single ordered scan
+
+    sessions that ended by the newest archived log belong to archived logs and are kept
+    """
+    with VolunteerSession._meta.database.atomic():
+        _replay_volunteer_sessions(person_id)
+
+@post_save(sender=VolunteerAccessLog)
+def _volunteer_access_log_saved(sender, instance, created):
+    if created:
+        update_volunteer_sessions(instance)
+    else:
+        rebuild_volunteer_sessions(instance.person_id)
+
+@post_delete(sender=VolunteerAccessLog)
+def _volunteer_access_log_deleted(sender, instance):
+    rebuild_volunteer_sessions(instance.person_id)
+
+def calculate_volunteer_hours(person_id, start_date, end_date, checkin_controller=1, checkin_door=1, checkout_controller=2, checkout_door=2):
+    """
+    total time a volunteer spent checked in, counting sessions that start and end within the date range
 
+    import datetime
+    total_volunteer_hours = calculate_volunteer_hours(123, datetime.datetime(2023, 1, 1), datetime.datetime(2023, 1, 31))
+    hours = total_volunteer_hours.total_seconds() / 3600
+    """
+    doors = (checkin_controller, checkin_door, checkout_controller, checkout_door)
+    if doors == (VOLUNTEER_CHECKIN_CONTROLLER, VOLUNTEER_CHECKIN_DOOR, VOLUNTEER_CHECKOUT_CONTROLLER, VOLUNTEER_CHECKOUT_DOOR):
+        seconds = (VolunteerSession
+                   .select(fn.SUM(VolunteerSession.duration_seconds))
+                   .where(
+                       (VolunteerSession.person == person_id) &
+                       (VolunteerSession.checkin_dt >= start_date) &
+                       (VolunteerSession.checkout_dt <= end_date)
+                   )
+                   .scalar())
+        return datetime.timedelta(seconds=seconds or 0)
+
+    # VolunteerSession only tracks the configured doors, pair the raw log (archived years included) for any other combination
+    events = _logged_volunteer_events(start_date, end_date, person_id)
+    total_duration = datetime.timedelta(0)
+    for _, check_in_time, check_out_time in pair_volunteer_sessions(events, *doors):
+        if check_out_time:
+            total_duration += check_out_time - check_in_time
     return total_duration
 
+def calculate_all_volunteer_hours(start_date, end_date, checkin_controller=1, checkin_door=1, checkout_controller=2, checkout_door=2):
+    """
+    volunteer hours for everyone in one pass, same rules as calculate_volunteer_hours
+
+    returns {person_id: timedelta} for every person with at least one completed session in the range
+    """
+    doors = (checkin_controller, checkin_door, checkout_controller, checkout_door)
+    if doors == (VOLUNTEER_CHECKIN_CONTROLLER, VOLUNTEER_CHECKIN_DOOR, VOLUNTEER_CHECKOUT_CONTROLLER, VOLUNTEER_CHECKOUT_DOOR):
+        totals = (VolunteerSession
+                  .select(VolunteerSession.person, fn.SUM(VolunteerSession.duration_seconds))
+                  .where((VolunteerSession.checkin_dt >= start_date) & (VolunteerSession.checkout_dt <= end_date))
+                  .group_by(VolunteerSession.person)
+                  .tuples())
+        return {person_id: datetime.timedelta(seconds=seconds) for person_id, seconds in totals}
+
+    # VolunteerSession only tracks the configured doors, pair the raw log (archived years included) in one ordered pass
+    events = _logged_volunteer_events(start_date, end_date)
+    totals = {}
+    for person_id, check_in_time, check_out_time in pair_volunteer_sessions(events, *doors):
+        if check_out_time:
+            totals[person_id] = totals.get(person_id, datetime.timedelta(0)) + (check_out_time - check_in_time)
+    return totals
+
 class DoorAccessLog(BaseModel):
     """
     build door access log for reporting functions, scraped off the controller logs
     """
-    log_sha1 = CharField(max_length=40) # sha1 hash to prevent duplicate entries written between polling
-    event_dt = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
+    id = AutoIncrementField() # ids only grow, the traffic rollup watermark relies on it
+    log_sha1 = CharField(max_length=40, unique=True) # sha1 hash to prevent duplicate entries written between polling
+    event_dt = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')], index=True)
     card_number = IntegerField()
     event_type = CharField(max_length=32)
     event_type_id = IntegerField() # door id
@@ -99,6 +345,65 @@ class DoorAccessLog(BaseModel):
     access_granted = BooleanField()
     person = ForeignKeyField(Person)
 
+    class Meta:
+        indexes = (
+            (('controller', 'door', 'event_dt'), False),
+        )
+
+# callables taking the list of row dicts ingest_door_access_logs wrote, run after the transaction commits
+door_access_ingest_hooks = []
+
+def ingest_door_access_logs(rows):
+    """
+    write scraped controller events in a single transaction, skipping any event whose log_sha1
+    is already stored, archived or repeated within the batch
+
+    rows are dicts of DoorAccessLog column values, returns the set of log_sha1 values written
+    """
+    rows_by_sha1 = {}
+    for row in rows:
+        rows_by_sha1.setdefault(row['log_sha1'], row)
+
+    # only events no newer than the last archived one can be in the archive, looked up in their year's file
+    archive_end = archived_until(DoorAccessLog)
+    if archive_end is not None:
+        years_by_sha1 = {sha1: int(str(row['event_dt'])[:4]) for sha1, row in rows_by_sha1.items()
+                         if row.get('event_dt') is not None and str(row['event_dt']) <= str(archive_end)}
+        for sha1 in archived_log_sha1s(DoorAccessLog, years_by_sha1, years_by_sha1.values()):
+            del rows_by_sha1[sha1]
+
+    accepted = set()
+    written = []
+    # IMMEDIATE takes the write lock up front so a concurrent poller can't slip a duplicate in between the check and the insert
+    with DoorAccessLog._meta.database.atomic('IMMEDIATE'):
+        for batch in chunked(list(rows_by_sha1), INGEST_CHUNK_SIZE):
+            existing = {sha1 for (sha1,) in DoorAccessLog
+                        .select(DoorAccessLog.log_sha1)
+                        .where(DoorAccessLog.log_sha1.in_(batch))
+                        .tuples()}
+            new_rows = [rows_by_sha1[sha1] for sha1 in batch if sha1 not in existing]
+            if new_rows:
+                DoorAccessLog.insert_many(new_rows).on_conflict_ignore().execute()
+                accepted.update(row['log_sha1'] for row in new_rows)
+                written.extend(new_rows)
+    if written:
+        for hook in door_access_ingest_hooks:
+            hook(written)
+    return accepted
+
+def _dedupe_door_access_log():
+    """
+    log_sha1 only became unique after polling had already written duplicates, keep the first copy
+    so the unique index can be built on existing databases
+    """
+    db = DoorAccessLog._meta.database
+    table_name = DoorAccessLog._meta.table_name
+    if not DoorAccessLog.table_exists():
+        return
+    if any(index.unique and index.columns == ['log_sha1'] for index in db.get_indexes(table_name)):
+        return
+    db.execute_sql(f'DELETE FROM {table_name} WHERE id NOT IN (SELECT MIN(id) FROM {table_name} GROUP BY log_sha1)')
+
 KEY_CARD_TYPES = ('keyfob', 'card', 'bracelet', 'sticker', 'phone', 'other')
 
 class KeyCard(BaseModel):
@@ -124,16 +429,105 @@ class PersonDoorCredentialProfile(BaseModel):
     access_start_date = CharField(max_length=11) # yyyy-MM-dd
     access_end_date = CharField(max_length=11) # yyyy-MM-dd
 
+    def door_profiles(self):
+        """
+        the four door profiles in door order, fetched in one query
+        """
+        profile_ids = [self.door_1_profile_id, self.door_2_profile_id, self.door_3_profile_id, self.door_4_profile_id]
+        profiles = {profile.id: profile for profile in DoorProfiles.select().where(DoorProfiles.id.in_(profile_ids))}
+        return [profiles.get(profile_id) for profile_id in profile_ids]
+
+    def schedule_union(self):
+        """
+        minutes of the week at least one of the doors is open to this credential
+        """
+        return union(profile.schedule for profile in self.door_profiles() if profile)
+
+    def schedule_intersection(self):
+        """
+        minutes of the week every door is open to this credential
+        """
+        return intersection(profile.schedule if profile else 0 for profile in self.door_profiles())
+
+SYNC_KINDS = ('profile', 'credential')
+
+class ControllerSyncState(RootModel):
+    """
+    what was last pushed to each controller, one row per door profile or credential with the hash of its payload
+    """
+    controller = ForeignKeyField(Controller, backref='sync_state', on_delete='CASCADE')
+    kind = CharField(max_length=16, constraints=[Check(f"kind IN {str(SYNC_KINDS)}")])
+    object_id = IntegerField() # DoorProfiles.id or PersonDoorCredentialProfile.id
+    content_hash = CharField(max_length=40)
+    synced_dt = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        indexes = (
+            (('controller', 'kind', 'object_id'), True),
+        )
+
+class DoorTrafficHourly(RootModel):
+    """
+    granted and denied DoorAccessLog counts per controller, door and hour, maintained by models.crm.trafficrollup
+    """
+    controller = IntegerField() # controller id, as in DoorAccessLog
+    door = IntegerField()
+    bucket_dt = DateTimeField() # start of the hour
+    granted_count = IntegerField(default=0)
+    denied_count = IntegerField(default=0)
+
+    class Meta:
+        indexes = (
+            (('bucket_dt', 'controller', 'door'), True),
+        )
+
+class DoorTrafficDaily(RootModel):
+    """
+    granted and denied DoorAccessLog counts per controller, door and day, maintained by models.crm.trafficrollup
+    """
+    controller = IntegerField()
+    door = IntegerField()
+    bucket_date = DateField()
+    granted_count = IntegerField(default=0)
+    denied_count = IntegerField(default=0)
+
+    class Meta:
+        indexes = (
+            (('bucket_date', 'controller', 'door'), True),
+        )
+
+class RollupWatermark(RootModel):
+    """
+    highest source row id already folded into a rollup
+    """
+    name = CharField(max_length=64, unique=True)
+    last_id = IntegerField(default=0)
+
 # Create tables and apply database settings
 def create_tables():
+    _dedupe_door_access_log()
+    models = [
+        Controller,
+        DoorDirectionMap,
+        DoorProfiles,
+        VolunteerAccessLog,
+        VolunteerSession,
+        PersonDoorCredentialProfile,
+        DoorAccessLog,
+        KeyCard,
+        KeyCode,
+        ControllerSyncState,
+        DoorTrafficHourly,
+        DoorTrafficDaily,
+        RollupWatermark,
+    ]
     with get_database(database_file) as db:
-        db.create_tables([
-            Controller,
-            DoorDirectionMap,
-            DoorProfiles,
-            VolunteerAccessLog,
-            PersonDoorCredentialProfile,
-            DoorAccessLog,
-            KeyCard,
-            KeyCode,
-        ], safe=True)
+        for model in models:
+            add_missing_columns(model)
+        db.create_tables(models, safe=True)
+    use_autoincrement(VolunteerAccessLog)
+    use_autoincrement(DoorAccessLog, minimum_id=RollupWatermark.select(fn.MAX(RollupWatermark.last_id)).scalar() or 0)
+    for profile in DoorProfiles.select().where(DoorProfiles.schedule_bitmap.is_null()):
+        DoorProfiles.update(schedule_bitmap=bitmap_to_bytes(profile.compile_schedule())).where(DoorProfiles.id == profile.id).execute()
+    if not VolunteerSession.select().exists() and VolunteerAccessLog.select().exists():
+        rebuild_volunteer_sessions()
@@ -0,0 +1,241 @@
+from playhouse.signals import post_save, post_delete
+from . import rollback_hooks
+from .cardaccess import DoorProfiles, KeyCard, KeyCode, PersonDoorCredentialProfile
+from helpers.schedulehelper import minute_of_week
+import datetime
+import threading
+import time
+
+DOOR_SLOTS = (1, 2, 3, 4) # PersonDoorCredentialProfile.door_N_profile, N is the door number on the profile's controller
+UNBOUNDED_DAY_FROM = datetime.date.min.toordinal()
+UNBOUNDED_DAY_TO = datetime.date.max.toordinal()
+
+def date_ordinal(value, default):
+    """
+    'yyyy-MM-dd' to a day number, missing or unparseable dates leave the range open
+    """
+    try:
+        return datetime.date.fromisoformat(value.strip()).toordinal()
+    except (AttributeError, ValueError):
+        return default
+
+class _IndexState:
+    def __init__(self):
+        self.credentials = {} # credential id -> (person_id, {(controller_id, door): (day_from, day_to, schedule bitmap)})
+        self.credential_keys = {} # credential id -> (card_number, passcode, card_id, code_id, profile ids)
+        self.by_card_number = {}
+        self.by_passcode = {}
+        self.by_card = {}
+        self.by_code = {}
+        self.by_profile = {}
+        self.by_door = {} # (controller_id, door) -> {schedule bitmap: credential ids}, credentials sharing a schedule are tested once
+
+class CardAuthorizationIndex:
+    """
+    in-memory answer to "may card X open door Y on controller Z at time T"
+
+    credentials are compiled into day-number ranges and minute-of-week schedule bitmaps per (controller id, door)
+    and looked up by card_number or KeyCode.passcode, so a check is a couple of dict lookups and a bit test.
+    the index is built on first use, patched by the signal receivers below when the source rows are saved or
+    deleted, and rebuilt in full every refresh_interval seconds to pick up writes made by other processes.
+    readers never lock, a rebuild swaps in a new state and patches replace sets instead of mutating them
+    """
+    refresh_interval = 300
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._state = _IndexState()
+
+    def is_authorized(self, controller, door, at=None, card_number=None, passcode=None):
+        """
+        returns (granted, person_id) for a card number or passcode at a controller id and door
+        """
+        state = self._ensure_loaded()
+        at = at or datetime.datetime.now()
+        day = at.toordinal()
+        minute = minute_of_week(at)
+        if card_number is not None:
+            credential_ids = state.by_card_number.get(card_number, ())
+        else:
+            credential_ids = state.by_passcode.get(passcode, ())
+
+        person_id = None
+        for credential_id in credential_ids:
+            credential = state.credentials.get(credential_id)
+            if credential is None:
+                continue
+            person_id, doors = credential
+            window = doors.get((controller, door))
+            if window is None:
+                continue
+            day_from, day_to, schedule = window
+            if day_from <= day <= day_to and schedule >> minute & 1:
+                return True, person_id
+        return False, person_id
+
+    def persons_with_access(self, controller, door, at=None):
+        """
+        ids of everyone whose credential opens the door at the given time
+
+        the bit is tested once per distinct schedule on the door, only credentials whose schedule matches are visited
+        """
+        state = self._ensure_loaded()
+        at = at or datetime.datetime.now()
+        day = at.toordinal()
+        minute = minute_of_week(at)
+        person_ids = set()
+        for schedule, credential_ids in list(state.by_door.get((controller, door), {}).items()):
+            if not schedule >> minute & 1:
+                continue
+            for credential_id in credential_ids:
+                credential = state.credentials.get(credential_id)
+                if credential is None:
+                    continue
+                person_id, doors = credential
+                window = doors.get((controller, door))
+                if window and window[0] <= day <= window[1]:
+                    person_ids.add(person_id)
+        return person_ids
+
+    def invalidate(self):
+        """
+        drop everything, the next check rebuilds from the database
+        """
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+                    self.rebuild()
+        return self._state
+
+    def rebuild(self):
+        with self._lock:
+            cards = {card.id: card.card_number for card in
+                     KeyCard.select(KeyCard.id, KeyCard.card_number).where(KeyCard.is_deleted == False)}
+            codes = {code.id: code.passcode for code in
+                     KeyCode.select(KeyCode.id, KeyCode.passcode).where(KeyCode.is_deleted == False)}
+            profiles = {profile.id: profile for profile in DoorProfiles.select().where(DoorProfiles.is_deleted == False)}
+            state = _IndexState()
+            for credential in PersonDoorCredentialProfile.select().where(PersonDoorCredentialProfile.is_deleted == False):
+                self._add_credential(state, credential, cards, codes, profiles)
+            self._state = state
+            self._loaded_at = time.monotonic()
+
+    def reload_credentials(self, credential_ids):
+        """
+        recompile the given credentials from the database, removing the ones that no longer exist
+        """
+        if self._loaded_at is None or not credential_ids:
+            return
+        with self._lock:
+            state = self._state
+            for credential_id in credential_ids:
+                self._remove_credential(state, credential_id)
+            rows = list(PersonDoorCredentialProfile.select().where(
+                PersonDoorCredentialProfile.id.in_(list(credential_ids)) & (PersonDoorCredentialProfile.is_deleted == False)))
+            if not rows:
+                return
+            card_ids = [row.card_id for row in rows]
+            code_ids = [row.code_id for row in rows]
+            profile_ids = [getattr(row, f'door_{slot}_profile_id') for row in rows for slot in DOOR_SLOTS]
+            cards = {card.id: card.card_number for card in KeyCard.select(KeyCard.id, KeyCard.card_number)
+                     .where(KeyCard.id.in_(card_ids) & (KeyCard.is_deleted == False))}
+            codes = {code.id: code.passcode for code in KeyCode.select(KeyCode.id, KeyCode.passcode)
+                     .where(KeyCode.id.in_(code_ids) & (KeyCode.is_deleted == False))}
+            profiles = {profile.id: profile for profile in DoorProfiles.select()
+                        .where(DoorProfiles.id.in_(profile_ids) & (DoorProfiles.is_deleted == False))}
+            for row in rows:
+                self._add_credential(state, row, cards, codes, profiles)
+
+    def credentials_using(self, profile_id=None, card_id=None, code_id=None):
+        state = self._state
+        if profile_id is not None:
+            return set(state.by_profile.get(profile_id, ()))
+        if card_id is not None:
+            return set(state.by_card.get(card_id, ()))
+        return set(state.by_code.get(code_id, ()))
+
+    def _add_credential(self, state, credential, cards, codes, profiles):
+        credential_from = date_ordinal(credential.access_start_date, UNBOUNDED_DAY_FROM)
+        credential_to = date_ordinal(credential.access_end_date, UNBOUNDED_DAY_TO)
+        doors = {}
+        profile_ids = set()
+        person_id = None
+        for slot in DOOR_SLOTS:
+            profile_id = getattr(credential, f'door_{slot}_profile_id')
+            profile_ids.add(profile_id)
+            profile = profiles.get(profile_id)
+            if profile is None:
+                continue
+            person_id = profile.person_id
+            day_from = max(credential_from, date_ordinal(profile.start_date, UNBOUNDED_DAY_FROM))
+            day_to = min(credential_to, date_ordinal(profile.end_date, UNBOUNDED_DAY_TO))
+            schedule = profile.schedule
+            if day_from <= day_to and schedule:
+                doors[(profile.controller_id, slot)] = (day_from, day_to, schedule)
+
+        card_number = cards.get(credential.card_id)
+        passcode = codes.get(credential.code_id)
+        state.credentials[credential.id] = (person_id, doors)
+        state.credential_keys[credential.id] = (card_number, passcode, credential.card_id, credential.code_id, profile_ids)
+        links = [(state.by_card, credential.card_id), (state.by_code, credential.code_id)]
+        links += [(state.by_profile, profile_id) for profile_id in profile_ids]
+        if card_number is not None:
+            links.append((state.by_card_number, card_number))
+        if passcode is not None:
+            links.append((state.by_passcode, passcode))
+        for mapping, key in links:
+            mapping[key] = mapping.get(key, frozenset()) | {credential.id}
+        for door, (day_from, day_to, schedule) in doors.items():
+            schedules = state.by_door.setdefault(door, {})
+            schedules[schedule] = schedules.get(schedule, frozenset()) | {credential.id}
+
+    def _remove_credential(self, state, credential_id):
+        person_id, doors = state.credentials.pop(credential_id, (None, {}))
+        for door, (day_from, day_to, schedule) in doors.items():
+            schedules = state.by_door.get(door, {})
+            remaining = schedules.get(schedule, frozenset()) - {credential_id}
+            if remaining:
+                schedules[schedule] = remaining
+            else:
+                schedules.pop(schedule, None)
+        keys = state.credential_keys.pop(credential_id, None)
+        if keys is None:
+            return
+        card_number, passcode, card_id, code_id, profile_ids = keys
+        links = [(state.by_card_number, card_number), (state.by_passcode, passcode),
+                 (state.by_card, card_id), (state.by_code, code_id)]
+        links += [(state.by_profile, profile_id) for profile_id in profile_ids]
+        for mapping, key in links:
+            if key in mapping:
+                mapping[key] = mapping[key] - {credential_id}
+
+card_authorization_index = CardAuthorizationIndex()
+rollback_hooks.append(card_authorization_index.invalidate)
+
+@post_save(sender=PersonDoorCredentialProfile)
+def _credential_saved(sender, instance, created):
+    card_authorization_index.reload_credentials({instance.id})
+
+@post_delete(sender=PersonDoorCredentialProfile)
+def _credential_deleted(sender, instance):
+    card_authorization_index.reload_credentials({instance.id})
+
+@post_save(sender=DoorProfiles)
+@post_delete(sender=DoorProfiles)
+def _door_profile_changed(sender, instance, created=False):
+    card_authorization_index.reload_credentials(card_authorization_index.credentials_using(profile_id=instance.id))
+
+@post_save(sender=KeyCard)
+@post_delete(sender=KeyCard)
+def _key_card_changed(sender, instance, created=False):
+    card_authorization_index.reload_credentials(card_authorization_index.credentials_using(card_id=instance.id))
+
+@post_save(sender=KeyCode)
+@post_delete(sender=KeyCode)
+def _key_code_changed(sender, instance, created=False):
+    card_authorization_index.reload_credentials(card_authorization_index.credentials_using(code_id=instance.id))
@@ -1,6 +1,7 @@
 from peewee import *
 from playhouse.postgres_ext import JSONField  # Assuming you are using PostgreSQL
 from . import get_database, BaseModel, database_file
+from helpers.dbhelper import add_missing_columns
 import datetime
 from .makerspace import Person
 from peewee import Check
@@ -55,10 +56,13 @@ class ChoreHistory(BaseModel):
 
 # Create tables and apply database settings
 def create_tables():
+    models = [
+        Chore,
+        ChoreOwnership,
+        ChoreHistory,
+    ]
     with get_database(database_file) as db:
-        db.create_tables([
-            Chore,
-            ChoreOwnership,
-            ChoreHistory
-        ], safe=True)
+        for model in models:
+            add_missing_columns(model)
+        db.create_tables(models, safe=True)
 
@@ -0,0 +1,106 @@
+from .cardaccess import DoorProfiles, KeyCard, KeyCode, PersonDoorCredentialProfile, ControllerSyncState
+import datetime
+import hashlib
+import json
+
+DOOR_SLOTS = (1, 2, 3, 4)
+
+def content_hash(payload):
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+def controller_snapshot(controller_id):
+    """
+    everything a controller should hold, {(kind, object_id): payload}
+
+    door profiles are the ones defined on the controller, credentials are the ones with at least one
+    door profile on it and only carry the doors of this controller
+    """
+    profiles = {profile.id: profile for profile in DoorProfiles.select().where(
+        (DoorProfiles.controller == controller_id) & (DoorProfiles.is_deleted == False))}
+    snapshot = {}
+    for profile in profiles.values():
+        snapshot[('profile', profile.id)] = {
+            'profile_id': profile.profile_id,
+            'start_date': profile.start_date,
+            'end_date': profile.end_date,
+            'time_segments': [
+                [profile.time_segment_1_start, profile.time_segment_1_end],
+                [profile.time_segment_2_start, profile.time_segment_2_end],
+                [profile.time_segment_3_start, profile.time_segment_3_end],
+            ],
+        }
+    if not profiles:
+        return snapshot
+
+    profile_ids = list(profiles)
+    credentials = list(PersonDoorCredentialProfile.select().where(
+        (PersonDoorCredentialProfile.is_deleted == False) &
+        (PersonDoorCredentialProfile.door_1_profile.in_(profile_ids) |
+         PersonDoorCredentialProfile.door_2_profile.in_(profile_ids) |
+         PersonDoorCredentialProfile.door_3_profile.in_(profile_ids) |
+         PersonDoorCredentialProfile.door_4_profile.in_(profile_ids))))
+    if not credentials:
+        return snapshot
+    cards = {card.id: card.card_number for card in KeyCard.select(KeyCard.id, KeyCard.card_number)
+             .where(KeyCard.id.in_([credential.card_id for credential in credentials]) & (KeyCard.is_deleted == False))}
+    codes = {code.id: code.passcode for code in KeyCode.select(KeyCode.id, KeyCode.passcode)
+             .where(KeyCode.id.in_([credential.code_id for credential in credentials]) & (KeyCode.is_deleted == False))}
+    for credential in credentials:
+        doors = {}
+        for slot in DOOR_SLOTS:
+            profile = profiles.get(getattr(credential, f'door_{slot}_profile_id'))
+            if profile:
+                doors[str(slot)] = profile.profile_id
+        snapshot[('credential', credential.id)] = {
+            'card_number': cards.get(credential.card_id),
+            'passcode': codes.get(credential.code_id),
+            'access_start_date': credential.access_start_date,
+            'access_end_date': credential.access_end_date,
+            'doors': doors,
+        }
+    return snapshot
+
+def compute_delta(controller_id, limit=None):
+    """
+    the add/update/remove changes needed to bring a controller from its last acknowledged push to the current state
+
+    each change is {'op', 'kind', 'id', 'hash', 'payload'}, removes carry no payload and a None hash.
+    profiles are added before the credentials that reference them and removed after, so a partial push is always
+    loadable. limit caps the number of changes returned, the caller pushes and acknowledges until nothing is left
+    """
+    pushed = {(state.kind, state.object_id): state.content_hash for state in
+              ControllerSyncState.select().where(ControllerSyncState.controller == controller_id)}
+    snapshot = controller_snapshot(controller_id)
+
+    upserts = {'profile': [], 'credential': []}
+    for (kind, object_id), payload in sorted(snapshot.items()):
+        current_hash = content_hash(payload)
+        if pushed.get((kind, object_id)) != current_hash:
+            op = 'update' if (kind, object_id) in pushed else 'add'
+            upserts[kind].append({'op': op, 'kind': kind, 'id': object_id, 'hash': current_hash, 'payload': payload})
+    removes = [{'op': 'remove', 'kind': kind, 'id': object_id, 'hash': None, 'payload': None}
+               for (kind, object_id) in sorted(pushed) if (kind, object_id) not in snapshot]
+
+    changes = upserts['profile'] + upserts['credential'] + removes
+    return changes[:limit] if limit else changes
+
+def acknowledge_delta(controller_id, applied):
+    """
+    record changes the controller accepted, applied is a list of {'kind', 'id', 'hash'} as returned by compute_delta
+    """
+    db = ControllerSyncState._meta.database
+    now = datetime.datetime.now()
+    with db.atomic():
+        for change in applied:
+            match = ((ControllerSyncState.controller == controller_id) &
+                     (ControllerSyncState.kind == change['kind']) &
+                     (ControllerSyncState.object_id == change['id']))
+            if change.get('hash') is None:
+                ControllerSyncState.delete().where(match).execute()
+            else:
+                (ControllerSyncState
+                 .insert(controller=controller_id, kind=change['kind'], object_id=change['id'],
+                         content_hash=change['hash'], synced_dt=now)
+                 .on_conflict(conflict_target=[ControllerSyncState.controller, ControllerSyncState.kind, ControllerSyncState.object_id],
+                              update={ControllerSyncState.content_hash: change['hash'], ControllerSyncState.synced_dt: now})
+                 .execute())
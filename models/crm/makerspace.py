@@ -1,5 +1,7 @@
 from peewee import *
 from . import get_database, BaseModel, FileModel, database_file
+from helpers.dbhelper import add_missing_columns, relax_not_null_columns
+from helpers.passwordhelper import password_service
 from playhouse.sqlite_ext import JSONField
 import datetime
 
@@ -40,8 +42,11 @@ class ContractTypeMap(BaseModel):
 class Person(BaseModel):
     # API
     first = CharField(max_length=64)
-    last = CharField(max_length=64)
-    email = CharField(max_length=512)
+    last = CharField(max_length=64, index=True)
+    email = CharField(max_length=512, index=True)
+
+# the person import matches emails trimmed and lowercased, emails saved through the API may differ in case or spacing
+Person.add_index(Person.index(fn.LOWER(fn.TRIM(Person.email)), name='person_email_normalized'))
 
 class PersonBilling(BaseModel):
     """
@@ -64,13 +69,14 @@ class PersonCredentials(BaseModel):
     Reference table person credentials
     """
     uid = CharField(unique=True, max_length=64, null=True) # could be used if we switch to a directory server for auth
-    user_id = CharField(max_length=64)
-    password_hash = CharField(max_length=128)
+    user_id = CharField(max_length=64, index=True) # login name, looked up on every login
+    password_hash = CharField(max_length=256) # werkzeug hash, scrypt hashes are 162 characters
+    session_version = IntegerField(default=0) # signed session tokens carry it, bump to revoke them (models.crm.rbac.revoke_sessions)
     person = ForeignKeyField(Person, backref='credentials')
 
     @classmethod
     def update_password(cls, user_id, new_password):
-        hashed_password = generate_password_hash(new_password)
+        hashed_password = password_service.hash(new_password)
         query = cls.update(password_hash=hashed_password).where(cls.user_id == user_id)
         query.execute()
 
@@ -183,7 +189,7 @@ class Equipment(BaseModel):
     # API
     """ large equipment """
     name = CharField(max_length=128)
-    equipment_type = CharField(max_length=40, constraints=[Check(f"equipment_type IN {str(EQUIPMENT_TYPES)}")])
+    equipment_type = CharField(max_length=40, constraints=[Check(f"equipment_type IN {str(EQUIPMENT_TYPES)}")], index=True)
     manufacturer = CharField(max_length=128, null=True)
     model = CharField(max_length=128, null=True)
     serial_number = CharField(null=True)
@@ -248,29 +254,37 @@ class PersonRbac(BaseModel):
     permission = BooleanField(default=False)
     person = ForeignKeyField(Person)
 
+FILE_MODELS = (PersonAvatarPic, PersonPhoto, DonorDocument, EquipmentPhoto, PersonContract) # tables whose files live in the blob store
+
 # Create tables and apply database settings
 def create_tables():
+    models = [
+        BillingCadenceTypeMap,
+        MembershipTypeMap,
+        ContractTypeMap,
+        Zone,
+        Location,
+        Equipment,
+        EquipmentPhoto,
+        DonorDocument,
+        Form,
+        PersonBillingLog,
+        Person,
+        PersonCredentials,
+        PersonPreferences,
+        PersonAvatarPic,
+        PersonPhoto,
+        PersonEmergencyContact,
+        PersonContact,
+        PersonBilling,
+        PersonTrainedEquipment,
+        PersonContract,
+        PersonMembership,
+        PersonRbac,
+    ]
     with get_database(database_file) as db:
-        db.create_tables([
-            BillingCadenceTypeMap,
-            MembershipTypeMap,
-            ContractTypeMap,
-            Zone,
-            Location,
-            Equipment,
-            DonorDocument,
-            Form,
-            PersonBillingLog,
-            Person,
-            PersonCredentials,
-            PersonPreferences,
-            PersonAvatarPic,
-            PersonPhoto,
-            PersonEmergencyContact,
-            PersonContact,
-            PersonBilling,
-            PersonTrainedEquipment,
-            PersonContract,
-            PersonMembership,
-            PersonRbac,
-        ], safe=True)
+        for model in models:
+            add_missing_columns(model)
+        db.create_tables(models, safe=True)
+    for model in FILE_MODELS:
+        relax_not_null_columns(model)
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from playhouse.signals import post_save, post_delete
+from . import rollback_hooks
+from .cardaccess import Controller, DoorDirectionMap, DoorAccessLog, door_access_ingest_hooks
+import datetime
+import threading
+
+OCCUPANCY_MAX_STAY = datetime.timedelta(hours=16) # people not seen at a door for this long are checked out
+OCCUPANCY_MAX_PER_LOCATION = 5000 # hard cap, the longest unseen occupant is dropped first
+
+class OccupancyTracker:
+    """
+    who is inside each Location right now, fed by granted DoorAccessLog events
+
+    a granted swipe on an exterior 'in' door checks the person into the controller's location and one on an
+    exterior 'out' door checks them out, any interior door only proves they are still inside. occupants are kept
+    per location in an OrderedDict ordered by when they were last seen, so headcount is a len() and people who
+    left without swiping out are dropped from the front once max_stay has passed.
+    the state is replayed from the last max_stay of the log on first use and then follows ingest_door_access_logs
+    """
+    max_stay = OCCUPANCY_MAX_STAY
+    max_per_location = OCCUPANCY_MAX_PER_LOCATION
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._doors = {} # (controller id, door) -> (location_id, direction, exterior_door)
+        self._occupants = {} # location_id -> OrderedDict(person_id -> (entered_dt, last_seen_dt))
+        self._location_of = {} # person_id -> location_id
+
+    def headcount(self, location_id, now=None):
+        with self._lock:
+            self._ensure_loaded()
+            occupants = self._occupants.get(location_id)
+            if not occupants:
+                return 0
+            self._expire(occupants, now or datetime.datetime.now())
+            return len(occupants)
+
+    def occupants(self, location_id, now=None):
+        """
+        [(person_id, entered_dt, last_seen_dt)] for a location, longest unseen first
+        """
+        with self._lock:
+            self._ensure_loaded()
+            occupants = self._occupants.get(location_id)
+            if not occupants:
+                return []
+            self._expire(occupants, now or datetime.datetime.now())
+            return [(person_id, entered, last_seen) for person_id, (entered, last_seen) in occupants.items()]
+
+    def headcounts(self, now=None):
+        """
+        {location_id: headcount} for every location with someone in it
+        """
+        with self._lock:
+            self._ensure_loaded()
+            counts = {location_id: self.headcount(location_id, now) for location_id in list(self._occupants)}
+            return {location_id: count for location_id, count in counts.items() if count}
+
+    def record(self, rows):
+        """
+        apply DoorAccessLog row dicts, the ingest hook
+        """
+        with self._lock:
+            if not self._loaded:
+                # the startup replay reads these rows from the log
+                return
+            now = datetime.datetime.now()
+            events = [(DoorAccessLog.event_dt.python_value(row['event_dt']) or now, row) for row in rows]
+            for event_dt, row in sorted(events, key=lambda event: event[0]):
+                if row['access_granted']:
+                    self._apply(row['person'], row['controller'], row['door'], event_dt, now)
+
+    def reload_doors(self):
+        with self._lock:
+            locations = {controller.id: controller.location_id for controller in
+                         Controller.select(Controller.id, Controller.location)}
+            self._doors = {(door.controller_id, door.door): (locations.get(door.controller_id), door.direction, door.exterior_door)
+                           for door in DoorDirectionMap.select()}
+
+    def rebuild(self, now=None):
+        with self._lock:
+            now = now or datetime.datetime.now()
+            self.reload_doors()
+            self._occupants = {}
+            self._location_of = {}
+            events = (DoorAccessLog
+                      .select(DoorAccessLog.person, DoorAccessLog.controller, DoorAccessLog.door, DoorAccessLog.event_dt)
+                      .where((DoorAccessLog.event_dt >= now - self.max_stay) & (DoorAccessLog.access_granted == True))
+                      .order_by(DoorAccessLog.event_dt, DoorAccessLog.id)
+                      .tuples())
+            for person_id, controller, door, event_dt in events:
+                self._apply(person_id, controller, door, event_dt, now)
+            self._loaded = True
+
+    def invalidate(self):
+        """
+        forget everything, the next read replays the log
+        """
+        with self._lock:
+            self._loaded = False
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.rebuild()
+
+    def _apply(self, person_id, controller, door, event_dt, now):
+        mapping = self._doors.get((controller, door))
+        if mapping is None or mapping[0] is None or event_dt < now - self.max_stay:
+            return
+        location_id, direction, exterior_door = mapping
+        current = self._location_of.get(person_id)
+        occupants = self._occupants.setdefault(location_id, OrderedDict())
+        seen = occupants.get(person_id)
+        if seen and event_dt < seen[1]:
+            # older than what we already know about this person
+            return
+
+        if exterior_door and direction == 'out':
+            if current == location_id:
+                del occupants[person_id]
+                del self._location_of[person_id]
+            return
+
+        if current is not None and current != location_id:
+            self._occupants[current].pop(person_id, None)
+        entered = seen[0] if seen else event_dt
+        occupants[person_id] = (entered, event_dt)
+        occupants.move_to_end(person_id)
+        self._location_of[person_id] = location_id
+        self._expire(occupants, now)
+        while len(occupants) > self.max_per_location:
+            self._location_of.pop(occupants.popitem(last=False)[0], None)
+
+    def _expire(self, occupants, now):
+        cutoff = now - self.max_stay
+        while occupants:
+            person_id, (entered, last_seen) = next(iter(occupants.items()))
+            if last_seen >= cutoff:
+                break
+            del occupants[person_id]
+            self._location_of.pop(person_id, None)
+
+occupancy_tracker = OccupancyTracker()
+door_access_ingest_hooks.append(occupancy_tracker.record)
+rollback_hooks.append(occupancy_tracker.invalidate)
+
+@post_save(sender=Controller)
+@post_delete(sender=Controller)
+@post_save(sender=DoorDirectionMap)
+@post_delete(sender=DoorDirectionMap)
+def _door_mapping_changed(sender, instance, created=False):
+    if occupancy_tracker._loaded:
+        occupancy_tracker.reload_doors()
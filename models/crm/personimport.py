@@ -0,0 +1,137 @@
+from peewee import CharField, ForeignKeyField, chunked, fn
+from .makerspace import Person, PersonContact, PersonEmergencyContact
+from helpers.dbhelper import SQLITE_MAX_VARIABLES, rows_per_statement
+import csv
+import datetime
+
+PERSON_IMPORT_CHUNK_SIZE = 500 # csv rows written per transaction, each insert is split by rows_per_statement
+PERSON_IMPORT_MAX_ERRORS = 100 # only the first errors are reported, the counts cover every row
+
+# csv column prefix of each related record, a row only creates one when at least one of its columns is filled in
+PERSON_IMPORT_RELATED = (
+    ('contact_', PersonContact),
+    ('emergency_', PersonEmergencyContact),
+)
+BOOKKEEPING_FIELDS = ('id', 'created_dt', 'updated_dt', 'is_deleted', 'is_hidden')
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+def import_fields(model):
+    """
+    the fields a csv row fills in, everything but bookkeeping columns and the link to Person
+    """
+    return [field for field in model._meta.sorted_fields
+            if field.name not in BOOKKEEPING_FIELDS and not isinstance(field, ForeignKeyField)]
+
+def validate_values(model, values):
+    """
+    check a {field name: string} dict against the model schema, returns a list of error messages
+    """
+    errors = []
+    for field in import_fields(model):
+        value = values.get(field.name)
+        if not value:
+            if not field.null and field.default is None:
+                errors.append(f'{model.__name__}.{field.name} is required')
+            continue
+        if isinstance(field, CharField) and len(value) > field.max_length:
+            errors.append(f'{model.__name__}.{field.name} is longer than {field.max_length} characters')
+    return errors
+
+def parse_person_row(row):
+    """
+    split one csv row into Person values and the values of each related record it carries,
+    returns (person, {model: values}, errors)
+    """
+    row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items() if isinstance(value, str)}
+    person = {field.name: row.get(field.name, '') for field in import_fields(Person)}
+    person['email'] = normalize_email(person['email'])
+    errors = validate_values(Person, person)
+    if person['email'] and '@' not in person['email']:
+        errors.append(f'Person.email {person["email"]!r} is not an email address')
+
+    related = {}
+    for prefix, model in PERSON_IMPORT_RELATED:
+        values = {field.name: row.get(prefix + field.name, '') for field in import_fields(model)}
+        if any(values.values()):
+            errors += validate_values(model, values)
+            related[model] = values
+    return person, related, errors
+
+class PersonImport:
+    """
+    bulk load members from csv, one Person per row plus a PersonContact and PersonEmergencyContact when the row
+    has contact_* or emergency_* columns
+
+    the csv is read row by row and written PERSON_IMPORT_CHUNK_SIZE rows per transaction with insert_many, each
+    statement sized from its column count to stay under sqlite's host parameter limit, so memory stays flat
+    whatever the upload size and a 20k member file is a few dozen commits. rows whose normalized email is
+    already stored, or appeared earlier in the file, are skipped as duplicates, checked with one email lookup
+    per chunk. invalid rows are counted and reported with their line number, the rest of the file still imports
+    """
+    chunk_size = PERSON_IMPORT_CHUNK_SIZE
+    max_errors = PERSON_IMPORT_MAX_ERRORS
+
+    def __init__(self):
+        self.status = {'imported': 0, 'duplicate': 0, 'rejected': 0, 'rows': 0, 'errors': []}
+
+    def run(self, lines):
+        """
+        import csv text lines (a file opened with newline=''), returns the status counts
+        """
+        reader = csv.DictReader(lines)
+        pending = {} # normalized email -> (person, related), earlier chunks are already in the database
+        for row in reader:
+            self.status['rows'] += 1
+            # DictReader.line_num is the physical line the row ended on, quoted values can span lines
+            person, related, errors = parse_person_row(row)
+            if errors:
+                self._reject(reader.line_num, '; '.join(errors))
+                continue
+            if person['email'] in pending:
+                self.status['duplicate'] += 1
+                continue
+            pending[person['email']] = (person, related)
+            if len(pending) >= self.chunk_size:
+                self._write_chunk(pending)
+                pending = {}
+        self._write_chunk(pending)
+        return self.status
+
+    def _write_chunk(self, pending):
+        if not pending:
+            return
+        now = datetime.datetime.now()
+        with Person._meta.database.atomic('IMMEDIATE'):
+            # compared normalized like the file, through the person_email_normalized expression index
+            stored = set()
+            for emails in chunked(list(pending), SQLITE_MAX_VARIABLES):
+                stored.update(email for (email,) in Person
+                              .select(fn.LOWER(fn.TRIM(Person.email)))
+                              .where(fn.LOWER(fn.TRIM(Person.email)).in_(emails))
+                              .tuples())
+            self.status['duplicate'] += len(stored)
+            pending = [pending[email] for email in pending if email not in stored]
+            if not pending:
+                return
+            # insert_many skips the pre_save signal, so updated_dt is stamped here
+            people = [dict(person, updated_dt=now) for person, related in pending]
+            for batch in chunked(people, rows_per_statement(Person)):
+                Person.insert_many(batch).execute()
+            # every email left in the chunk is new, so reading them back finds exactly the rows just inserted
+            ids = {}
+            for emails in chunked([person['email'] for person, related in pending], SQLITE_MAX_VARIABLES):
+                ids.update(Person.select(Person.email, Person.id).where(Person.email.in_(emails)).tuples())
+            for prefix, model in PERSON_IMPORT_RELATED:
+                rows = [dict(related[model], person=ids[person['email']], updated_dt=now)
+                        for person, related in pending if model in related]
+                if rows:
+                    for batch in chunked(rows, rows_per_statement(model)):
+                        model.insert_many(batch).execute()
+        self.status['imported'] += len(pending)
+
+    def _reject(self, line_number, error):
+        self.status['rejected'] += 1
+        if len(self.status['errors']) < self.max_errors:
+            self.status['errors'].append({'line': line_number, 'error': error})
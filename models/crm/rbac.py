@@ -0,0 +1,83 @@
+from peewee import fn
+from playhouse.signals import post_save, post_delete
+from . import rollback_hooks
+from .makerspace import PersonCredentials, PersonRbac
+import threading
+import time
+
+ADMIN_ROLE = 'admin'
+
+class PersonRoleCache:
+    """
+    in-memory answer to "which roles does this person hold", so checking the roles behind a signed session token
+    is a dict lookup
+
+    each person id maps to the frozenset of roles granted with permission=True, filled on first use. the receivers
+    below drop a person's entry when a PersonRbac or PersonCredentials row of theirs is saved or deleted, entries
+    older than ttl seconds are reloaded to pick up writes made by other processes. the session version is not
+    cached, a revoke must reach every worker on their next request rather than after ttl
+    """
+    ttl = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roles = {} # person_id -> (frozenset of roles, loaded at)
+
+    def roles(self, person_id):
+        """
+        the frozenset of roles granted to a person
+        """
+        entry = self._roles.get(person_id)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+            return entry[0]
+        roles = frozenset(role for (role,) in PersonRbac
+                          .select(PersonRbac.role)
+                          .where((PersonRbac.person == person_id) & (PersonRbac.permission == True))
+                          .tuples())
+        with self._lock:
+            self._roles[person_id] = (roles, time.monotonic())
+        return roles
+
+    def session_version(self, person_id):
+        """
+        the session version tokens of this person must carry, None when they have no login. read from the
+        database on every call, one lookup on the PersonCredentials.person index
+        """
+        return (PersonCredentials
+                .select(fn.MAX(PersonCredentials.session_version))
+                .where(PersonCredentials.person == person_id)
+                .scalar())
+
+    def forget_person(self, person_id):
+        with self._lock:
+            self._roles.pop(person_id, None)
+
+    def invalidate(self):
+        """
+        drop everything, the next check reloads from the database
+        """
+        with self._lock:
+            self._roles = {}
+
+person_role_cache = PersonRoleCache()
+rollback_hooks.append(person_role_cache.invalidate)
+
+def revoke_sessions(person_id):
+    """
+    log a person out everywhere, every session token issued to them so far stops being accepted
+    """
+    (PersonCredentials
+     .update(session_version=PersonCredentials.session_version + 1)
+     .where(PersonCredentials.person == person_id)
+     .execute())
+    person_role_cache.forget_person(person_id)
+
+@post_save(sender=PersonRbac)
+@post_delete(sender=PersonRbac)
+def _rbac_changed(sender, instance, created=False):
+    person_role_cache.forget_person(instance.person_id)
+
+@post_save(sender=PersonCredentials)
+@post_delete(sender=PersonCredentials)
+def _credentials_changed(sender, instance, created=False):
+    person_role_cache.forget_person(instance.person_id)
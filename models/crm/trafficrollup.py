@@ -0,0 +1,109 @@
+from peewee import fn, Case, EXCLUDED, chunked
+from playhouse.signals import post_delete
+from .cardaccess import (DoorAccessLog, DoorTrafficHourly, DoorTrafficDaily, RollupWatermark, INGEST_CHUNK_SIZE,
+    door_access_ingest_hooks)
+
+DOOR_TRAFFIC_ROLLUP = 'door_traffic'
+ROLLUP_CHUNK_SIZE = 5000 # DoorAccessLog ids folded per transaction
+
+def _hour_bucket(column):
+    return fn.strftime('%Y-%m-%d %H:00:00', column)
+
+def _hour_start(value):
+    return f'{value[:13]}:00:00'
+
+def _add_counts(counts):
+    """
+    add (controller, door, 'YYYY-MM-DD HH:00:00', granted, denied) tuples to the hourly and daily rollups,
+    negative counts take events back out
+    """
+    daily = {}
+    for controller, door, hour, granted, denied in counts:
+        key = (controller, door, hour[:10])
+        previous = daily.get(key, (0, 0))
+        daily[key] = (previous[0] + granted, previous[1] + denied)
+
+    hourly_rows = [{'controller': controller, 'door': door, 'bucket_dt': hour, 'granted_count': granted, 'denied_count': denied}
+                   for controller, door, hour, granted, denied in counts]
+    daily_rows = [{'controller': controller, 'door': door, 'bucket_date': day, 'granted_count': granted, 'denied_count': denied}
+                  for (controller, door, day), (granted, denied) in daily.items()]
+    for model, bucket, rows in ((DoorTrafficHourly, DoorTrafficHourly.bucket_dt, hourly_rows),
+                                (DoorTrafficDaily, DoorTrafficDaily.bucket_date, daily_rows)):
+        for batch in chunked(rows, INGEST_CHUNK_SIZE):
+            (model
+             .insert_many(batch)
+             .on_conflict(conflict_target=[bucket, model.controller, model.door],
+                          update={model.granted_count: model.granted_count + EXCLUDED.granted_count,
+                                  model.denied_count: model.denied_count + EXCLUDED.denied_count})
+             .execute())
+
+def _watermark():
+    return (RollupWatermark
+            .select(RollupWatermark.last_id)
+            .where(RollupWatermark.name == DOOR_TRAFFIC_ROLLUP)
+            .scalar()) or 0
+
+def update_door_traffic_rollups():
+    """
+    fold DoorAccessLog rows above the watermark into DoorTrafficHourly and DoorTrafficDaily
+
+    rows are aggregated in SQL a chunk of ids at a time and the watermark moves in the same transaction, so the
+    job can run from any process, as often as wanted, and picks up late-arriving events whatever their event_dt.
+    returns the new watermark
+    """
+    db = DoorAccessLog._meta.database
+    while True:
+        with db.atomic('IMMEDIATE'):
+            last_id = _watermark()
+            max_id = DoorAccessLog.select(fn.MAX(DoorAccessLog.id)).scalar()
+            if not max_id or max_id <= last_id:
+                return last_id
+            upper_id = min(max_id, last_id + ROLLUP_CHUNK_SIZE)
+            hour = _hour_bucket(DoorAccessLog.event_dt)
+            counts = (DoorAccessLog
+                      .select(DoorAccessLog.controller, DoorAccessLog.door, hour,
+                              fn.SUM(Case(None, [(DoorAccessLog.access_granted == True, 1)], 0)),
+                              fn.SUM(Case(None, [(DoorAccessLog.access_granted == True, 0)], 1)))
+                      .where((DoorAccessLog.id > last_id) & (DoorAccessLog.id <= upper_id))
+                      .group_by(DoorAccessLog.controller, DoorAccessLog.door, hour)
+                      .tuples())
+            _add_counts(list(counts))
+            (RollupWatermark
+             .insert(name=DOOR_TRAFFIC_ROLLUP, last_id=upper_id)
+             .on_conflict(conflict_target=[RollupWatermark.name], update={RollupWatermark.last_id: upper_id})
+             .execute())
+
+def door_traffic(granularity, start_dt, end_dt, controller=None, door=None):
+    """
+    rollup rows between two 'YYYY-MM-DD HH:MM:SS' bounds as (bucket, controller, door, granted, denied) tuples,
+    granularity is 'hour' or 'day'
+    """
+    if granularity == 'hour':
+        model, bucket = DoorTrafficHourly, DoorTrafficHourly.bucket_dt
+        where = (bucket >= _hour_start(start_dt)) & (bucket <= end_dt)
+    else:
+        model, bucket = DoorTrafficDaily, DoorTrafficDaily.bucket_date
+        where = (bucket >= start_dt[:10]) & (bucket <= end_dt[:10])
+    if controller is not None:
+        where &= model.controller == controller
+    if door is not None:
+        where &= model.door == door
+    rows = (model
+            .select(bucket, model.controller, model.door, model.granted_count, model.denied_count)
+            .where(where & ((model.granted_count != 0) | (model.denied_count != 0)))
+            .order_by(bucket, model.controller, model.door)
+            .tuples())
+    return [(str(row[0]),) + row[1:] for row in rows]
+
+def _door_access_logs_ingested(rows):
+    update_door_traffic_rollups()
+
+door_access_ingest_hooks.append(_door_access_logs_ingested)
+
+@post_delete(sender=DoorAccessLog)
+def _door_access_log_deleted(sender, instance):
+    if instance.id > _watermark():
+        return
+    event_dt = DoorAccessLog.event_dt.python_value(instance.event_dt)
+    granted = 1 if instance.access_granted else 0
+    _add_counts([(instance.controller, instance.door, event_dt.strftime('%Y-%m-%d %H:00:00'), -granted, granted - 1)])
@@ -0,0 +1,81 @@
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.crm import RootModel
+from models.crm.makerspace import Person, create_tables as create_tables_makerspace
+from models.crm.cardaccess import (DoorProfiles, VolunteerAccessLog, create_tables as create_tables_cardaccess,
+    VOLUNTEER_CHECKIN_CONTROLLER, VOLUNTEER_CHECKIN_DOOR, VOLUNTEER_CHECKOUT_CONTROLLER, VOLUNTEER_CHECKOUT_DOOR)
+from models.crm.chore import create_tables as create_tables_chore
+import models.crm.trafficrollup # registers the rollup ingest hook
+
+@pytest.fixture
+def crm_db(tmp_path, monkeypatch):
+    """
+    a fresh crm.sqlite with every table, in a temp directory that is also the cwd for archive and blob files
+    """
+    monkeypatch.chdir(tmp_path)
+    db = RootModel._meta.database
+    if not db.is_closed():
+        db.close()
+    create_tables_makerspace()
+    create_tables_cardaccess()
+    create_tables_chore()
+    yield db
+    db.close()
+
+@pytest.fixture
+def person(crm_db):
+    return Person.create(first='Ada', last='Lovelace', email='ada@example.com')
+
+@pytest.fixture
+def client(crm_db):
+    from app import app
+    app.config['TESTING'] = True
+    return app.test_client()
+
+@pytest.fixture
+def archive_now():
+    """
+    the "now" archive runs are given, everything before 2023-07-01 moves to the archive
+    """
+    return datetime.datetime(2024, 1, 15)
+
+@pytest.fixture
+def door_event():
+    """
+    builds the dict ingest_door_access_logs takes for one granted swipe
+    """
+    def make(person, sha1, event_dt):
+        return {'log_sha1': sha1, 'event_dt': event_dt, 'card_number': 1234, 'event_type': 'swipe', 'event_type_id': 1,
+                'event_reason': 'granted', 'door': 1, 'controller': 1, 'access_granted': True, 'person': person.id}
+    return make
+
+@pytest.fixture
+def swipe():
+    """
+    saves a VolunteerAccessLog at the check-in or the check-out door
+    """
+    def make(person, event_dt, checkin):
+        controller, door = ((VOLUNTEER_CHECKIN_CONTROLLER, VOLUNTEER_CHECKIN_DOOR) if checkin
+                            else (VOLUNTEER_CHECKOUT_CONTROLLER, VOLUNTEER_CHECKOUT_DOOR))
+        return VolunteerAccessLog.create(log_sha1=f'{person.id}-{event_dt}-{checkin}', event_dt=event_dt, card_number=1234,
+                                         event_type='swipe', event_type_id=door, event_reason='granted', door=door,
+                                         controller=controller, access_granted=True, person=person)
+    return make
+
+@pytest.fixture
+def make_profile():
+    """
+    saves a DoorProfiles row open 2024 long from start to 17:00
+    """
+    def make(controller, person, profile_id, start='09:00'):
+        return DoorProfiles.create(controller=controller, profile_id=profile_id, start_date='2024-01-01',
+                                   end_date='2024-12-31', time_segment_1_start=start, time_segment_1_end='17:00',
+                                   time_segment_2_start='00:00', time_segment_2_end='00:00',
+                                   time_segment_3_start='00:00', time_segment_3_end='00:00', person=person)
+    return make
@@ -0,0 +1,45 @@
+import datetime
+
+from models.crm.archive import archive_access_logs, select_access_logs
+from models.crm.cardaccess import DoorAccessLog, ingest_door_access_logs
+
+def archived_sha1s():
+    rows = select_access_logs(DoorAccessLog, datetime.datetime(2023, 1, 1), datetime.datetime(2023, 12, 31))
+    return sorted(row['log_sha1'] for row in rows)
+
+def test_second_archive_run_after_hot_table_emptied(person, archive_now, door_event):
+    ingest_door_access_logs([door_event(person, 'a', datetime.datetime(2023, 1, 10, 9)),
+                             door_event(person, 'b', datetime.datetime(2023, 1, 10, 10))])
+    assert archive_access_logs(archive_now)['dooraccesslog'] == 2
+    assert not DoorAccessLog.select().exists()
+
+    # a late upload of an old event lands in the emptied hot table
+    ingest_door_access_logs([door_event(person, 'c', datetime.datetime(2023, 2, 1, 9))])
+    assert archive_access_logs(archive_now)['dooraccesslog'] == 1
+    assert not DoorAccessLog.select().exists()
+    assert archived_sha1s() == ['a', 'b', 'c']
+
+def test_reused_id_is_archived_under_a_new_id(person, archive_now, door_event):
+    ingest_door_access_logs([door_event(person, 'a', datetime.datetime(2023, 1, 10, 9))])
+    archived_id = DoorAccessLog.get(DoorAccessLog.log_sha1 == 'a').id
+    archive_access_logs(archive_now)
+
+    # rows written before AUTOINCREMENT could get the id of a row that was already archived
+    DoorAccessLog.insert(id=archived_id, **door_event(person, 'b', datetime.datetime(2023, 2, 1, 9))).execute()
+    assert archive_access_logs(archive_now)['dooraccesslog'] == 1
+    rows = select_access_logs(DoorAccessLog, datetime.datetime(2023, 1, 1), datetime.datetime(2023, 12, 31))
+    assert [row['log_sha1'] for row in rows] == ['a', 'b']
+    assert rows[0]['id'] == archived_id and rows[1]['id'] != archived_id
+
+def test_rerun_does_not_duplicate_archived_rows(person, archive_now, door_event):
+    ingest_door_access_logs([door_event(person, 'a', datetime.datetime(2023, 1, 10, 9))])
+    archive_access_logs(archive_now)
+    assert archive_access_logs(archive_now)['dooraccesslog'] == 0
+    assert archived_sha1s() == ['a']
+
+def test_ids_are_not_reused_after_archiving(person, archive_now, door_event):
+    ingest_door_access_logs([door_event(person, 'a', datetime.datetime(2023, 1, 10, 9))])
+    archived_id = DoorAccessLog.get(DoorAccessLog.log_sha1 == 'a').id
+    archive_access_logs(archive_now)
+    ingest_door_access_logs([door_event(person, 'b', datetime.datetime(2023, 12, 1, 9))])
+    assert DoorAccessLog.get(DoorAccessLog.log_sha1 == 'b').id > archived_id
@@ -0,0 +1,67 @@
+import datetime
+import types
+
+from models.crm import archivereader
+
+from models.crm.archive import archive_access_logs, archived_until, select_access_logs
+from models.crm.cardaccess import (DoorAccessLog, ingest_door_access_logs, calculate_volunteer_hours,
+    calculate_all_volunteer_hours)
+
+def test_volunteer_hours_on_other_doors_include_the_archive(person, archive_now, swipe):
+    # controller 1 door 1 checks in and controller 2 door 2 checks out, read here the other way round
+    swipe(person, datetime.datetime(2023, 1, 10, 9), False)
+    swipe(person, datetime.datetime(2023, 1, 10, 12), True)
+    archive_access_logs(archive_now)
+
+    start, end = datetime.datetime(2023, 1, 1), datetime.datetime(2023, 1, 31)
+    hours = calculate_volunteer_hours(person.id, start, end, 2, 2, 1, 1)
+    assert hours == datetime.timedelta(hours=3)
+    assert calculate_all_volunteer_hours(start, end, 2, 2, 1, 1) == {person.id: datetime.timedelta(hours=3)}
+
+def test_ingest_skips_archived_log_sha1(person, archive_now, door_event):
+    event = door_event(person, 'a', '2023-01-10 09:00:00')
+    ingest_door_access_logs([event])
+    archive_access_logs(archive_now)
+    assert ingest_door_access_logs([event, door_event(person, 'b', '2023-01-10 10:00:00')]) == {'b'}
+
+def test_post_of_an_archived_event_reports_its_id(person, client, archive_now, door_event):
+    event = door_event(person, 'a', '2023-01-10 09:00:00')
+    ingest_door_access_logs([event])
+    archived_id = DoorAccessLog.get(DoorAccessLog.log_sha1 == 'a').id
+    archive_access_logs(archive_now)
+
+    body = {name: value for name, value in event.items() if name != 'person'}
+    body['person_id'] = person.id
+    response = client.post('/v1/api/access/door_access_log', json=body)
+    assert response.status_code == 200
+    assert response.get_json() == {'message': 'Log already recorded', 'log_id': archived_id}
+    assert not DoorAccessLog.select().exists()
+
+def test_history_pages_through_archived_and_hot_rows(person, client, archive_now, door_event):
+    ingest_door_access_logs([door_event(person, f'old-{day}', f'2023-01-{day:02d} 09:00:00') for day in range(1, 6)])
+    archive_access_logs(archive_now)
+    ingest_door_access_logs([door_event(person, f'new-{day}', f'2023-12-{day:02d} 09:00:00') for day in range(1, 4)])
+
+    seen, cursor = [], None
+    while True:
+        query = {'start_dt': '2023-01-01', 'end_dt': '2023-12-31', 'limit': 3, 'person_id': person.id}
+        if cursor:
+            query['cursor'] = cursor
+        page = client.get('/v1/api/access/door_access_log/history', query_string=query).get_json()
+        seen.extend(item['log_sha1'] for item in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [f'old-{day}' for day in range(1, 6)] + [f'new-{day}' for day in range(1, 4)]
+
+def test_range_after_the_archive_reads_only_the_hot_table(person, monkeypatch, archive_now, door_event):
+    ingest_door_access_logs([door_event(person, 'old', '2023-03-01 09:00:00')])
+    archive_access_logs(archive_now)
+    ingest_door_access_logs([door_event(person, 'new', '2023-09-01 09:00:00')])
+    archived_until(DoorAccessLog) # caches the archive's newest event_dt
+
+    opened = []
+    monkeypatch.setattr(archivereader, 'sqlite3', types.SimpleNamespace(connect=opened.append))
+    rows = select_access_logs(DoorAccessLog, datetime.datetime(2023, 5, 1), datetime.datetime(2023, 12, 31))
+    assert [row['log_sha1'] for row in rows] == ['new']
+    assert opened == []
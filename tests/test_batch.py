@@ -0,0 +1,32 @@
+from models.crm.cardaccess import KeyCard
+from models.crm.makerspace import Person
+
+def person_operation(**body):
+    return {'method': 'POST', 'path': '/v1/api/person', 'ref': 'member',
+            'body': dict({'first': 'Ada', 'last': 'Lovelace', 'email': 'ada@example.com'}, **body)}
+
+def card_operation(card_number):
+    return {'method': 'POST', 'path': '/v1/api/access/cardid',
+            'body': {'card_number': card_number, 'card_type': 'card', 'person_id': '$member'}}
+
+def test_refs_are_resolved_in_later_operations(client):
+    response = client.post('/v1/api/batch', json={'operations': [person_operation(), card_operation(1234)]})
+    assert response.status_code == 200
+    person_id = response.get_json()['results'][0]['body']['id']
+    assert KeyCard.get(KeyCard.card_number == 1234).person_id == person_id
+
+def test_dollar_strings_that_name_no_ref_are_plain_values(client):
+    response = client.post('/v1/api/batch', json={'operations': [person_operation(first='$ally')]})
+    assert response.status_code == 200
+    assert Person.get().first == '$ally'
+
+def test_failed_operation_reports_the_resource_error(client):
+    direct = client.post('/v1/api/access/cardid', json={'card_number': 'x', 'card_type': 'card', 'person_id': 1})
+
+    response = client.post('/v1/api/batch', json={'operations': [person_operation(), card_operation('x')]})
+    assert response.status_code == 400
+    result = response.get_json()
+    assert (result['committed'], result['failed_index']) == (False, 1)
+    assert result['results'][1]['body'] == direct.get_json()
+    assert 'card_number' in result['results'][1]['body']['message']
+    assert not Person.select().exists()
@@ -0,0 +1,103 @@
+import pytest
+
+from models.crm.cardaccess import Controller, KeyCard, KeyCode, PersonDoorCredentialProfile
+
+class FakeController:
+    """
+    a door controller that loads the sync delta the way the real one does, refusing a credential whose door
+    profiles it doesn't hold yet
+    """
+    def __init__(self, client, controller_id):
+        self.client = client
+        self.controller_id = controller_id
+        self.profiles = {} # DoorProfiles.id -> payload
+        self.credentials = {} # PersonDoorCredentialProfile.id -> payload
+
+    @property
+    def url(self):
+        return f'/v1/api/access/controller/{self.controller_id}/sync'
+
+    def delta(self, limit=None):
+        query = {'limit': limit} if limit else {}
+        return self.client.get(self.url, query_string=query).get_json()['changes']
+
+    def apply(self, changes):
+        held_profile_ids = {payload['profile_id'] for payload in self.profiles.values()}
+        for change in changes:
+            store = self.profiles if change['kind'] == 'profile' else self.credentials
+            if change['op'] == 'remove':
+                del store[change['id']]
+                continue
+            if change['kind'] == 'credential':
+                assert set(change['payload']['doors'].values()) <= held_profile_ids
+            store[change['id']] = change['payload']
+            if change['kind'] == 'profile':
+                held_profile_ids.add(change['payload']['profile_id'])
+
+    def acknowledge(self, changes):
+        applied = [{'kind': change['kind'], 'id': change['id'], 'hash': change['hash']} for change in changes]
+        assert self.client.post(self.url, json={'applied': applied}).status_code == 200
+
+    def sync(self, limit=None):
+        """
+        pull, apply and acknowledge until the delta is empty, returns every change applied
+        """
+        applied = []
+        while True:
+            changes = self.delta(limit)
+            if not changes:
+                return applied
+            self.apply(changes)
+            self.acknowledge(changes)
+            applied.extend(changes)
+
+@pytest.fixture
+def door_setup(person, make_profile):
+    controller = Controller.create(controller=1, name='front')
+    day = make_profile(controller, person, 10)
+    evening = make_profile(controller, person, 20, start='17:00')
+    credential = PersonDoorCredentialProfile.create(
+        person=controller, card=KeyCard.create(card_number=1234, card_type='card', person=person),
+        code=KeyCode.create(passcode=4321, person=person), door_1_profile=day, door_2_profile=day,
+        door_3_profile=evening, door_4_profile=evening, access_start_date='2024-01-01', access_end_date='2024-12-31')
+    return controller, day, evening, credential
+
+def summary(changes):
+    return [(change['op'], change['kind'], change['id']) for change in changes]
+
+def test_first_sync_adds_profiles_before_credentials(client, door_setup):
+    controller, day, evening, credential = door_setup
+    fake = FakeController(client, controller.id)
+
+    applied = fake.sync(limit=1)
+    assert summary(applied) == [('add', 'profile', day.id), ('add', 'profile', evening.id), ('add', 'credential', credential.id)]
+    assert fake.credentials[credential.id]['doors'] == {'1': 10, '2': 10, '3': 20, '4': 20}
+    assert fake.delta() == []
+
+def test_unacknowledged_changes_are_sent_again(client, door_setup):
+    controller, day, evening, credential = door_setup
+    fake = FakeController(client, controller.id)
+    first = fake.delta()
+    fake.apply(first)
+    fake.acknowledge(first[:1])
+    assert summary(fake.delta()) == summary(first[1:])
+
+def test_resync_after_profile_changes(client, door_setup):
+    controller, day, evening, credential = door_setup
+    fake = FakeController(client, controller.id)
+    fake.sync()
+
+    day.time_segment_1_start = '08:00'
+    day.save()
+    assert summary(fake.sync()) == [('update', 'profile', day.id)]
+    assert fake.profiles[day.id]['time_segments'][0] == ['08:00', '17:00']
+
+    credential.door_3_profile = day
+    credential.door_4_profile = day
+    credential.save()
+    evening.is_deleted = True
+    evening.save()
+    assert summary(fake.sync()) == [('update', 'credential', credential.id), ('remove', 'profile', evening.id)]
+    assert set(fake.profiles) == {day.id}
+    assert fake.credentials[credential.id]['doors'] == {'1': 10, '2': 10, '3': 10, '4': 10}
+    assert fake.delta() == []
@@ -0,0 +1,21 @@
+from helpers.dbhelper import use_autoincrement
+from models.crm.cardaccess import DoorAccessLog
+
+def test_use_autoincrement_rebuilds_a_legacy_table(person, crm_db, door_event):
+    DoorAccessLog.insert(id=7, **door_event(person, 'a', '2024-01-01 08:00:00')).execute()
+    # the table as create_tables made it before the id became an AutoIncrementField
+    table_sql = crm_db.execute_sql("SELECT sql FROM sqlite_master WHERE name = 'dooraccesslog'").fetchone()[0]
+    crm_db.execute_sql('ALTER TABLE dooraccesslog RENAME TO dooraccesslog__current')
+    crm_db.execute_sql(table_sql.replace(' AUTOINCREMENT', ''))
+    crm_db.execute_sql('INSERT INTO dooraccesslog SELECT * FROM dooraccesslog__current')
+    crm_db.execute_sql('DROP TABLE dooraccesslog__current')
+    crm_db.execute_sql('CREATE UNIQUE INDEX dooraccesslog_log_sha1 ON dooraccesslog (log_sha1)')
+
+    use_autoincrement(DoorAccessLog, minimum_id=40)
+    use_autoincrement(DoorAccessLog, minimum_id=40)
+
+    table_sql = crm_db.execute_sql("SELECT sql FROM sqlite_master WHERE name = 'dooraccesslog'").fetchone()[0]
+    assert 'AUTOINCREMENT' in table_sql
+    assert DoorAccessLog.get_by_id(7).log_sha1 == 'a'
+    assert {index.name for index in crm_db.get_indexes('dooraccesslog')} >= {'dooraccesslog_log_sha1', 'dooraccesslog_event_dt'}
+    assert DoorAccessLog.insert(**door_event(person, 'b', '2024-01-01 09:00:00')).execute() == 41
@@ -0,0 +1,22 @@
+import datetime
+
+from models.crm.cardaccess import Controller, DoorProfiles
+
+MONDAY_MORNING = datetime.datetime(2024, 5, 6, 8, 30)
+
+def test_bulk_update_of_time_segments_recompiles_on_read(person, make_profile):
+    profile = make_profile(Controller.create(controller=1, name='front'), person, 10)
+    assert not DoorProfiles.get_by_id(profile.id).is_open_at(MONDAY_MORNING)
+
+    DoorProfiles.update(time_segment_1_start='08:00').where(DoorProfiles.id == profile.id).execute()
+    updated = DoorProfiles.get_by_id(profile.id)
+    assert updated.schedule_bitmap is None
+    assert updated.is_open_at(MONDAY_MORNING)
+
+    updated.save()
+    assert DoorProfiles.get_by_id(profile.id).schedule_bitmap is not None
+
+def test_bulk_update_of_other_columns_keeps_the_bitmap(person, make_profile):
+    profile = make_profile(Controller.create(controller=1, name='front'), person, 10)
+    DoorProfiles.update({DoorProfiles.end_date: '2025-12-31'}).where(DoorProfiles.id == profile.id).execute()
+    assert DoorProfiles.get_by_id(profile.id).schedule_bitmap == profile.schedule_bitmap
@@ -0,0 +1,42 @@
+import pytest
+
+from helpers.queryhelper import QUERY_STATS_HEADERS
+from models.crm.makerspace import (Person, PersonBilling, PersonMembership, PersonContact, PersonEmergencyContact,
+    BillingCadenceTypeMap, MembershipTypeMap)
+
+INCLUDES = 'billing,memberships,contacts,emergency_contacts'
+
+@pytest.fixture
+def people(crm_db):
+    cadence = BillingCadenceTypeMap.create(name='monthly', description='billed monthly')
+    membership_type = MembershipTypeMap.create(name='full', description='full membership')
+    people = []
+    for number in range(20):
+        person = Person.create(first=f'First{number}', last=f'Last{number}', email=f'person{number}@example.com')
+        PersonBilling.create(person=person, billing_cadence=cadence)
+        PersonMembership.create(person=person, membership_type=membership_type)
+        PersonContact.create(person=person, phone='555-0100', street='1 Main St', city='Springfield', state='IL',
+                             zip_code='62701')
+        PersonEmergencyContact.create(person=person, first='Emergency', last='Contact', email='e@example.com',
+                                      phone='555-0199')
+        people.append(person)
+    return people
+
+def query_count(client, path, **query_string):
+    from app import app
+    app.config[QUERY_STATS_HEADERS] = True
+    response = client.get(path, query_string=query_string)
+    assert response.status_code == 200, response.get_json()
+    return int(response.headers['X-Query-Count'])
+
+def test_person_list_without_includes(client, people):
+    # the collection ETag and the page
+    assert query_count(client, '/v1/api/person', limit=20) == 2
+
+def test_person_list_with_includes(client, people):
+    # the collection ETag, the page and one query per to-many relation, whatever the page size
+    assert query_count(client, '/v1/api/person', limit=20, include=INCLUDES) == 6
+
+def test_person_with_includes(client, people):
+    # the row, the prefetch and the ETag check of the included table
+    assert query_count(client, f'/v1/api/person/{people[0].id}', include='billing') == 3
@@ -0,0 +1,46 @@
+import io
+
+from peewee import fn
+
+from helpers.dbhelper import SQLITE_MAX_VARIABLES
+from models.crm import query_listeners
+from models.crm.makerspace import Person, PersonContact, PersonEmergencyContact
+from models.crm.personimport import PersonImport
+
+HEADER = 'first,last,email,contact_phone,contact_street,contact_city,contact_state,contact_zip_code,emergency_first,emergency_last,emergency_email,emergency_phone\n'
+
+def member_line(number, email=None):
+    email = email or f'member{number}@example.com'
+    return (f'First{number},Last{number},{email},555-0100,{number} Main St,Springfield,IL,62701,'
+            f'Kin{number},Last{number},kin{number}@example.com,555-0199\n')
+
+def test_import_skips_stored_and_repeated_emails(person):
+    # person is stored as ada@example.com
+    lines = [member_line(1, ' ADA@example.com'), member_line(2), member_line(3), member_line(2, 'Member2@Example.com')]
+    importer = PersonImport()
+    importer.chunk_size = 2
+    status = importer.run(io.StringIO(HEADER + ''.join(lines)))
+    assert (status['imported'], status['duplicate'], status['rejected']) == (2, 2, 0)
+    assert sorted(email for (email,) in Person.select(Person.email).tuples()) == [
+        'ada@example.com', 'member2@example.com', 'member3@example.com']
+    assert PersonContact.select().count() == PersonEmergencyContact.select().count() == 2
+
+def test_statements_stay_under_the_host_parameter_limit(crm_db):
+    parameters = []
+    listener = lambda sql, seconds: parameters.append(sql.count('?'))
+    query_listeners.append(listener)
+    try:
+        status = PersonImport().run(io.StringIO(HEADER + ''.join(member_line(number) for number in range(1200))))
+    finally:
+        query_listeners.remove(listener)
+    assert status['imported'] == 1200
+    assert Person.select().count() == PersonContact.select().count() == 1200
+    assert max(parameters) <= SQLITE_MAX_VARIABLES
+
+def test_duplicate_check_uses_the_normalized_email_index(crm_db):
+    query = (Person
+             .select(fn.LOWER(fn.TRIM(Person.email)))
+             .where(fn.LOWER(fn.TRIM(Person.email)).in_(['ada@example.com'])))
+    sql, params = query.sql()
+    plan = ' '.join(row[-1] for row in crm_db.execute_sql(f'EXPLAIN QUERY PLAN {sql}', params).fetchall())
+    assert 'person_email_normalized' in plan
@@ -0,0 +1,38 @@
+import json
+
+from flask import Flask
+
+from helpers.queryhelper import statement_shape, expected_repeats, init_query_instrumentation
+from models.crm.makerspace import Person
+
+def test_statement_shape_collapses_in_lists_and_values_rows():
+    assert statement_shape('SELECT "a" FROM "t" WHERE "id" IN (?, ?, ?)') == 'SELECT "a" FROM "t" WHERE "id" IN (?, ...)'
+    assert (statement_shape('INSERT INTO "t" ("a", "b") VALUES (?, ?), (?, ?), (?, ?)') ==
+            statement_shape('INSERT INTO "t" ("a", "b") VALUES (?, ?), (?, ?)') ==
+            'INSERT INTO "t" ("a", "b") VALUES (?, ...), ...')
+
+def test_chunked_stream_ingest_is_not_reported_as_n_plus_one(person, client, caplog, door_event):
+    events = [dict(door_event(person, f'sha-{number}', f'2024-05-02 09:{number // 60:02d}:{number % 60:02d}'),
+                   person_id=person.id) for number in range(3000)]
+    for event in events:
+        del event['person']
+    body = ''.join(json.dumps(event) + '\n' for event in events)
+    response = client.post('/v1/api/access/door_access_log/stream', data=body, content_type='application/x-ndjson')
+    assert response.get_json()['accepted'] == 3000
+    assert 'likely an N+1' not in caplog.text
+
+def test_repeated_lookups_are_reported(person, caplog):
+    app = Flask(__name__)
+    init_query_instrumentation(app)
+
+    @app.route('/n_plus_one')
+    def n_plus_one():
+        for _ in range(12):
+            Person.get_by_id(person.id)
+        with expected_repeats():
+            for _ in range(12):
+                Person.select().where(Person.email == person.email).first()
+        return 'ok'
+
+    app.test_client().get('/n_plus_one')
+    assert caplog.text.count('likely an N+1') == 1
@@ -0,0 +1,10 @@
+from models.crm.makerspace import PersonCredentials
+from models.crm.rbac import person_role_cache
+
+def test_session_version_sees_revokes_from_other_workers(crm_db, person):
+    PersonCredentials.create(user_id='ada', password_hash='x', person=person)
+    assert person_role_cache.session_version(person.id) == 0
+
+    # another worker's revoke_sessions, this process' cache is never told about it
+    PersonCredentials.update(session_version=PersonCredentials.session_version + 1).execute()
+    assert person_role_cache.session_version(person.id) == 1
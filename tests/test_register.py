@@ -0,0 +1,17 @@
+from helpers.passwordhelper import PasswordServiceBusy, password_service
+from models.crm.makerspace import Person, PersonCredentials
+
+FORM = {'first_name': 'Ada', 'last_name': 'Lovelace', 'username': 'ada', 'password': 'analytical',
+        'password2': 'analytical', 'email': 'ada@example.com', 'phone': '555-0100', 'street': '1 Main St',
+        'city': 'Detroit', 'state': 'MI', 'zip_code': '48201'}
+
+def test_busy_password_service_leaves_nothing_behind(client, monkeypatch):
+    def busy(password):
+        raise PasswordServiceBusy()
+    monkeypatch.setattr(password_service, 'hash', busy)
+
+    response = client.post('/register', data=FORM)
+    assert response.status_code == 200
+    assert b'try again in a moment' in response.data
+    assert not Person.select().exists()
+    assert not PersonCredentials.select().exists()
@@ -0,0 +1,17 @@
+from models.crm.archive import archive_access_logs
+from models.crm.cardaccess import ingest_door_access_logs
+from models.crm.trafficrollup import door_traffic
+
+def test_events_after_the_hot_table_was_emptied_are_counted(person, archive_now, door_event):
+    ingest_door_access_logs([door_event(person, 'a', '2023-01-10 09:00:00'),
+                             door_event(person, 'b', '2023-01-10 10:00:00')])
+    archive_access_logs(archive_now)
+
+    ingest_door_access_logs([door_event(person, 'c', '2024-05-02 09:00:00')])
+    assert door_traffic('day', '2024-05-01 00:00:00', '2024-05-31 23:59:59') == [('2024-05-02', 1, 1, 1, 0)]
+    assert door_traffic('day', '2023-01-01 00:00:00', '2023-01-31 23:59:59') == [('2023-01-10', 1, 1, 2, 0)]
+
+def test_traffic_report_reads_the_rollups(person, client, door_event):
+    ingest_door_access_logs([door_event(person, 'a', '2024-05-02 09:00:00')])
+    response = client.get('/v1/api/access/traffic', query_string={'start_date': '2024-05-01', 'end_date': '2024-05-31'})
+    assert response.get_json()['buckets'] == [{'bucket': '2024-05-02', 'controller': 1, 'door': 1, 'granted': 1, 'denied': 0}]
@@ -0,0 +1,63 @@
+import datetime
+
+from models.crm.archive import archive_access_logs
+from models.crm.cardaccess import VolunteerAccessLog, VolunteerSession, rebuild_volunteer_sessions
+
+def sessions(person):
+    return [(session.checkin_dt, session.checkout_dt) for session in VolunteerSession
+            .select()
+            .where(VolunteerSession.person == person)
+            .order_by(VolunteerSession.checkin_dt)]
+
+JANUARY = (datetime.datetime(2023, 1, 10, 9), datetime.datetime(2023, 1, 10, 12))
+CROSSING = (datetime.datetime(2023, 6, 30, 20), datetime.datetime(2023, 7, 1, 2))
+
+def test_rebuild_keeps_sessions_of_archived_logs(person, archive_now, swipe):
+    swipe(person, JANUARY[0], True)
+    swipe(person, JANUARY[1], False)
+    archive_access_logs(archive_now)
+    assert not VolunteerAccessLog.select().exists()
+
+    rebuild_volunteer_sessions()
+    assert sessions(person) == [JANUARY]
+    rebuild_volunteer_sessions(person.id)
+    assert sessions(person) == [JANUARY]
+
+def test_session_crossing_the_archive_cutoff(person, archive_now, swipe):
+    swipe(person, JANUARY[0], True)
+    swipe(person, JANUARY[1], False)
+    swipe(person, CROSSING[0], True)
+    swipe(person, CROSSING[1], False)
+    archive_access_logs(archive_now)
+    assert VolunteerAccessLog.select().count() == 1
+
+    rebuild_volunteer_sessions()
+    assert sessions(person) == [JANUARY, CROSSING]
+    rebuild_volunteer_sessions(person.id)
+    assert sessions(person) == [JANUARY, CROSSING]
+
+def test_open_session_from_the_archive_is_closed_and_replayed(person, archive_now, swipe):
+    swipe(person, JANUARY[0], True)
+    swipe(person, JANUARY[1], False)
+    swipe(person, CROSSING[0], True)
+    archive_access_logs(archive_now)
+
+    checkout = datetime.datetime(2023, 8, 1, 10)
+    swipe(person, checkout, False)
+    assert sessions(person) == [JANUARY, (CROSSING[0], checkout)]
+
+    # a check-in uploaded late restarts the session, the replay reads the archived check-in before it
+    late_checkin = datetime.datetime(2023, 8, 1, 9)
+    swipe(person, late_checkin, True)
+    assert sessions(person) == [JANUARY, (late_checkin, checkout)]
+
+def test_empty_session_table_is_rebuilt_from_the_archive(person, archive_now, swipe):
+    swipe(person, JANUARY[0], True)
+    swipe(person, JANUARY[1], False)
+    swipe(person, CROSSING[0], True)
+    swipe(person, CROSSING[1], False)
+    archive_access_logs(archive_now)
+    VolunteerSession.delete().execute()
+
+    rebuild_volunteer_sessions()
+    assert sessions(person) == [JANUARY, CROSSING]